@@ -1,30 +1,67 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory, make_response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory, make_response, Response, stream_with_context, g
 from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import json
 import zipfile
 import secrets
 import datetime
-import shutil
 import threading
 import time
-import traceback
+import multiprocessing
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from dotenv import load_dotenv
-from density_finder_rs import (
-    find_highest_density_period,
-    find_participant_density_period,
-    detect_conversations,
-    compute_top_words,
-    compute_top_emojis,
-    count_specific_string,
-    aggregate_daily_counts,
-    split_sent_received_daily_counts,
+from density_backend import (
+    find_highest_density_period_columns,
+    find_participant_density_period_columns,
+    detect_conversations_columns,
+    compute_top_words_columns,
+    compute_top_emojis_columns,
+    count_specific_string_columns,
     build_group_chat_trends_series,
     build_uploader_trends_series,
-)  # type: ignore
-from game_blueprint import game_bp
+)
+from game_blueprint import game_bp, game_cache_stats, discard_user_rounds
+from profiling import StackSampler, profile_filename, PROFILE_SUFFIX
+from metrics import registry as metrics_registry, REQUEST_SECONDS, OPERATION_SECONDS, CACHE_REQUESTS, add_samples, merge_snapshots, render as render_metrics
+from jobs import JobScheduler, SQLiteJobRegistry, ACTIVE_JOB_STATES, TERMINAL_JOB_STATES, JOB_FAILED, JOB_CANCELLED, PRIORITY_NORMAL, PRIORITY_LOW
+from cache_io import atomic_write_json, FileLease, read_json, remove_path, current_owner_id
+from cache_manifest import ARTIFACTS, ensure_fresh, record_build, messages_fingerprint, invalidate as invalidate_artifact
+from shared_analysis import SharedAnalysisCache, SHARED_CONTENT_HASHES_NAME, thread_content_hash
+from expiry import ExpiryIndex, move_to_trash, purge_trash
+from message_store import message_files, load_message_file, resolve_compression
+from storage_usage import observe_storage, EVICTABLE_CATEGORIES, measure_user, evict_derived_caches
+from series_cache import SeriesCache
+from message_columns import MessageColumns, ColumnsCache
+from thread_summary import load_thread_summary
+from inbox_update import zip_inbox_threads, extract_threads, save_fingerprints, apply_inbox_update
+from multitasking import session_intervals, sweep_concurrency
+from session_index import SESSION_INDEX_NAME, SESSION_SORT_KEYS, query_sessions, decode_cursor
+from convo_detection import (
+    load_thread_messages,
+    load_thread_gaps,
+    load_session_index,
+    write_thread_detection,
+    detect_thread,
+    reduce_convo_stats,
+    threshold_tuple,
+    sweep_conversation_totals,
+    DEFAULT_CONVO_THRESHOLDS,
+    INTEGER_THRESHOLDS,
+)
+from trend_partitions import (
+    date_range,
+    partition_series,
+    merge_series,
+    partition_threads,
+    merge_threads,
+    write_partitioned_cache,
+    read_manifest,
+    manifest_mtime,
+    read_partitions,
+)
 
 load_dotenv()
 
@@ -34,77 +71,354 @@ app.secret_key = os.getenv('FLASK_SECRET_KEY', secrets.token_hex(16))
 app.config['UPLOAD_FOLDER'] = 'user_data'
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024  # 2GB max
 app.config['CHUNK_FOLDER'] = 'temp_chunks'
+app.config['SHARED_CACHE_FOLDER'] = 'shared_cache'  # Content-addressed analysis shared by all user codes
 app.config['COMPUTE_PASSCODE'] = os.getenv('COMPUTE_PASSCODE', 'your_secret_passcode_here')  # Change this!
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '4'))  # Max concurrent background computations
+app.config['SERIES_CACHE_MAX_BYTES'] = int(os.getenv('SERIES_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+app.config['SERIES_CACHE_TTL_SECONDS'] = int(os.getenv('SERIES_CACHE_TTL_SECONDS', str(6 * 3600)))
+app.config['SESSION_INDEX_CACHE_MAX_BYTES'] = int(os.getenv('SESSION_INDEX_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+app.config['COLUMNS_CACHE_MAX_BYTES'] = int(os.getenv('COLUMNS_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))  # Typed message columns handed to the density backend
+app.config['CONVO_DETECT_WORKERS'] = int(os.getenv('CONVO_DETECT_WORKERS', str(os.cpu_count() or 1)))  # Processes for conversation detection
+app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')  # Enables /api/admin/* endpoints when set
+app.config['DATA_RETENTION_SECONDS'] = int(os.getenv('DATA_RETENTION_SECONDS', str(3 * 86400)))  # User data without keep.txt
+app.config['CHUNK_RETENTION_SECONDS'] = int(os.getenv('CHUNK_RETENTION_SECONDS', '3600'))  # Abandoned chunked uploads
+app.config['REAPER_INTERVAL_SECONDS'] = int(os.getenv('REAPER_INTERVAL_SECONDS', '60'))
+app.config['REAPER_BATCH_SIZE'] = int(os.getenv('REAPER_BATCH_SIZE', '5'))  # Max expirations and tree deletions per pass
+app.config['MESSAGE_COMPRESSION'] = resolve_compression(os.getenv('MESSAGE_COMPRESSION', 'gzip'))  # none, gzip or zstd
+app.config['USER_QUOTA_BYTES'] = int(os.getenv('USER_QUOTA_BYTES', '0'))  # Per user code, derived caches evicted first; 0 = unlimited
+app.config['GAME_POOL_SIZE'] = int(os.getenv('GAME_POOL_SIZE', '3'))  # Pre-generated rounds kept per user, mode and difficulty
+app.config['GAME_POOL_REFILL_PER_SECOND'] = float(os.getenv('GAME_POOL_REFILL_PER_SECOND', '5'))  # Background round generation rate; 0 = unthrottled
+app.config['GAME_BATCH_MAX'] = int(os.getenv('GAME_BATCH_MAX', '10'))  # Max rounds per /api/game/rounds call
+app.config['GAME_ROUND_STORE'] = os.getenv('GAME_ROUND_STORE', 'sqlite')  # sqlite (shared by all workers) or memory (single process)
+app.config['GAME_ROUND_STORE_MAX_ROUNDS'] = int(os.getenv('GAME_ROUND_STORE_MAX_ROUNDS', '100000'))  # Oldest rounds are evicted past this
+app.config['METRICS_FOLDER'] = os.getenv('METRICS_FOLDER', 'metrics_snapshots')  # Per-process snapshots merged by /metrics
+app.config['METRICS_PUBLISH_SECONDS'] = int(os.getenv('METRICS_PUBLISH_SECONDS', '15'))
+app.config['METRICS_PUBLIC'] = os.getenv('METRICS_PUBLIC', '').lower() in ('1', 'true', 'yes')  # Serve /metrics without the admin token
+app.config['DIAGNOSTICS_FOLDER'] = os.getenv('DIAGNOSTICS_FOLDER', 'diagnostics')  # Request and job profiles (collapsed stacks)
+app.config['PROFILE_SAMPLE_INTERVAL_MS'] = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
 
 # Ensure directories exist
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
 Path(app.config['CHUNK_FOLDER']).mkdir(exist_ok=True)
+Path(app.config['METRICS_FOLDER']).mkdir(exist_ok=True)
+Path(app.config['DIAGNOSTICS_FOLDER']).mkdir(exist_ok=True)
+
+shared_analysis_cache = SharedAnalysisCache(app.config['SHARED_CACHE_FOLDER'])
 
 # Game routes are isolated in a dedicated blueprint.
 app.register_blueprint(game_bp)
 
-def cleanup_old_data():
-    """Remove user data older than 3 days"""
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
+# Expiry times for user and chunk folders, recorded when they are created so
+# nothing has to scan user_data to find what is due.
+expiry_index = ExpiryIndex(os.path.join(app.config['UPLOAD_FOLDER'], 'expiry_index.sqlite3'))
+
+SHARED_CACHE_GC_SECONDS = 3600
+
+# Delay before the reaper retries a folder it failed to move into the trash.
+EXPIRY_RETRY_SECONDS = 300
+
+# Bytes per user code and category, updated on every write and removal.
+STORAGE_LEDGER_PATH = os.path.join(app.config['UPLOAD_FOLDER'], 'storage_usage.sqlite3')
+storage_ledger = observe_storage(STORAGE_LEDGER_PATH, app.config['UPLOAD_FOLDER'])
+
+
+def schedule_user_expiry(user_code):
+    user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+    expiry_index.schedule(user_path, time.time() + app.config['DATA_RETENTION_SECONDS'])
+
+
+def discard_path(path):
+    """Delete a folder without blocking: rename it into the trash for the reaper to remove."""
+    expiry_index.cancel(path)
+    try:
+        moved = move_to_trash(path)
+    except OSError as e:
+        # Leave it to the reaper rather than losing track of the folder.
+        print(f"[REAPER] Failed to discard {path}, retrying later: {e}")
+        expiry_index.schedule(path, time.time() + EXPIRY_RETRY_SECONDS)
         return
-    
-    three_days_ago = datetime.datetime.now() - datetime.timedelta(days=3)
-    for user_folder in os.listdir(app.config['UPLOAD_FOLDER']):
-        user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_folder)
-        if os.path.isdir(user_path):
-            keepfolder_path = os.path.join(user_path, 'keep.txt')
-            if os.path.exists(keepfolder_path):
-                continue
-            created_time = datetime.datetime.fromtimestamp(os.path.getctime(user_path))
-            if created_time < three_days_ago:
-                shutil.rmtree(user_path)
-    
-    # Clean old chunks (older than 1 hour)
-    if os.path.exists(app.config['CHUNK_FOLDER']):
-        one_hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
-        for folder in os.listdir(app.config['CHUNK_FOLDER']):
-            folder_path = os.path.join(app.config['CHUNK_FOLDER'], folder)
-            if os.path.isdir(folder_path):
-                created_time = datetime.datetime.fromtimestamp(os.path.getctime(folder_path))
-                if created_time < one_hour_ago:
-                    shutil.rmtree(folder_path)
-
-def cleanup_daemon():
-    """Background thread to cleanup old data every hour"""
+    if moved and os.path.dirname(path) == app.config['UPLOAD_FOLDER']:
+        storage_ledger.drop_user(os.path.basename(path))
+        discard_user_rounds(os.path.basename(path))
+
+
+def _backfill_expiry_index():
+    """One-time scan to schedule folders created before the expiry index existed."""
+    entries = []
+    for root, retention in ((app.config['UPLOAD_FOLDER'], app.config['DATA_RETENTION_SECONDS']),
+                            (app.config['CHUNK_FOLDER'], app.config['CHUNK_RETENTION_SECONDS'])):
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not name.startswith('.') and os.path.isdir(path):
+                entries.append((path, os.path.getctime(path) + retention))
+    expiry_index.add_missing(entries)
+    expiry_index.set_meta('backfilled', '1')
+    print(f"[REAPER] Scheduled {len(entries)} existing folders")
+
+
+def _backfill_storage_ledger():
+    """One-time measurement of user folders written before storage accounting existed."""
+    for name in os.listdir(app.config['UPLOAD_FOLDER']):
+        user_path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+        if not name.startswith('.') and os.path.isdir(user_path):
+            storage_ledger.set_user(name, measure_user(user_path))
+    storage_ledger.set_meta('backfilled', '1')
+    print("[STORAGE] Measured existing user folders")
+
+
+def enforce_quotas(limit):
+    """Evict derived caches of up to `limit` user codes over USER_QUOTA_BYTES."""
+    quota = app.config['USER_QUOTA_BYTES']
+    if quota <= 0:
+        return
+    for user_code in storage_ledger.users_over(quota, limit):
+        user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+        if not os.path.isdir(user_path):
+            storage_ledger.drop_user(user_code)
+            continue
+        excess = sum(storage_ledger.usage(user_code).values()) - quota
+        freed = evict_derived_caches(user_path, excess)
+        print(f"[QUOTA] {user_code}: {excess} bytes over quota, evicted {freed} bytes of caches")
+
+
+_last_shared_cache_gc = 0.0
+
+
+def reap_expired_data():
+    """
+    One reaper pass: move up to REAPER_BATCH_SIZE due folders into the trash, then
+    delete up to as many trashed trees. Folders holding keep.txt are re-checked a
+    retention period later instead of being deleted.
+    """
+    global _last_shared_cache_gc
+    if expiry_index.get_meta('backfilled') is None:
+        _backfill_expiry_index()
+    if storage_ledger.get_meta('backfilled') is None:
+        _backfill_storage_ledger()
+
+    batch_size = app.config['REAPER_BATCH_SIZE']
+    now = time.time()
+    for path in expiry_index.claim_due(now, batch_size):
+        if os.path.exists(os.path.join(path, 'keep.txt')):
+            expiry_index.schedule(path, now + app.config['DATA_RETENTION_SECONDS'])
+            continue
+        try:
+            moved = move_to_trash(path)
+        except OSError as e:
+            # claim_due already removed the row; put it back so the folder is not forgotten.
+            print(f"[REAPER] Failed to expire {path}, retrying later: {e}")
+            expiry_index.add_missing([(path, now + EXPIRY_RETRY_SECONDS)])
+            continue
+        if moved:
+            print(f"[REAPER] Expired {path}")
+            if os.path.dirname(path) == app.config['UPLOAD_FOLDER']:
+                storage_ledger.drop_user(os.path.basename(path))
+                discard_user_rounds(os.path.basename(path))
+
+    for root in (app.config['UPLOAD_FOLDER'], app.config['CHUNK_FOLDER']):
+        purge_trash(root, batch_size)
+
+    enforce_quotas(batch_size)
+
+    if now - _last_shared_cache_gc >= SHARED_CACHE_GC_SECONDS:
+        _last_shared_cache_gc = now
+        # Shared analysis entries no remaining user thread refers to.
+        shared_analysis_cache.collect_garbage(app.config['UPLOAD_FOLDER'])
+
+
+def reaper_daemon():
+    """Background thread that expires old data in small batches"""
     while True:
-        time.sleep(3600)  # Run every hour
+        time.sleep(app.config['REAPER_INTERVAL_SECONDS'])
         try:
-            cleanup_old_data()
+            reap_expired_data()
         except Exception as e:
-            print(f"Cleanup error: {e}")
+            print(f"[REAPER] Error: {e}")
+
+# `python app.py` runs this module as __main__, and the conversation detection pool's
+# forkserver workers re-import it as __mp_main__; only the server runs the daemons.
+_run_daemons = __name__ != '__mp_main__'
+
+# Start reaper daemon
+reaper_thread = threading.Thread(target=reaper_daemon, daemon=True)
+if _run_daemons:
+    reaper_thread.start()
+
+# All background cache builds share one bounded worker pool per process; job state
+# is mirrored to a SQLite registry so every server worker sees the same jobs.
+job_scheduler = JobScheduler(
+    max_workers=app.config['JOB_WORKERS'],
+    registry=SQLiteJobRegistry(os.path.join(app.config['UPLOAD_FOLDER'], 'job_registry.sqlite3')),
+    profile_folder=app.config['DIAGNOSTICS_FOLDER'],
+    profile_interval=app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000
+)
+
+
+def _series_spill_path(key):
+    namespace, user_code, variant = key
+    return os.path.join(
+        app.config['UPLOAD_FOLDER'], user_code, 'cached_series',
+        f"{namespace}-{variant.replace(':', '-')}.json"
+    )
+
+
+# Precomputed trend series for all trend endpoints share one byte-budgeted LRU,
+# keyed by (endpoint, user_code, months variant) and spilled under each user folder.
+series_cache = SeriesCache(
+    max_bytes=app.config['SERIES_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['SERIES_CACHE_TTL_SECONDS'],
+    spill_path=_series_spill_path
+)
+
+# Recently queried per-thread session indexes, so paging does not re-read them.
+session_index_cache = SeriesCache(
+    max_bytes=app.config['SESSION_INDEX_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['SERIES_CACHE_TTL_SECONDS']
+)
+
+# Typed message columns of recently analysed threads, so endpoints on the same
+# conversation skip re-parsing its JSON.
+columns_cache = ColumnsCache(app.config['COLUMNS_CACHE_MAX_BYTES'])
 
-# Start cleanup daemon
-cleanup_thread = threading.Thread(target=cleanup_daemon, daemon=True)
-cleanup_thread.start()
 
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
 
-class GroupTrendsJob:
-    """Tracks one in-flight group trends computation per user."""
-    def __init__(self, thread):
-        self.thread = thread
-        self.started_at = time.time()
-        self.error = None
 
+def _profile_requested():
+    """Operators profile a request with `X-Profile: 1` or `?profile=1` plus the admin token."""
+    flag = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(flag) and flag != '0' and _is_admin_request()
 
-group_trends_jobs = {}
-group_trends_jobs_lock = threading.Lock()
-group_trends_series_cache = {}
-group_trends_series_cache_lock = threading.Lock()
 
-uploader_trends_jobs = {}
-uploader_trends_jobs_lock = threading.Lock()
-uploader_trends_series_cache = {}
-uploader_trends_series_cache_lock = threading.Lock()
+@app.before_request
+def _start_request_profile():
+    if _profile_requested():
+        g.profiler = StackSampler(threading.get_ident(), app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000).start()
 
-people_talked_trends_jobs = {}
-people_talked_trends_jobs_lock = threading.Lock()
-people_talked_trends_series_cache = {}
-people_talked_trends_series_cache_lock = threading.Lock()
+
+@app.after_request
+def _write_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        name = profile_filename('request', request.method, endpoint)
+        try:
+            profiler.write(os.path.join(app.config['DIAGNOSTICS_FOLDER'], name))
+            response.headers['X-Profile'] = name
+        except OSError as e:
+            print(f"[PROFILE] Failed to write {name}: {e}")
+    return response
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Labelled by route pattern, not URL, so conversation ids do not multiply the series.
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, endpoint, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+def _process_metrics():
+    """Per-process cache state; /metrics sums it over the server processes."""
+    caches = {
+        'series': series_cache.stats(),
+        'session_index': session_index_cache.stats(),
+        'columns': columns_cache.stats(),
+    }
+    round_store = game_cache_stats()['round_store']
+    requests_samples = [({'cache': 'game_rounds', 'result': 'hit'}, round_store['hits']),
+                        ({'cache': 'game_rounds', 'result': 'miss'}, round_store['misses'])]
+    for name, stats in caches.items():
+        requests_samples.append(({'cache': name, 'result': 'hit'}, stats['hits']))
+        requests_samples.append(({'cache': name, 'result': 'miss'}, stats['misses']))
+        if 'disk_hits' in stats:
+            requests_samples.append(({'cache': name, 'result': 'disk_hit'}, stats['disk_hits']))
+    return [
+        ('chv_cache_requests_total', 'counter', 'Cache lookups by cache and result.', requests_samples),
+        ('chv_cache_entries', 'gauge', 'Entries held by in-memory caches.',
+         [({'cache': name}, stats['entries']) for name, stats in caches.items()]),
+        ('chv_cache_bytes', 'gauge', 'Bytes held by in-memory caches.',
+         [({'cache': name}, stats['bytes']) for name, stats in caches.items()]),
+        ('chv_cache_evictions_total', 'counter', 'Entries evicted from in-memory caches to stay under their byte budget.',
+         [({'cache': name}, stats['evictions']) for name, stats in caches.items()]),
+    ]
+
+
+def _shared_metrics():
+    """State every process sees the same way; read once per scrape rather than summed."""
+    expiry = expiry_index.stats(time.time())
+    return [
+        ('chv_job_queue_depth', 'gauge', 'Background jobs waiting for a worker.', [({}, job_scheduler.queue_depth())]),
+        ('chv_expiry_scheduled', 'gauge', 'Paths with a scheduled expiry.', [({}, expiry['scheduled'])]),
+        ('chv_expiry_due', 'gauge', 'Paths past their expiry, waiting for the reaper.', [({}, expiry['due'])]),
+    ]
+
+
+metrics_registry.add_collector(_process_metrics)
+
+
+def _metrics_snapshot_path():
+    return os.path.join(app.config['METRICS_FOLDER'], f'{current_owner_id()}.json')
+
+
+def metrics_publisher_daemon():
+    """Background thread that publishes this process's metrics for whichever process is scraped"""
+    while True:
+        time.sleep(app.config['METRICS_PUBLISH_SECONDS'])
+        try:
+            with app.app_context():
+                atomic_write_json(_metrics_snapshot_path(), metrics_registry.snapshot())
+        except Exception as e:
+            print(f"[METRICS] Failed to publish snapshot: {e}")
+
+# Start metrics publisher daemon
+metrics_publisher_thread = threading.Thread(target=metrics_publisher_daemon, daemon=True)
+if _run_daemons:
+    metrics_publisher_thread.start()
+
+
+def collect_metrics():
+    """This process's metrics summed with the snapshots other live server processes published."""
+    own_path = _metrics_snapshot_path()
+    snapshots = [metrics_registry.snapshot()]
+    # Snapshots that stopped being refreshed belong to processes that have exited.
+    stale_before = time.time() - 4 * app.config['METRICS_PUBLISH_SECONDS']
+    for path in glob(os.path.join(app.config['METRICS_FOLDER'], '*.json')):
+        if path == own_path:
+            continue
+        try:
+            snapshot = read_json(path)
+        except (OSError, ValueError):
+            continue
+        if snapshot.get('collected_at', 0) < stale_before:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        snapshots.append(snapshot)
+    families = merge_snapshots(snapshots)
+    add_samples(families, _shared_metrics())
+    return families
+
+
+def _cached_precomputed_trends(namespace, user_code, full_requested, months_loaded, cache_dir, manifest, build):
+    """Return precomputed trends for a months window, rebuilding when the cache build changed."""
+    key = (namespace, user_code, 'full' if full_requested else f'months:{months_loaded}')
+    # Caches written before build ids existed are told apart by their manifest mtime.
+    build_id = manifest.get('build_id') or manifest_mtime(cache_dir)
+    if build_id is None:
+        return build()
+    precomputed_trends = series_cache.get(key, build_id)
+    if precomputed_trends is None:
+        precomputed_trends = build()
+        series_cache.put(key, build_id, precomputed_trends)
+    return precomputed_trends
 
 
 def _build_group_chat_precomputed_trends(group_chats):
@@ -189,154 +503,173 @@ def _build_people_talked_precomputed_trends(active_people_daily_counts, active_c
     }
 
 
-def compute_group_chat_trends(user_code):
+def _write_group_chat_trends_cache(cache_dir, group_chats):
+    """Store per-chat daily counts as month partitions; chat order and titles live in the manifest."""
+    write_partitioned_cache(cache_dir, partition_threads(group_chats), {
+        'threads': [{'id': chat.get('id'), 'title': chat.get('title')} for chat in group_chats],
+        'range': date_range(day_key for chat in group_chats for day_key in (chat.get('daily_counts') or {}))
+    })
+
+
+def _write_series_trends_cache(cache_dir, payload, series_names):
+    """Store the named daily-count series as month partitions; other payload keys go in the manifest."""
+    series = {name: payload.get(name) or {} for name in series_names}
+    meta = {key: value for key, value in payload.items() if key not in series_names}
+    meta['range'] = date_range(set().union(*(series[name].keys() for name in series_names)))
+    write_partitioned_cache(cache_dir, partition_series(series), meta)
+
+
+def _migrate_legacy_trends_cache(cache_dir, write_cache):
+    """Partition a single-file trends cache left by older versions. Returns True if one was migrated."""
+    legacy_path = cache_dir + '.json'
+    if not os.path.exists(legacy_path):
+        return False
+
+    with open(legacy_path, 'r') as f:
+        payload = json.load(f)
+    write_cache(cache_dir, payload)
+    remove_path(legacy_path)
+    print(f"[CACHE MIGRATE] Partitioned legacy trends cache {legacy_path}")
+    return True
+
+
+def _user_path(user_code):
+    return os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+
+
+def _load_thread_summary(user_code, conv_id, uploader_username):
+    thread_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conv_id)
+    return load_thread_summary(thread_folder, uploader_username, lambda: load_conversation_data(user_code, conv_id))
+
+
+def compute_group_chat_trends(user_code, job=None):
     """Compute and cache aggregated group chat trends for a user."""
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_group_chat_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_group_chat_trends')
 
-    # If another request already produced cache, avoid recomputing.
-    if os.path.exists(cache_path):
+    # If another request already produced a current cache, avoid recomputing.
+    if ensure_fresh(_user_path(user_code), 'group_trends'):
         return
+    if _migrate_legacy_trends_cache(cache_dir, _write_group_chat_trends_cache):
+        return
+    # Recorded up front against the inputs as they are now; changes during the build leave it stale.
+    record_build(_user_path(user_code), 'group_trends')
 
+    if job:
+        job.report_progress(phase='listing conversations')
     conversations = get_conversations(user_code)
 
+    uploader_username = load_uploader_name(user_code)
+
     # Filter to only group chats (more than 1 participant)
     group_chats = [c for c in conversations if len(c.get('participants', [])) > 1]
 
     result = []
-    for conv in group_chats:
-        messages = load_conversation_data(user_code, conv['id'])
-        daily_counts = aggregate_daily_counts(messages)
+    for index, conv in enumerate(group_chats):
+        if job:
+            job.report_progress(done=index, total=len(group_chats), phase='aggregating group chats')
+        summary = _load_thread_summary(user_code, conv['id'], uploader_username)
 
         result.append({
             'id': conv['id'],
             'title': conv['title'],
-            'daily_counts': daily_counts  # {YYYY-MM-DD: count}
+            'daily_counts': summary['daily_counts']  # {YYYY-MM-DD: count}
         })
 
-    with open(cache_path, 'w') as f:
-        json.dump(result, f)
+    if job:
+        job.report_progress(done=len(group_chats), phase='writing cache')
 
+    _write_group_chat_trends_cache(cache_dir, result)
 
-def _group_trends_worker(user_code):
-    """Worker thread wrapper that computes trends and tracks failure state."""
-    try:
-        compute_group_chat_trends(user_code)
-        print(f"[CACHE WRITE] Saved group chat trends cache for user {user_code}")
-    except Exception as e:
-        print(f"[GROUP_TRENDS_ERROR] Failed for user {user_code}: {e}")
-        traceback.print_exc()
-        with group_trends_jobs_lock:
-            job = group_trends_jobs.get(user_code)
-            if job:
-                job.error = str(e)
-        return
 
-    # Job is done successfully; clear it so dictionary doesn't grow forever.
-    with group_trends_jobs_lock:
-        group_trends_jobs.pop(user_code, None)
+UPLOADER_TREND_SERIES = ('sent_daily_counts', 'received_daily_counts')
+PEOPLE_TALKED_TREND_SERIES = ('active_people_daily_counts', 'active_chats_daily_counts')
 
 
-def compute_uploader_message_trends(user_code):
+def compute_uploader_message_trends(user_code, job=None):
     """Compute and cache uploader sent/received message counts over time."""
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_uploader_message_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_uploader_message_trends')
+
+    def write_cache(path, payload):
+        _write_series_trends_cache(path, payload, UPLOADER_TREND_SERIES)
 
-    if os.path.exists(cache_path):
+    if ensure_fresh(_user_path(user_code), 'uploader_trends'):
         return
+    if _migrate_legacy_trends_cache(cache_dir, write_cache):
+        return
+    record_build(_user_path(user_code), 'uploader_trends')
 
     uploader_username = load_uploader_name(user_code)
     if not uploader_username:
-        with open(cache_path, 'w') as f:
-            json.dump({
-                'uploader_username': None,
-                'sent_daily_counts': {},
-                'received_daily_counts': {}
-            }, f)
+        write_cache(cache_dir, {
+            'uploader_username': None,
+            'sent_daily_counts': {},
+            'received_daily_counts': {}
+        })
         return
 
+    if job:
+        job.report_progress(phase='listing conversations')
     conversations = get_conversations(user_code)
     sent_daily_counts = {}
     received_daily_counts = {}
 
-    for conv in conversations:
-        messages = load_conversation_data(user_code, conv['id'])
-        sent_chunk, received_chunk = split_sent_received_daily_counts(messages, uploader_username)
+    for index, conv in enumerate(conversations):
+        if job:
+            job.report_progress(done=index, total=len(conversations), phase='counting sent and received messages')
+        summary = _load_thread_summary(user_code, conv['id'], uploader_username)
+        sent_chunk, received_chunk = summary['sent_daily_counts'], summary['received_daily_counts']
         for day_key, count in sent_chunk.items():
             sent_daily_counts[day_key] = sent_daily_counts.get(day_key, 0) + int(count)
         for day_key, count in received_chunk.items():
             received_daily_counts[day_key] = received_daily_counts.get(day_key, 0) + int(count)
 
-    with open(cache_path, 'w') as f:
-        json.dump({
-            'uploader_username': uploader_username,
-            'sent_daily_counts': sent_daily_counts,
-            'received_daily_counts': received_daily_counts
-        }, f)
-
-
-def _uploader_trends_worker(user_code):
-    """Worker thread wrapper that computes uploader trends and tracks failure state."""
-    try:
-        compute_uploader_message_trends(user_code)
-        print(f"[CACHE WRITE] Saved uploader message trends cache for user {user_code}")
-    except Exception as e:
-        print(f"[UPLOADER_TRENDS_ERROR] Failed for user {user_code}: {e}")
-        traceback.print_exc()
-        with uploader_trends_jobs_lock:
-            job = uploader_trends_jobs.get(user_code)
-            if job:
-                job.error = str(e)
-        return
-
-    with uploader_trends_jobs_lock:
-        uploader_trends_jobs.pop(user_code, None)
+    if job:
+        job.report_progress(done=len(conversations), phase='writing cache')
+    write_cache(cache_dir, {
+        'uploader_username': uploader_username,
+        'sent_daily_counts': sent_daily_counts,
+        'received_daily_counts': received_daily_counts
+    })
 
 
-def compute_people_talked_trends(user_code):
+def compute_people_talked_trends(user_code, job=None):
     """Compute and cache daily active chats and distinct people talked to."""
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_people_talked_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_people_talked_trends')
 
-    if os.path.exists(cache_path):
+    def write_cache(path, payload):
+        _write_series_trends_cache(path, payload, PEOPLE_TALKED_TREND_SERIES)
+
+    if ensure_fresh(_user_path(user_code), 'people_talked_trends'):
+        return
+    if _migrate_legacy_trends_cache(cache_dir, write_cache):
         return
+    record_build(_user_path(user_code), 'people_talked_trends')
 
     uploader_username = load_uploader_name(user_code)
+    if job:
+        job.report_progress(phase='listing conversations')
     conversations = get_conversations(user_code)
 
     active_people_by_day = {}
     active_chats_by_day = {}
 
-    for conv in conversations:
+    for index, conv in enumerate(conversations):
+        if job:
+            job.report_progress(done=index, total=len(conversations), phase='collecting active people and chats')
         conv_id = conv.get('id')
         if not conv_id:
             continue
 
-        messages = load_conversation_data(user_code, conv_id)
-        active_days_for_chat = set()
-
-        for message in messages:
-            ts_value = message.get('timestamp_ms')
-            try:
-                ts_ms = int(ts_value)
-            except (TypeError, ValueError):
-                continue
-
-            day_key = datetime.datetime.utcfromtimestamp(ts_ms / 1000).strftime('%Y-%m-%d')
-            active_days_for_chat.add(day_key)
-
-            sender_name = message.get('sender_name')
-            if not isinstance(sender_name, str) or not sender_name:
-                continue
-            if uploader_username and sender_name == uploader_username:
-                continue
+        summary = _load_thread_summary(user_code, conv_id, uploader_username)
 
-            if day_key not in active_people_by_day:
-                active_people_by_day[day_key] = set()
-            active_people_by_day[day_key].add(sender_name)
+        for day_key, people in summary['people_by_day'].items():
+            active_people_by_day.setdefault(day_key, set()).update(people)
 
-        for day_key in active_days_for_chat:
-            if day_key not in active_chats_by_day:
-                active_chats_by_day[day_key] = set()
-            active_chats_by_day[day_key].add(conv_id)
+        for day_key in summary['active_days']:
+            active_chats_by_day.setdefault(day_key, set()).add(conv_id)
 
+    if job:
+        job.report_progress(done=len(conversations), phase='writing cache')
     active_people_daily_counts = {
         day_key: len(people_set)
         for day_key, people_set in active_people_by_day.items()
@@ -346,202 +679,202 @@ def compute_people_talked_trends(user_code):
         for day_key, chat_set in active_chats_by_day.items()
     }
 
-    with open(cache_path, 'w') as f:
-        json.dump({
-            'uploader_username': uploader_username,
-            'active_people_daily_counts': active_people_daily_counts,
-            'active_chats_daily_counts': active_chats_daily_counts
-        }, f)
-
-
-def _people_talked_trends_worker(user_code):
-    """Worker thread wrapper that computes people/chats activity trends."""
-    try:
-        compute_people_talked_trends(user_code)
-        print(f"[CACHE WRITE] Saved people talked trends cache for user {user_code}")
-    except Exception as e:
-        print(f"[PEOPLE_TRENDS_ERROR] Failed for user {user_code}: {e}")
-        traceback.print_exc()
-        with people_talked_trends_jobs_lock:
-            job = people_talked_trends_jobs.get(user_code)
-            if job:
-                job.error = str(e)
-        return
-
-    with people_talked_trends_jobs_lock:
-        people_talked_trends_jobs.pop(user_code, None)
+    write_cache(cache_dir, {
+        'uploader_username': uploader_username,
+        'active_people_daily_counts': active_people_daily_counts,
+        'active_chats_daily_counts': active_chats_daily_counts
+    })
 
 
 # ── Conversation Detection ────────────────────────────────────────────────────
 
-convo_detection_jobs = {}
-convo_detection_jobs_lock = threading.Lock()
+_convo_detect_pool = None
+_convo_detect_pool_lock = threading.Lock()
+
+# Pool workers start from a forkserver rather than a fork of this process: forking a
+# server with scheduler, heartbeat and reaper threads can copy a lock held mid-update.
+_convo_detect_context = multiprocessing.get_context('forkserver')
+_convo_detect_context.set_forkserver_preload(['convo_detection'])
+
+
+def _get_convo_detect_pool():
+    """Process pool shared by all convo stats jobs, so concurrent users don't multiply it."""
+    global _convo_detect_pool
+    with _convo_detect_pool_lock:
+        if _convo_detect_pool is None:
+            # Workers write thread caches, so they report to the storage ledger too.
+            _convo_detect_pool = ProcessPoolExecutor(
+                max_workers=app.config['CONVO_DETECT_WORKERS'],
+                mp_context=_convo_detect_context,
+                initializer=observe_storage,
+                initargs=(STORAGE_LEDGER_PATH, app.config['UPLOAD_FOLDER'])
+            )
+        return _convo_detect_pool
 
 
-class ConvoDetectionJob:
-    """Tracks one in-flight conversation detection computation per user."""
-    def __init__(self, thread):
-        self.thread = thread
-        self.started_at = time.time()
-        self.error = None
+def _reset_convo_detect_pool():
+    global _convo_detect_pool
+    with _convo_detect_pool_lock:
+        if _convo_detect_pool is not None:
+            _convo_detect_pool.shutdown(wait=False, cancel_futures=True)
+        _convo_detect_pool = None
 
 
-def compute_all_convo_stats(user_code):
+def compute_all_convo_stats(user_code, job=None):
     """
-    For each conversation thread, run detect_conversations (Rust), cache per-session
-    metadata to cached_convo_metadata.json next to cached_analysis.json, and merge
-    thread-level aggregates into cached_analysis.json under the 'convo_stats' key.
-    A user-level summary is also written to cached_convo_stats.json.
+    Run detect_conversations (Rust) for every thread across a process pool. Each
+    worker caches per-session metadata to cached_convo_metadata.json, thread-level
+    aggregates to cached_convo_aggregate.json and gap arrays (for threshold sweeps)
+    to cached_convo_gaps.json; the aggregates are then reduced into the user-level
+    summary in cached_convo_stats.json.
     """
-    conversations = get_conversations(user_code)
-
-    global_total_convos = 0
-    global_total_response_time = 0.0
-    global_response_time_conversation_count = 0
-    global_leans: dict = {}
-    global_leans_conversation_count = 0
-    global_total_msg_count = 0.0
-    global_msg_count_conversation_count = 0
-    global_total_duration_ms = 0.0
-    global_duration_conversation_count = 0
-    global_convos_per_day: dict = {}
-    global_avg_time_between_convos = 0.0
-    global_time_between_convos_conversation_count = 0
-    per_chat_convos_per_day: dict = {}
-
-    for conv in conversations:
-        conv_id = conv['id']
-        thread_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conv_id)
-        metadata_path = os.path.join(thread_folder, 'cached_convo_metadata.json')
-        analysis_path = os.path.join(thread_folder, 'cached_analysis.json')
-
-        # Load or compute per-session metadata for this thread
-        if os.path.exists(metadata_path):
-            with open(metadata_path, 'r') as f:
-                thread_result = json.load(f)
-        else:
-            messages = load_conversation_data(user_code, conv_id)
-            if not messages:
-                continue
-
-            thread_result = detect_conversations(messages)
-
-            # Cache per-session metadata (without per-message content)
-            try:
-                with open(metadata_path, 'w') as f:
-                    json.dump(thread_result, f)
-            except Exception as e:
-                print(f"[CONVO_DETECT] Failed to write metadata for {conv_id}: {e}")
-
-        # Merge thread-level aggregates into cached_analysis.json
-        thread_agg = thread_result.get('thread_aggregation', {})
-        if thread_agg:
-            try:
-                if os.path.exists(analysis_path):
-                    with open(analysis_path, 'r') as f:
-                        analysis = json.load(f)
-                else:
-                    analysis = {}
-                analysis['convo_stats'] = thread_agg
-                with open(analysis_path, 'w') as f:
-                    json.dump(analysis, f)
-            except Exception as e:
-                print(f"[CONVO_DETECT] Failed to update cached_analysis for {conv_id}: {e}")
-
-        # Accumulate global aggregates
-        total_c = thread_agg.get('total_conversations', 0)
-        if total_c == 0:
-            continue
+    if ensure_fresh(_user_path(user_code), 'convo_stats'):
+        return
+    record_build(_user_path(user_code), 'convo_stats')
 
-        global_total_convos += total_c
-
-        art = thread_agg.get('avg_in_convo_response_time', 0.0)
-        if art > 0:
-            global_total_response_time += art * total_c
-            global_response_time_conversation_count += total_c
-
-        atbc = thread_agg.get('avg_time_between_convos', 0.0)
-        if atbc > 0:
-            global_avg_time_between_convos += atbc * total_c
-            global_time_between_convos_conversation_count += total_c
-
-        participation = thread_agg.get('avg_participation_leans', {})
-        if participation:
-            for sender, pct in participation.items():
-                global_leans[sender] = global_leans.get(sender, 0.0) + pct * total_c
-            global_leans_conversation_count += total_c
-
-        avg_msg_count = thread_agg.get('avg_msg_count_per_convo', 0.0)
-        if avg_msg_count > 0:
-            global_total_msg_count += avg_msg_count * total_c
-            global_msg_count_conversation_count += total_c
-
-        avg_duration_ms = thread_agg.get('avg_duration_ms_per_convo', 0.0)
-        if avg_duration_ms > 0:
-            global_total_duration_ms += avg_duration_ms * total_c
-            global_duration_conversation_count += total_c
-
-        chat_cpd = thread_agg.get('convos_per_day', {})
-        for date_str, cnt in chat_cpd.items():
-            global_convos_per_day[date_str] = global_convos_per_day.get(date_str, 0) + cnt
-
-        # Store per-chat conversation counts for the trends chart
-        if chat_cpd:
-            per_chat_convos_per_day[conv_id] = {
-                'title': conv.get('title', conv_id),
-                'convos_per_day': chat_cpd,
-            }
+    if job:
+        job.report_progress(phase='listing conversations')
+    conversations = get_conversations(user_code)
+    inbox_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox')
 
-    # Build global summary
-    avg_participation = {}
-    if global_leans_conversation_count > 0:
-        for sender, total_pct in global_leans.items():
-            avg_participation[sender] = total_pct / global_leans_conversation_count
-
-    summary = {
-        'total_conversations': global_total_convos,
-        'avg_in_convo_response_time': (
-            global_total_response_time / global_response_time_conversation_count
-            if global_response_time_conversation_count > 0 else 0.0
-        ),
-        'avg_time_between_convos': (
-            global_avg_time_between_convos / global_time_between_convos_conversation_count
-            if global_time_between_convos_conversation_count > 0 else 0.0
-        ),
-        'avg_participation_leans': avg_participation,
-        'avg_msg_count_per_convo': (
-            global_total_msg_count / global_msg_count_conversation_count
-            if global_msg_count_conversation_count > 0 else 0.0
-        ),
-        'avg_duration_ms_per_convo': (
-            global_total_duration_ms / global_duration_conversation_count
-            if global_duration_conversation_count > 0 else 0.0
-        ),
-        'convos_per_day': global_convos_per_day,
-        'per_chat_convos_per_day': per_chat_convos_per_day,
-    }
+    aggregates_by_id = {}
+    if app.config['CONVO_DETECT_WORKERS'] <= 1:
+        for index, conv in enumerate(conversations):
+            if job:
+                job.report_progress(done=index, total=len(conversations), phase='detecting conversations')
+            aggregates_by_id[conv['id']] = detect_thread(os.path.join(inbox_path, conv['id']))
+    else:
+        pool = _get_convo_detect_pool()
+        futures = {
+            pool.submit(detect_thread, os.path.join(inbox_path, conv['id'])): conv['id']
+            for conv in conversations
+        }
+        try:
+            for index, future in enumerate(as_completed(futures)):
+                if job:
+                    job.report_progress(done=index, total=len(conversations), phase='detecting conversations')
+                aggregates_by_id[futures[future]] = future.result()
+        except BrokenProcessPool:
+            _reset_convo_detect_pool()
+            raise
+        finally:
+            # Drop queued threads if we bailed out early (error or cancellation).
+            for future in futures:
+                future.cancel()
+
+    if job:
+        job.report_progress(done=len(conversations), phase='writing cache')
+
+    # Reduce in conversation order so the summary does not depend on completion order.
+    summary = reduce_convo_stats(
+        (conv, aggregates_by_id.get(conv['id'])) for conv in conversations
+    )
 
     user_stats_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_convo_stats.json')
-    with open(user_stats_path, 'w') as f:
-        json.dump(summary, f)
-
+    atomic_write_json(user_stats_path, summary)
+
+
+SSE_KEEPALIVE_SECONDS = 15
+# How often an SSE stream re-reads the registry for a job owned by another process.
+SSE_REMOTE_POLL_SECONDS = 1.0
+# How often a job waiting on another process's cache lease checks back.
+LEASE_WAIT_POLL_SECONDS = 2.0
+
+# Background jobs that build user-level caches, keyed by job type (also the cache
+# manifest's artifact name).
+BACKGROUND_JOBS = {
+    'group_trends': {
+        'target': compute_group_chat_trends,
+        'cache_name': 'cached_group_chat_trends',
+        'label': 'group chat trends',
+        'priority': PRIORITY_NORMAL,
+    },
+    'uploader_trends': {
+        'target': compute_uploader_message_trends,
+        'cache_name': 'cached_uploader_message_trends',
+        'label': 'uploader message trends',
+        'priority': PRIORITY_NORMAL,
+    },
+    'people_talked_trends': {
+        'target': compute_people_talked_trends,
+        'cache_name': 'cached_people_talked_trends',
+        'label': 'people talked trends',
+        'priority': PRIORITY_NORMAL,
+    },
+    'convo_stats': {
+        'target': compute_all_convo_stats,
+        'cache_name': 'cached_convo_stats.json',
+        'label': 'conversation stats',
+        'priority': PRIORITY_LOW,
+    },
+}
+
+
+def _run_leased_job(user_code, job):
+    """
+    Job target wrapper that holds a cross-process lease on the job's cache file
+    (or partition directory) while building it, so only one server process
+    computes a given cache.
+    """
+    spec = BACKGROUND_JOBS[job.job_type]
+    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, spec['cache_name'])
+
+    with FileLease(cache_path + '.lease') as lease:
+        while not lease.acquired:
+            # Another process is building this cache; wait for it (or for its lease to go stale).
+            job.report_progress(phase='waiting for another worker')
+            time.sleep(LEASE_WAIT_POLL_SECONDS)
+            if ensure_fresh(_user_path(user_code), job.job_type):
+                return
+            lease.try_acquire()
+
+        if ensure_fresh(_user_path(user_code), job.job_type):
+            return
+        spec['target'](user_code, job)
+
+
+def _background_job_response(user_code, job_type):
+    """Report on (or start) the background job that builds a user-level cache."""
+    spec = BACKGROUND_JOBS[job_type]
+    label = spec['label']
+    CACHE_REQUESTS.labels(job_type, 'miss').inc()
+    status = job_scheduler.status(user_code, job_type)
+
+    if status and status['state'] in ACTIVE_JOB_STATES:
+        return jsonify({
+            'status': 'processing',
+            'message': f'{label.capitalize()} are still being computed',
+            'elapsed_seconds': round(status['queued_seconds'] + status['elapsed_seconds'], 2),
+            'job': status
+        }), 202
+
+    # Failed and cancelled jobs are reported until they expire (FINISHED_JOB_TTL_SECONDS)
+    # or the client asks to recompute; polling alone never restarts them.
+    if status and status['state'] in (JOB_FAILED, JOB_CANCELLED) and request.args.get('recompute', '').lower() in ('1', 'true', 'yes'):
+        job_scheduler.clear(user_code, job_type)
+        status = None
+
+    if status and status['state'] == JOB_FAILED:
+        return jsonify({
+            'status': 'failed',
+            'error': f'Background computation failed: {status["error"]}',
+            'job': status
+        }), 500
 
-def _convo_detection_worker(user_code):
-    """Background worker that runs conversation detection for all threads."""
-    try:
-        compute_all_convo_stats(user_code)
-        print(f"[CACHE WRITE] Saved convo stats for user {user_code}")
-    except Exception as e:
-        print(f"[CONVO_DETECT_ERROR] Failed for user {user_code}: {e}")
-        traceback.print_exc()
-        with convo_detection_jobs_lock:
-            job = convo_detection_jobs.get(user_code)
-            if job:
-                job.error = str(e)
-        return
+    if status and status['state'] == JOB_CANCELLED:
+        return jsonify({
+            'status': 'cancelled',
+            'error': f'Computation of {label} was cancelled; request again with ?recompute=1 to restart it',
+            'job': status
+        }), 409
 
-    with convo_detection_jobs_lock:
-        convo_detection_jobs.pop(user_code, None)
+    print(f"[CACHE MISS] Starting background {label} compute for user {user_code}")
+    job, _ = job_scheduler.submit(user_code, job_type, _run_leased_job, priority=spec['priority'], profile=_profile_requested())
+    return jsonify({
+        'status': 'processing',
+        'message': f'Started background computation for {label}',
+        'job': job.to_dict()
+    }), 202
 
 
 #     """Find the period with highest message density"""
@@ -588,10 +921,22 @@ def get_conversations(user_code):
         folder_path = os.path.join(user_path, folder)
         if os.path.isdir(folder_path) and not os.path.islink(folder_path):
             # Try to get conversation name from first message file
-            message_files = glob(os.path.join(folder_path, 'message_*.json'))
-            if message_files:
-                with open(message_files[0], encoding="raw_unicode_escape") as f:
-                    data = json.loads(f.read().encode('raw_unicode_escape').decode())
+            files = message_files(folder_path)
+            if files:
+                data = load_message_file(files[0])
+                title = data.get('title', folder)
+                participants = data.get('participants', [])
+                conversations.append({
+                    'id': folder,
+                    'title': title,
+                    'participants': participants
+                })
+        elif os.path.islink(folder_path):
+            # Handle symlinks
+            try:
+                files = message_files(folder_path)
+                if files:
+                    data = load_message_file(files[0])
                     title = data.get('title', folder)
                     participants = data.get('participants', [])
                     conversations.append({
@@ -599,39 +944,33 @@ def get_conversations(user_code):
                         'title': title,
                         'participants': participants
                     })
-        elif os.path.islink(folder_path):
-            # Handle symlinks
-            try:
-                message_files = glob(os.path.join(folder_path, 'message_*.json'))
-                if message_files:
-                    with open(message_files[0], encoding="raw_unicode_escape") as f:
-                        data = json.loads(f.read().encode('raw_unicode_escape').decode())
-                        title = data.get('title', folder)
-                        participants = data.get('participants', [])
-                        conversations.append({
-                            'id': folder,
-                            'title': title,
-                            'participants': participants
-                        })
             except:
                 pass
     conversations = sorted(conversations, key=lambda x: x['title'].lower())
     return conversations
 
+_LOAD_CONVERSATION_SECONDS = OPERATION_SECONDS.labels('load_conversation_data')
+
+
 def load_conversation_data(user_code, conversation_id):
     """Load all messages for a conversation"""
-    user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox')
-    conv_path = os.path.join(user_path, conversation_id)
-    
-    messages = []
-    message_files = glob(os.path.join(conv_path, 'message_*.json'))
-    
-    for file_path in message_files:
-        with open(file_path, encoding="raw_unicode_escape") as f:
-            messages.extend(json.loads(f.read().encode('raw_unicode_escape').decode())['messages'])
-    
-    messages = sorted(messages, key=lambda x: x['timestamp_ms'])
-    return messages
+    with _LOAD_CONVERSATION_SECONDS.time():
+        return load_thread_messages(os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conversation_id))
+
+
+def load_conversation_columns(user_code, conversation_id, messages=None):
+    """Message columns for a conversation (see message_columns), from `messages` or the cache when possible."""
+    thread_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conversation_id)
+    fingerprint = messages_fingerprint(thread_folder)
+    # Shared chats are symlinks; key by the real folder so every user code shares one entry.
+    key = os.path.realpath(thread_folder)
+    columns = columns_cache.get(key, fingerprint)
+    if columns is None:
+        if messages is None:
+            messages = load_conversation_data(user_code, conversation_id)
+        columns = MessageColumns(messages)
+        columns_cache.put(key, fingerprint, columns)
+    return columns
 
 
 def find_uploader_name_from_marker(user_code):
@@ -643,11 +982,9 @@ def find_uploader_name_from_marker(user_code):
     marker_text = 'You sent an attachment.'
 
     for root, _, _ in os.walk(inbox_path):
-        message_files = glob(os.path.join(root, 'message_*.json'))
-        for file_path in message_files:
+        for file_path in message_files(root):
             try:
-                with open(file_path, encoding="raw_unicode_escape") as f:
-                    data = json.loads(f.read().encode('raw_unicode_escape').decode())
+                data = load_message_file(file_path)
 
                 for message in data.get('messages', []):
                     if message.get('content') == marker_text:
@@ -698,7 +1035,6 @@ def service_worker():
 
 @app.route('/')
 def index():
-    cleanup_old_data()
     return render_template('index.html')
 
 @app.route('/help')
@@ -713,14 +1049,27 @@ def upload_init():
     filename = request.json.get('filename', '')
     total_chunks = request.json.get('total_chunks', 0)
     file_size = request.json.get('file_size', 0)
+    mode = request.json.get('mode', 'new')
     
     if not access_code or not filename:
         return jsonify({'error': 'Access code and filename required'}), 400
+    if mode not in ('new', 'update'):
+        return jsonify({'error': 'Invalid upload mode'}), 400
+    try:
+        file_size = int(file_size)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid file size'}), 400
     
-    # Check if code already exists
+    # New uploads need a free code; updates merge a newer export into an existing one.
     user_path = os.path.join(app.config['UPLOAD_FOLDER'], access_code)
-    if os.path.exists(user_path):
+    if mode == 'new' and os.path.exists(user_path):
         return jsonify({'error': 'Access code already in use. Please choose another.'}), 400
+    if mode == 'update' and not os.path.isdir(os.path.join(user_path, 'inbox')):
+        return jsonify({'error': 'No existing data found for this access code.'}), 404
+    # Derived caches are evicted to stay under quota, but the export itself has to fit.
+    # An update supersedes the previous export, so only its own size is checked too.
+    if 0 < app.config['USER_QUOTA_BYTES'] < file_size:
+        return jsonify({'error': 'Upload exceeds the storage quota'}), 413
     
     # Use the user's chosen access code
     upload_id = access_code
@@ -728,6 +1077,7 @@ def upload_init():
     # Create chunk directory
     chunk_dir = os.path.join(app.config['CHUNK_FOLDER'], upload_id)
     os.makedirs(chunk_dir, exist_ok=True)
+    expiry_index.schedule(chunk_dir, time.time() + app.config['CHUNK_RETENTION_SECONDS'])
     
     # Store metadata
     metadata = {
@@ -735,11 +1085,11 @@ def upload_init():
         'filename': filename,
         'total_chunks': total_chunks,
         'file_size': file_size,
+        'mode': mode,
         'received_chunks': []
     }
     
-    with open(os.path.join(chunk_dir, 'metadata.json'), 'w') as f:
-        json.dump(metadata, f)
+    atomic_write_json(os.path.join(chunk_dir, 'metadata.json'), metadata)
     
     return jsonify({'upload_id': upload_id})
 
@@ -777,8 +1127,7 @@ def upload_chunk():
         metadata['chunk_sizes'] = {}
     metadata['chunk_sizes'][str(chunk_number)] = chunk_size
     
-    with open(metadata_path, 'w') as f:
-        json.dump(metadata, f)
+    atomic_write_json(metadata_path, metadata)
     
     return jsonify({'success': True, 'received': len(metadata['received_chunks']), 'chunk_size': chunk_size})
 
@@ -806,10 +1155,12 @@ def upload_complete():
     # Use upload_id as the user code
     user_code = upload_id
     user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+    update_mode = metadata.get('mode') == 'update'
     os.makedirs(user_path, exist_ok=True)
     
-    # Combine chunks in correct order
-    zip_path = os.path.join(user_path, 'upload.zip')
+    # Combine chunks in correct order. Updates assemble the zip next to the chunks so
+    # a failed refresh never touches the existing data.
+    zip_path = os.path.join(chunk_dir if update_mode else user_path, 'upload.zip')
     try:
         total_written = 0
         with open(zip_path, 'wb') as outfile:
@@ -835,38 +1186,34 @@ def upload_complete():
     except Exception as e:
         if os.path.exists(zip_path):
             os.remove(zip_path)
-        shutil.rmtree(user_path, ignore_errors=True)
-        shutil.rmtree(chunk_dir, ignore_errors=True)
+        if not update_mode:
+            discard_path(user_path)
+        discard_path(chunk_dir)
         return jsonify({'error': f'Failed to combine chunks: {str(e)}'}), 400
+
+    if update_mode:
+        return _complete_update_upload(user_code, zip_path, chunk_dir)
     
     # Extract only the inbox folder
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            # Find and extract only inbox folder
-            inbox_found = False
-            for name in zip_ref.namelist():
-                if 'messages/inbox/' in name:
-                    inbox_found = True
-                    # Extract to user_path, stripping the path before inbox
-                    target_path = name.split('messages/inbox/')[-1]
-                    if target_path:  # Skip the inbox folder itself
-                        extract_path = os.path.join(user_path, 'inbox', target_path)
-                        os.makedirs(os.path.dirname(extract_path), exist_ok=True)
-                        if not name.endswith('/'):
-                            with zip_ref.open(name) as source, open(extract_path, 'wb') as target:
-                                target.write(source.read())
-            
-            if not inbox_found:
+            threads = zip_inbox_threads(zip_ref)
+            if not threads:
                 raise Exception('Instagram inbox folder not found in zip')
+            # Fingerprints let a later update upload skip threads that did not change.
+            save_fingerprints(user_path, extract_threads(
+                zip_ref, threads, os.path.join(user_path, 'inbox'), compression=app.config['MESSAGE_COMPRESSION']
+            ))
         
         os.remove(zip_path)
     except Exception as e:
-        shutil.rmtree(user_path)
-        shutil.rmtree(chunk_dir)
+        discard_path(user_path)
+        discard_path(chunk_dir)
         return jsonify({'error': f'Failed to extract zip: {str(e)}'}), 400
     
     # Clean up chunks
-    shutil.rmtree(chunk_dir)
+    discard_path(chunk_dir)
+    schedule_user_expiry(user_code)
 
     # Resolve and persist uploader identity immediately after successful extraction.
     uploader_name = find_uploader_name_from_marker(user_code)
@@ -878,8 +1225,7 @@ def upload_complete():
             'message': 'Could not determine uploader automatically. Please enter your username.'
         })
 
-    with open(os.path.join(user_path, 'me.json'), 'w') as f:
-        json.dump({'username': uploader_name}, f)
+    atomic_write_json(os.path.join(user_path, 'me.json'), {'username': uploader_name})
     
     # Store in session
     session['user_code'] = user_code
@@ -888,6 +1234,60 @@ def upload_complete():
     return jsonify({'code': user_code})
 
 
+# User-level caches outside the cache manifest: single-file trend caches from older
+# versions (which would otherwise be migrated as-is), spilled series and the content
+# hashes of chats shared into the user code.
+UNTRACKED_USER_CACHES = (
+    'cached_group_chat_trends.json',
+    'cached_uploader_message_trends.json',
+    'cached_people_talked_trends.json',
+    'cached_series',
+    SHARED_CONTENT_HASHES_NAME,
+)
+
+
+def _invalidate_user_caches(user_code):
+    """
+    Drop every cache built from all threads after the thread set changed. The cache
+    manifest would flag them stale on next use anyway; this stops running jobs and
+    frees the disk now.
+    """
+    user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+    for job_type in BACKGROUND_JOBS:
+        job_scheduler.cancel(user_code, job_type)
+        job_scheduler.clear(user_code, job_type)
+        invalidate_artifact(user_path, job_type)
+
+    for name in UNTRACKED_USER_CACHES:
+        remove_path(os.path.join(user_path, name))
+
+
+def _complete_update_upload(user_code, zip_path, chunk_dir):
+    """
+    Merge a newer export into an existing user code. Only new or changed threads are
+    extracted (dropping their per-thread caches); user-level caches are invalidated
+    and rebuilt from the per-thread caches on next request.
+    """
+    user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            changes = apply_inbox_update(zip_ref, user_path, compression=app.config['MESSAGE_COMPRESSION'])
+    except Exception as e:
+        discard_path(chunk_dir)
+        return jsonify({'error': f'Failed to extract zip: {str(e)}'}), 400
+
+    discard_path(chunk_dir)
+    # A refreshed export starts a new retention period.
+    schedule_user_expiry(user_code)
+    if changes['added'] or changes['changed']:
+        _invalidate_user_caches(user_code)
+    print(f"[UPLOAD_UPDATE] {user_code}: {len(changes['added'])} added, {len(changes['changed'])} changed, {changes['unchanged']} unchanged")
+
+    session['user_code'] = user_code
+    session.pop('pending_user_code', None)
+    return jsonify(dict(changes, code=user_code, updated=True))
+
+
 @app.route('/upload/set_me', methods=['POST'])
 def upload_set_me():
     """Persist uploader username when auto-detection was not possible."""
@@ -904,8 +1304,7 @@ def upload_set_me():
     if not os.path.exists(user_path):
         return jsonify({'error': 'Upload data not found for this code'}), 404
 
-    with open(os.path.join(user_path, 'me.json'), 'w') as f:
-        json.dump({'username': username}, f)
+    atomic_write_json(os.path.join(user_path, 'me.json'), {'username': username})
 
     session['user_code'] = code
     session.pop('pending_user_code', None)
@@ -954,32 +1353,22 @@ def api_conversation(conversation_id):
     if 'user_code' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    analysis_path = os.path.join(app.config['UPLOAD_FOLDER'], session['user_code'], 'inbox', conversation_id, 'cached_analysis.json')
-
-    # check if cached data exists
-    if os.path.exists(analysis_path):
-        with open(analysis_path, 'r') as f:
-            cached_data = json.load(f)
-            if 'messages' in cached_data:
-                # If convo_stats is missing from cache, compute and patch it now
-                if 'convo_stats' not in cached_data:
-                    try:
-                        messages = load_conversation_data(session['user_code'], conversation_id)
-                        thread_result = detect_conversations(messages)
-                        cached_data['convo_stats'] = thread_result.get('thread_aggregation', {})
-                        # Also write the per-session metadata cache
-                        metadata_path = os.path.join(
-                            app.config['UPLOAD_FOLDER'], session['user_code'],
-                            'inbox', conversation_id, 'cached_convo_metadata.json'
-                        )
-                        if not os.path.exists(metadata_path):
-                            with open(metadata_path, 'w') as mf:
-                                json.dump(thread_result, mf)
-                        with open(analysis_path, 'w') as cf:
-                            json.dump(cached_data, cf)
-                    except Exception as e:
-                        print(f"[CONVO_DETECT] Failed to patch convo_stats for {conversation_id}: {e}")
-                return jsonify(cached_data)
+    user_code = session['user_code']
+    thread_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conversation_id)
+    if not os.path.isdir(thread_folder):
+        return jsonify({'error': 'Conversation not found'}), 404
+
+    # Analysis is stored once per message content, however many user codes reach the thread.
+    analysis_key = SharedAnalysisCache.make_key(thread_content_hash(thread_folder), ARTIFACTS['analysis'].version)
+    cached_data = shared_analysis_cache.get(analysis_key, user_code, conversation_id)
+
+    cache_hit = cached_data is not None and 'messages' in cached_data
+    CACHE_REQUESTS.labels('analysis', 'hit' if cache_hit else 'miss').inc()
+    if cache_hit:
+        # The folder name differs between user codes that uploaded the same thread.
+        if cached_data.get('conversation'):
+            cached_data['conversation']['id'] = conversation_id
+        return jsonify(cached_data)
 
     # If cache exists but doesn't have raw messages (from compact format), rebuild below.
     
@@ -1016,10 +1405,11 @@ def api_conversation(conversation_id):
             overall_avg_per_day = total_messages
     
     # Calculate max density period
+    columns = load_conversation_columns(user_code, conversation_id, messages)
     maxed_density = {'start_ms': 0, 'end_ms': 0, 'count': 0, 'days': 1}
     for days in range(1, 31):
-        start_ms, end_ms = find_highest_density_period(messages, days)
-        count = sum(1 for m in messages if start_ms <= m['timestamp_ms'] < end_ms)
+        start_ms, end_ms = find_highest_density_period_columns(columns.timestamps, days)
+        count = columns.count_between(start_ms, end_ms)
         if count / days > maxed_density['count'] / maxed_density['days']:
             maxed_density = {
                 'start_ms': start_ms,
@@ -1128,23 +1518,98 @@ def api_conversation(conversation_id):
 
     # Compute conversation detection stats and include in analysis
     try:
-        thread_result = detect_conversations(messages)
+        thread_result = detect_conversations_columns(columns.timestamps, columns.sender_ids, columns.senders)
         d['convo_stats'] = thread_result.get('thread_aggregation', {})
-        # Cache the per-session metadata separately
-        metadata_path = os.path.join(
-            app.config['UPLOAD_FOLDER'], session['user_code'],
-            'inbox', conversation_id, 'cached_convo_metadata.json'
+        # Cache the per-session metadata and aggregates separately
+        write_thread_detection(
+            os.path.join(app.config['UPLOAD_FOLDER'], session['user_code'], 'inbox', conversation_id),
+            thread_result
         )
-        if not os.path.exists(metadata_path):
-            with open(metadata_path, 'w') as mf:
-                json.dump(thread_result, mf)
     except Exception as e:
         print(f"[CONVO_DETECT] Failed to compute convo_stats for {conversation_id}: {e}")
 
-    with open(os.path.join(app.config['UPLOAD_FOLDER'], session['user_code'], 'inbox', conversation_id, 'cached_analysis.json'), 'w') as f:
-        json.dump(d, f)
+    shared_analysis_cache.put(analysis_key, d, user_code, conversation_id)
     return jsonify(d)
 
+MAX_SESSIONS_PAGE = 500
+
+
+def _date_param_ms(name, end_of_day=False):
+    """Parse a YYYY-MM-DD query param to UTC epoch ms, or raise ValueError."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    day = datetime.datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc)
+    if end_of_day:
+        day += datetime.timedelta(days=1)
+        return int(day.timestamp() * 1000) - 1
+    return int(day.timestamp() * 1000)
+
+
+@app.route('/api/conversation/<conversation_id>/sessions')
+def api_conversation_sessions(conversation_id):
+    """
+    Page through detected conversation sessions for one thread.
+
+    Query params: start_date / end_date (YYYY-MM-DD, on session start), min_messages,
+    participant (dominant participant), min_duration_ms, max_duration_ms,
+    sort (start | message_count | duration | avg_response), order (asc | desc),
+    limit and cursor (from next_cursor of the previous page).
+    """
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    user_code = session['user_code']
+    thread_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox', conversation_id)
+    if not os.path.isdir(thread_folder):
+        return jsonify({'error': 'Conversation not found'}), 404
+
+    sort = request.args.get('sort', 'start')
+    order = request.args.get('order', 'asc')
+    if sort not in SESSION_SORT_KEYS or order not in ('asc', 'desc'):
+        return jsonify({'error': 'Invalid sort'}), 400
+
+    try:
+        filters = {
+            'start_ms': _date_param_ms('start_date'),
+            'end_ms': _date_param_ms('end_date', end_of_day=True),
+            'min_messages': request.args.get('min_messages', type=int),
+            'min_duration_ms': request.args.get('min_duration_ms', type=int),
+            'max_duration_ms': request.args.get('max_duration_ms', type=int),
+            'participant': request.args.get('participant'),
+        }
+        limit = max(1, min(request.args.get('limit', 50, type=int), MAX_SESSIONS_PAGE))
+        cursor = decode_cursor(request.args['cursor'], sort) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameters'}), 400
+
+    index_path = os.path.join(thread_folder, SESSION_INDEX_NAME)
+    cache_key = ('session_index', user_code, conversation_id)
+    index = None
+    if os.path.exists(index_path):
+        index = session_index_cache.get(cache_key, os.path.getmtime(index_path))
+    if index is None:
+        index = load_session_index(thread_folder)
+        if index is None:
+            return jsonify({'sessions': [], 'next_cursor': None, 'total_sessions': 0})
+        if os.path.exists(index_path):
+            session_index_cache.put(cache_key, os.path.getmtime(index_path), index)
+
+    sessions, next_cursor = query_sessions(
+        index,
+        filters=filters,
+        sort=sort,
+        descending=order == 'desc',
+        limit=limit,
+        cursor=cursor
+    )
+    return jsonify({
+        'sessions': sessions,
+        'next_cursor': next_cursor,
+        'total_sessions': len(index['columns']['start_ms']),
+        'participants': index['participants']
+    })
+
 @app.route('/api/participant_period', methods=['POST'])
 def participant_period():
     if 'user_code' not in session:
@@ -1166,14 +1631,15 @@ def participant_period():
     if days < 1:
         return jsonify({'error': 'Days must be a positive integer'}), 400
     
-    messages = load_conversation_data(session['user_code'], conversation_id)
+    columns = load_conversation_columns(session['user_code'], conversation_id)
+    participant_id = columns.sender_id(participant)
     
     # Use Rust implementation for efficient calculation
-    start_ms, end_ms = find_participant_density_period(messages, days, participant, find_max)
+    start_ms, end_ms = find_participant_density_period_columns(columns.timestamps, columns.sender_ids, days, participant_id, find_max)
     
     # Count messages in the period
-    total_count = sum(1 for m in messages if start_ms <= m['timestamp_ms'] < end_ms)
-    participant_count = sum(1 for m in messages if start_ms <= m['timestamp_ms'] < end_ms and m.get('sender_name') == participant)
+    total_count = columns.count_between(start_ms, end_ms)
+    participant_count = columns.count_sender_between(participant_id, start_ms, end_ms)
     
     return jsonify({
         'start_ms': start_ms,
@@ -1203,11 +1669,11 @@ def custom_density():
     if days < 1:
         return jsonify({'error': 'Days must be a positive integer'}), 400
     
-    messages = load_conversation_data(session['user_code'], conversation_id)
+    columns = load_conversation_columns(session['user_code'], conversation_id)
     
     # Use Rust implementation for efficient calculation
-    start_ms, end_ms = find_highest_density_period(messages, days)
-    count = sum(1 for m in messages if start_ms <= m['timestamp_ms'] < end_ms)
+    start_ms, end_ms = find_highest_density_period_columns(columns.timestamps, days)
+    count = columns.count_between(start_ms, end_ms)
     
     return jsonify({
         'start_ms': start_ms,
@@ -1224,12 +1690,12 @@ def compute_word():
     conversation_id = request.json.get('conversation_id')
     passcode = request.json.get('passcode')
     
-    messages = load_conversation_data(session['user_code'], conversation_id)
+    columns = load_conversation_columns(session['user_code'], conversation_id)
 
-    if passcode != app.config['COMPUTE_PASSCODE'] and len(messages) > 15000:
+    if passcode != app.config['COMPUTE_PASSCODE'] and len(columns) > 15000:
         return jsonify({'error': 'Invalid passcode'}), 403
     
-    most_common = compute_top_words(messages, 10)
+    most_common = compute_top_words_columns(columns.content_offsets, columns.content, 10)
     return jsonify({'words': most_common})
 
 @app.route('/api/compute_emoji', methods=['POST'])
@@ -1238,9 +1704,9 @@ def compute_emoji():
         return jsonify({'error': 'Not authenticated'}), 401
     
     conversation_id = request.json.get('conversation_id')
-    messages = load_conversation_data(session['user_code'], conversation_id)
+    columns = load_conversation_columns(session['user_code'], conversation_id)
 
-    most_common = compute_top_emojis(messages, 10)
+    most_common = compute_top_emojis_columns(columns.content_offsets, columns.content, 10)
     return jsonify({'emojis': most_common})
 
 @app.route('/api/count_specific_string', methods=['POST'])
@@ -1254,9 +1720,9 @@ def count_specific_word():
     if not target_string:
         return jsonify({'error': 'Target string required'}), 400
     
-    messages = load_conversation_data(session['user_code'], conversation_id)
+    columns = load_conversation_columns(session['user_code'], conversation_id)
 
-    count = count_specific_string(messages, target_string)
+    count = count_specific_string_columns(columns.content_offsets, columns.content, target_string)
     
     return jsonify({'string': target_string, 'count': count})
 
@@ -1282,10 +1748,13 @@ def share_chat():
     # Intentionally keep shared target without uploader identity metadata.
     target_me_path = os.path.join(target_user_root, 'me.json')
     if os.path.exists(target_me_path):
-        os.remove(target_me_path)
+        remove_path(target_me_path)
     
     # Create target user path if it doesn't exist
+    new_target = not os.path.exists(target_user_root)
     os.makedirs(target_user_path, exist_ok=True)
+    if new_target:
+        schedule_user_expiry(target_code)
     
     # Check if already exists
     if os.path.exists(target_path):
@@ -1307,7 +1776,7 @@ def delete_account():
     user_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code)
     
     if os.path.exists(user_path):
-        shutil.rmtree(user_path)
+        discard_path(user_path)
     
     session.clear()
     return jsonify({'success': True})
@@ -1318,137 +1787,87 @@ def trends_dashboard():
         return redirect(url_for('index'))
     return render_template('trends-dashboard.html')
 
+def _requested_month_window(month_keys):
+    """Parse ?full= / ?months= into (full_requested, months_loaded) for a sorted month key list."""
+    full_requested = str(request.args.get('full', '')).lower() in ('1', 'true', 'yes')
+    months_requested_raw = request.args.get('months', '1')
+    try:
+        months_requested = max(1, int(months_requested_raw))
+    except ValueError:
+        months_requested = 1
+
+    months_loaded = len(month_keys) if full_requested else min(months_requested, len(month_keys))
+    return full_requested, months_loaded
+
+
+# Reads that keep landing on a cache swap give up and report the cache as missing.
+TRENDS_CACHE_READ_ATTEMPTS = 3
+
+
+def _read_trends_cache(cache_dir):
+    """
+    (manifest, full_requested, months_loaded, partitions) from one build of a partitioned
+    trends cache, retrying reads that overlap a rebuild's swap; None if there is no cache.
+    """
+    for _ in range(TRENDS_CACHE_READ_ATTEMPTS):
+        manifest = read_manifest(cache_dir)
+        if manifest is None:
+            continue
+        month_keys = manifest.get('month_keys') or []
+        full_requested, months_loaded = _requested_month_window(month_keys)
+        # Only the requested month partitions are read from disk.
+        partitions = read_partitions(cache_dir, manifest, month_keys[:months_loaded])
+        if partitions is not None:
+            return manifest, full_requested, months_loaded, partitions
+    return None
+
+
 @app.route('/api/group_chat_trends')
 def api_group_chat_trends():
     if 'user_code' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     user_code = session['user_code']
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_group_chat_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_group_chat_trends')
+    cached = _read_trends_cache(cache_dir) if ensure_fresh(_user_path(user_code), 'group_trends') else None
     
     # Check if cached data exists
-    if os.path.exists(cache_path):
+    if cached is not None:
+        manifest, full_requested, months_loaded, partitions = cached
+        sorted_month_keys = manifest.get('month_keys') or []
         print(f"[CACHE HIT] Loading group chat trends from cache for user {user_code}")
-        with open(cache_path, 'r') as f:
-            cached_data = json.load(f)
-
-            all_dates = []
-            month_keys = set()
-            for group_chat in cached_data:
-                for day_key in (group_chat.get('daily_counts') or {}).keys():
-                    all_dates.append(day_key)
-                    if len(day_key) >= 7:
-                        month_keys.add(day_key[:7])
-
-            sorted_month_keys = sorted(month_keys)
-            min_date = min(all_dates) if all_dates else None
-            max_date = max(all_dates) if all_dates else None
-
-            full_requested = str(request.args.get('full', '')).lower() in ('1', 'true', 'yes')
-            months_requested_raw = request.args.get('months', '1')
-            try:
-                months_requested = max(1, int(months_requested_raw))
-            except ValueError:
-                months_requested = 1
+        CACHE_REQUESTS.labels('group_trends', 'hit').inc()
+        response_data = merge_threads(
+            partitions,
+            manifest.get('threads') or [],
+            include_empty=full_requested or not sorted_month_keys
+        )
 
-            months_loaded = len(sorted_month_keys) if full_requested else min(months_requested, len(sorted_month_keys))
-            allowed_months = set(sorted_month_keys[:months_loaded])
+        loaded_dates = []
+        for group_chat in response_data:
+            loaded_dates.extend((group_chat.get('daily_counts') or {}).keys())
+        loaded_range = date_range(loaded_dates)
 
-            if full_requested or not sorted_month_keys:
-                response_data = cached_data
-            else:
-                response_data = []
-                for group_chat in cached_data:
-                    daily_counts = group_chat.get('daily_counts') or {}
-                    filtered_daily_counts = {
-                        date_key: count
-                        for date_key, count in daily_counts.items()
-                        if len(date_key) >= 7 and date_key[:7] in allowed_months
-                    }
-
-                    # Skip conversations that have no data in the requested month window.
-                    if not filtered_daily_counts:
-                        continue
-
-                    response_data.append({
-                        'id': group_chat.get('id'),
-                        'title': group_chat.get('title'),
-                        'daily_counts': filtered_daily_counts
-                    })
+        precomputed_trends = _cached_precomputed_trends(
+            'group_trends', user_code, full_requested, months_loaded, cache_dir, manifest,
+            lambda: _build_group_chat_precomputed_trends(response_data)
+        )
 
-            loaded_dates = []
-            for group_chat in response_data:
-                loaded_dates.extend((group_chat.get('daily_counts') or {}).keys())
-
-            loaded_min_date = min(loaded_dates) if loaded_dates else None
-            loaded_max_date = max(loaded_dates) if loaded_dates else None
-
-            series_cache_key = (user_code, 'full' if full_requested else f'months:{months_loaded}')
-            cache_mtime = os.path.getmtime(cache_path)
-
-            precomputed_trends = None
-            with group_trends_series_cache_lock:
-                cached_series = group_trends_series_cache.get(series_cache_key)
-                if cached_series and cached_series.get('mtime') == cache_mtime:
-                    precomputed_trends = cached_series.get('value')
-
-            if precomputed_trends is None:
-                precomputed_trends = _build_group_chat_precomputed_trends(response_data)
-                with group_trends_series_cache_lock:
-                    group_trends_series_cache[series_cache_key] = {
-                        'mtime': cache_mtime,
-                        'value': precomputed_trends
-                    }
-
-            return jsonify({
-                'data': response_data,
-                'cached': True,
-                'cache_file': cache_path,
-                'partial': not full_requested,
-                'months_loaded': months_loaded,
-                'total_months': len(sorted_month_keys),
-                'month_keys': sorted_month_keys,
-                'precomputed_trends': precomputed_trends,
-                'range': {
-                    'min_date': min_date,
-                    'max_date': max_date
-                },
-                'loaded_range': {
-                    'min_date': loaded_min_date,
-                    'max_date': loaded_max_date
-                }
-            })
-
-    # No cache yet: start one background computation per user and let clients poll.
-    with group_trends_jobs_lock:
-        existing_job = group_trends_jobs.get(user_code)
-
-        if existing_job and existing_job.thread.is_alive():
-            elapsed = round(time.time() - existing_job.started_at, 2)
-            return jsonify({
-                'status': 'processing',
-                'message': 'Group chat trends are still being computed',
-                'elapsed_seconds': elapsed
-            }), 202
-
-        if existing_job and existing_job.error:
-            # Previous worker failed; clear it so the next call can restart computation.
-            last_error = existing_job.error
-            group_trends_jobs.pop(user_code, None)
-            return jsonify({
-                'status': 'failed',
-                'error': f'Background computation failed: {last_error}'
-            }), 500
-
-        print(f"[CACHE MISS] Starting background group chat trends compute for user {user_code}")
-        worker = threading.Thread(target=_group_trends_worker, args=(user_code,), daemon=True)
-        group_trends_jobs[user_code] = GroupTrendsJob(thread=worker)
-        worker.start()
+        return jsonify({
+            'data': response_data,
+            'cached': True,
+            'cache_file': cache_dir,
+            'partial': not full_requested,
+            'months_loaded': months_loaded,
+            'total_months': len(sorted_month_keys),
+            'month_keys': sorted_month_keys,
+            'precomputed_trends': precomputed_trends,
+            'range': manifest.get('range') or date_range([]),
+            'loaded_range': loaded_range
+        })
 
-    return jsonify({
-        'status': 'processing',
-        'message': 'Started background computation for group chat trends'
-    }), 202
+    # No cache yet: hand off to the shared job scheduler and let clients poll.
+    return _background_job_response(user_code, 'group_trends')
 
 
 @app.route('/api/uploader_message_trends')
@@ -1457,120 +1876,42 @@ def api_uploader_message_trends():
         return jsonify({'error': 'Not authenticated'}), 401
 
     user_code = session['user_code']
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_uploader_message_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_uploader_message_trends')
+    cached = _read_trends_cache(cache_dir) if ensure_fresh(_user_path(user_code), 'uploader_trends') else None
 
-    if os.path.exists(cache_path):
+    if cached is not None:
+        manifest, full_requested, months_loaded, partitions = cached
+        month_keys = manifest.get('month_keys') or []
         print(f"[CACHE HIT] Loading uploader message trends from cache for user {user_code}")
-        with open(cache_path, 'r') as f:
-            cached_payload = json.load(f)
-
-        sent_daily_counts = cached_payload.get('sent_daily_counts') or {}
-        received_daily_counts = cached_payload.get('received_daily_counts') or {}
-        all_dates = list(set(sent_daily_counts.keys()) | set(received_daily_counts.keys()))
-        month_keys = sorted({date_key[:7] for date_key in all_dates if isinstance(date_key, str) and len(date_key) >= 7})
-        min_date = min(all_dates) if all_dates else None
-        max_date = max(all_dates) if all_dates else None
-
-        full_requested = str(request.args.get('full', '')).lower() in ('1', 'true', 'yes')
-        months_requested_raw = request.args.get('months', '1')
-        try:
-            months_requested = max(1, int(months_requested_raw))
-        except ValueError:
-            months_requested = 1
-
-        months_loaded = len(month_keys) if full_requested else min(months_requested, len(month_keys))
-        allowed_months = set(month_keys[:months_loaded])
-
-        if full_requested or not month_keys:
-            filtered_sent_counts = sent_daily_counts
-            filtered_received_counts = received_daily_counts
-        else:
-            filtered_sent_counts = {
-                date_key: count
-                for date_key, count in sent_daily_counts.items()
-                if isinstance(date_key, str) and len(date_key) >= 7 and date_key[:7] in allowed_months
-            }
-            filtered_received_counts = {
-                date_key: count
-                for date_key, count in received_daily_counts.items()
-                if isinstance(date_key, str) and len(date_key) >= 7 and date_key[:7] in allowed_months
-            }
-
-        loaded_dates = list(set(filtered_sent_counts.keys()) | set(filtered_received_counts.keys()))
-        loaded_min_date = min(loaded_dates) if loaded_dates else None
-        loaded_max_date = max(loaded_dates) if loaded_dates else None
-
-        series_cache_key = (user_code, 'full' if full_requested else f'months:{months_loaded}')
-        cache_mtime = os.path.getmtime(cache_path)
-
-        precomputed_trends = None
-        with uploader_trends_series_cache_lock:
-            cached_series = uploader_trends_series_cache.get(series_cache_key)
-            if cached_series and cached_series.get('mtime') == cache_mtime:
-                precomputed_trends = cached_series.get('value')
-
-        if precomputed_trends is None:
-            precomputed_trends = _build_uploader_precomputed_trends(
-                filtered_sent_counts,
-                filtered_received_counts
-            )
-            with uploader_trends_series_cache_lock:
-                uploader_trends_series_cache[series_cache_key] = {
-                    'mtime': cache_mtime,
-                    'value': precomputed_trends
-                }
+        CACHE_REQUESTS.labels('uploader_trends', 'hit').inc()
+        merged = merge_series(partitions, UPLOADER_TREND_SERIES)
+        filtered_sent_counts = merged['sent_daily_counts']
+        filtered_received_counts = merged['received_daily_counts']
+        loaded_range = date_range(set(filtered_sent_counts) | set(filtered_received_counts))
+
+        precomputed_trends = _cached_precomputed_trends(
+            'uploader_trends', user_code, full_requested, months_loaded, cache_dir, manifest,
+            lambda: _build_uploader_precomputed_trends(filtered_sent_counts, filtered_received_counts)
+        )
 
         return jsonify({
             'data': {
-                'uploader_username': cached_payload.get('uploader_username'),
+                'uploader_username': manifest.get('uploader_username'),
                 'sent_daily_counts': filtered_sent_counts,
                 'received_daily_counts': filtered_received_counts
             },
             'cached': True,
-            'cache_file': cache_path,
+            'cache_file': cache_dir,
             'partial': not full_requested,
             'months_loaded': months_loaded,
             'total_months': len(month_keys),
             'month_keys': month_keys,
             'precomputed_trends': precomputed_trends,
-            'range': {
-                'min_date': min_date,
-                'max_date': max_date
-            },
-            'loaded_range': {
-                'min_date': loaded_min_date,
-                'max_date': loaded_max_date
-            }
+            'range': manifest.get('range') or date_range([]),
+            'loaded_range': loaded_range
         })
 
-    with uploader_trends_jobs_lock:
-        existing_job = uploader_trends_jobs.get(user_code)
-
-        if existing_job and existing_job.thread.is_alive():
-            elapsed = round(time.time() - existing_job.started_at, 2)
-            return jsonify({
-                'status': 'processing',
-                'message': 'Uploader message trends are still being computed',
-                'elapsed_seconds': elapsed
-            }), 202
-
-        if existing_job and existing_job.error:
-            last_error = existing_job.error
-            uploader_trends_jobs.pop(user_code, None)
-            return jsonify({
-                'status': 'failed',
-                'error': f'Background computation failed: {last_error}'
-            }), 500
-
-        print(f"[CACHE MISS] Starting background uploader message trends compute for user {user_code}")
-        worker = threading.Thread(target=_uploader_trends_worker, args=(user_code,), daemon=True)
-        uploader_trends_jobs[user_code] = GroupTrendsJob(thread=worker)
-        worker.start()
-
-    return jsonify({
-        'status': 'processing',
-        'message': 'Started background computation for uploader message trends'
-    }), 202
+    return _background_job_response(user_code, 'uploader_trends')
 
 
 @app.route('/api/people_talked_trends')
@@ -1579,120 +1920,42 @@ def api_people_talked_trends():
         return jsonify({'error': 'Not authenticated'}), 401
 
     user_code = session['user_code']
-    cache_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_people_talked_trends.json')
+    cache_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_people_talked_trends')
+    cached = _read_trends_cache(cache_dir) if ensure_fresh(_user_path(user_code), 'people_talked_trends') else None
 
-    if os.path.exists(cache_path):
+    if cached is not None:
+        manifest, full_requested, months_loaded, partitions = cached
+        month_keys = manifest.get('month_keys') or []
         print(f"[CACHE HIT] Loading people talked trends from cache for user {user_code}")
-        with open(cache_path, 'r') as f:
-            cached_payload = json.load(f)
-
-        active_people_daily_counts = cached_payload.get('active_people_daily_counts') or {}
-        active_chats_daily_counts = cached_payload.get('active_chats_daily_counts') or {}
-        all_dates = list(set(active_people_daily_counts.keys()) | set(active_chats_daily_counts.keys()))
-        month_keys = sorted({date_key[:7] for date_key in all_dates if isinstance(date_key, str) and len(date_key) >= 7})
-        min_date = min(all_dates) if all_dates else None
-        max_date = max(all_dates) if all_dates else None
-
-        full_requested = str(request.args.get('full', '')).lower() in ('1', 'true', 'yes')
-        months_requested_raw = request.args.get('months', '1')
-        try:
-            months_requested = max(1, int(months_requested_raw))
-        except ValueError:
-            months_requested = 1
-
-        months_loaded = len(month_keys) if full_requested else min(months_requested, len(month_keys))
-        allowed_months = set(month_keys[:months_loaded])
-
-        if full_requested or not month_keys:
-            filtered_people_counts = active_people_daily_counts
-            filtered_chats_counts = active_chats_daily_counts
-        else:
-            filtered_people_counts = {
-                date_key: count
-                for date_key, count in active_people_daily_counts.items()
-                if isinstance(date_key, str) and len(date_key) >= 7 and date_key[:7] in allowed_months
-            }
-            filtered_chats_counts = {
-                date_key: count
-                for date_key, count in active_chats_daily_counts.items()
-                if isinstance(date_key, str) and len(date_key) >= 7 and date_key[:7] in allowed_months
-            }
-
-        loaded_dates = list(set(filtered_people_counts.keys()) | set(filtered_chats_counts.keys()))
-        loaded_min_date = min(loaded_dates) if loaded_dates else None
-        loaded_max_date = max(loaded_dates) if loaded_dates else None
-
-        series_cache_key = (user_code, 'full' if full_requested else f'months:{months_loaded}')
-        cache_mtime = os.path.getmtime(cache_path)
-
-        precomputed_trends = None
-        with people_talked_trends_series_cache_lock:
-            cached_series = people_talked_trends_series_cache.get(series_cache_key)
-            if cached_series and cached_series.get('mtime') == cache_mtime:
-                precomputed_trends = cached_series.get('value')
-
-        if precomputed_trends is None:
-            precomputed_trends = _build_people_talked_precomputed_trends(
-                filtered_people_counts,
-                filtered_chats_counts
-            )
-            with people_talked_trends_series_cache_lock:
-                people_talked_trends_series_cache[series_cache_key] = {
-                    'mtime': cache_mtime,
-                    'value': precomputed_trends
-                }
+        CACHE_REQUESTS.labels('people_talked_trends', 'hit').inc()
+        merged = merge_series(partitions, PEOPLE_TALKED_TREND_SERIES)
+        filtered_people_counts = merged['active_people_daily_counts']
+        filtered_chats_counts = merged['active_chats_daily_counts']
+        loaded_range = date_range(set(filtered_people_counts) | set(filtered_chats_counts))
+
+        precomputed_trends = _cached_precomputed_trends(
+            'people_talked_trends', user_code, full_requested, months_loaded, cache_dir, manifest,
+            lambda: _build_people_talked_precomputed_trends(filtered_people_counts, filtered_chats_counts)
+        )
 
         return jsonify({
             'data': {
-                'uploader_username': cached_payload.get('uploader_username'),
+                'uploader_username': manifest.get('uploader_username'),
                 'active_people_daily_counts': filtered_people_counts,
                 'active_chats_daily_counts': filtered_chats_counts
             },
             'cached': True,
-            'cache_file': cache_path,
+            'cache_file': cache_dir,
             'partial': not full_requested,
             'months_loaded': months_loaded,
             'total_months': len(month_keys),
             'month_keys': month_keys,
             'precomputed_trends': precomputed_trends,
-            'range': {
-                'min_date': min_date,
-                'max_date': max_date
-            },
-            'loaded_range': {
-                'min_date': loaded_min_date,
-                'max_date': loaded_max_date
-            }
+            'range': manifest.get('range') or date_range([]),
+            'loaded_range': loaded_range
         })
 
-    with people_talked_trends_jobs_lock:
-        existing_job = people_talked_trends_jobs.get(user_code)
-
-        if existing_job and existing_job.thread.is_alive():
-            elapsed = round(time.time() - existing_job.started_at, 2)
-            return jsonify({
-                'status': 'processing',
-                'message': 'People talked trends are still being computed',
-                'elapsed_seconds': elapsed
-            }), 202
-
-        if existing_job and existing_job.error:
-            last_error = existing_job.error
-            people_talked_trends_jobs.pop(user_code, None)
-            return jsonify({
-                'status': 'failed',
-                'error': f'Background computation failed: {last_error}'
-            }), 500
-
-        print(f"[CACHE MISS] Starting background people talked trends compute for user {user_code}")
-        worker = threading.Thread(target=_people_talked_trends_worker, args=(user_code,), daemon=True)
-        people_talked_trends_jobs[user_code] = GroupTrendsJob(thread=worker)
-        worker.start()
-
-    return jsonify({
-        'status': 'processing',
-        'message': 'Started background computation for people talked trends'
-    }), 202
+    return _background_job_response(user_code, 'people_talked_trends')
 
 
 @app.route('/api/convo_stats')
@@ -1708,46 +1971,300 @@ def api_convo_stats():
     user_code = session['user_code']
     stats_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_convo_stats.json')
 
-    if os.path.exists(stats_path):
+    # Stale caches (threads added or updated, or written before per-chat data) are dropped here.
+    if ensure_fresh(_user_path(user_code), 'convo_stats'):
         print(f"[CACHE HIT] Loading convo stats from cache for user {user_code}")
-        with open(stats_path, 'r') as f:
-            summary = json.load(f)
-        # Invalidate old caches that pre-date per-chat data
-        if 'per_chat_convos_per_day' not in summary:
-            print(f"[CACHE STALE] Invalidating old convo stats cache for user {user_code}")
-            os.remove(stats_path)
-        else:
-            return jsonify({'cached': True, 'data': summary})
-
-    # No cache yet – start background computation if not already running.
-    with convo_detection_jobs_lock:
-        existing_job = convo_detection_jobs.get(user_code)
-
-        if existing_job and existing_job.thread.is_alive():
-            elapsed = round(time.time() - existing_job.started_at, 2)
-            return jsonify({
-                'status': 'processing',
-                'message': 'Conversation stats are still being computed',
-                'elapsed_seconds': elapsed
-            }), 202
-
-        if existing_job and existing_job.error:
-            last_error = existing_job.error
-            convo_detection_jobs.pop(user_code, None)
-            return jsonify({
-                'status': 'failed',
-                'error': f'Background computation failed: {last_error}'
-            }), 500
-
-        print(f"[CACHE MISS] Starting background convo detection for user {user_code}")
-        worker = threading.Thread(target=_convo_detection_worker, args=(user_code,), daemon=True)
-        convo_detection_jobs[user_code] = ConvoDetectionJob(thread=worker)
-        worker.start()
+        CACHE_REQUESTS.labels('convo_stats', 'hit').inc()
+        summary = read_json(stats_path)
+        return jsonify({'cached': True, 'data': summary})
+
+    # No cache yet – hand off to the shared job scheduler.
+    return _background_job_response(user_code, 'convo_stats')
+
+
+MAX_SWEEP_VALUES = 200
+
+
+def _parse_threshold(name, value):
+    """Coerce a detect_conversations threshold from JSON, or raise ValueError."""
+    if isinstance(value, bool):
+        raise ValueError(name)
+    value = int(value) if name in INTEGER_THRESHOLDS else float(value)
+    if value < 0 or (name == 'min_messages' and value < 1):
+        raise ValueError(name)
+    return value
+
+
+@app.route('/api/convo_sweep', methods=['POST'])
+def api_convo_sweep():
+    """
+    Re-segment every thread under a range of values for one detect_conversations
+    threshold and return the total conversation count for each value. Uses the gap
+    arrays cached by the convo stats job, so no messages are reloaded.
+    """
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    param = data.get('param', 'cross_sender_multiplier')
+    values = data.get('values')
+    if param not in DEFAULT_CONVO_THRESHOLDS:
+        return jsonify({'error': f'Unknown threshold: {param}'}), 400
+    if not isinstance(values, list) or not values or len(values) > MAX_SWEEP_VALUES:
+        return jsonify({'error': f'values must be a list of 1 to {MAX_SWEEP_VALUES} numbers'}), 400
+
+    try:
+        thresholds = dict(DEFAULT_CONVO_THRESHOLDS)
+        for name, value in (data.get('thresholds') or {}).items():
+            if name in DEFAULT_CONVO_THRESHOLDS:
+                thresholds[name] = _parse_threshold(name, value)
+        values = [_parse_threshold(param, value) for value in values]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid threshold value'}), 400
+
+    user_code = session['user_code']
+    if not ensure_fresh(_user_path(user_code), 'convo_stats'):
+        # Gap arrays are written by the convo stats job.
+        return _background_job_response(user_code, 'convo_stats')
+
+    start = time.perf_counter()
+    inbox_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox')
+    thread_gaps = []
+    for conv in get_conversations(user_code):
+        gaps = load_thread_gaps(os.path.join(inbox_path, conv['id']))
+        if gaps:
+            thread_gaps.append(gaps)
+
+    threshold_sets = [threshold_tuple(dict(thresholds, **{param: value})) for value in values]
+    counts = sweep_conversation_totals(thread_gaps, threshold_sets)
 
     return jsonify({
-        'status': 'processing',
-        'message': 'Started background computation for conversation stats'
-    }), 202
+        'param': param,
+        'values': values,
+        'conversation_counts': counts,
+        'thresholds': thresholds,
+        'thread_count': len(thread_gaps),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+
+
+
+@app.route('/api/multitasking')
+def api_multitasking():
+    """
+    Cross-thread concurrency of the uploader's conversations: a sweep line over every
+    thread's cached session intervals (no messages are loaded). Cached until the
+    convo stats job rewrites cached_convo_stats.json.
+    """
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    user_code = session['user_code']
+    stats_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'cached_convo_stats.json')
+    if not ensure_fresh(_user_path(user_code), 'convo_stats'):
+        # Session metadata for every thread is written by the convo stats job.
+        return _background_job_response(user_code, 'convo_stats')
+
+    cache_key = ('multitasking', user_code, 'all')
+    stats_mtime = os.path.getmtime(stats_path)
+    result = series_cache.get(cache_key, stats_mtime)
+    if result is None:
+        uploader = load_uploader_name(user_code)
+        inbox_path = os.path.join(app.config['UPLOAD_FOLDER'], user_code, 'inbox')
+        conversations = get_conversations(user_code)
+        intervals = []
+        for conv in conversations:
+            index = load_session_index(os.path.join(inbox_path, conv['id']))
+            if index:
+                intervals.extend(session_intervals(conv['id'], index, participant=uploader))
+
+        result = sweep_concurrency(intervals)
+        titles = {conv['id']: conv['title'] for conv in conversations}
+        for pair in result['top_overlapping_threads']:
+            pair['threads'] = [{'id': thread_id, 'title': titles.get(thread_id, thread_id)} for thread_id in pair['threads']]
+        result['uploader_username'] = uploader
+        series_cache.put(cache_key, stats_mtime, result)
+
+    return jsonify({'cached': True, 'data': result})
+
+@app.route('/api/jobs')
+def api_jobs():
+    """List the current user's background jobs."""
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    return jsonify({
+        'jobs': job_scheduler.jobs_for_user(session['user_code']),
+        'queue_depth': job_scheduler.queue_depth()
+    })
+
+
+@app.route('/api/jobs/<job_type>')
+def api_job_status(job_type):
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if job_type not in BACKGROUND_JOBS:
+        return jsonify({'error': 'Unknown job type'}), 404
+
+    status = job_scheduler.status(session['user_code'], job_type)
+    if not status:
+        return jsonify({'job_type': job_type, 'state': None})
+    return jsonify(status)
+
+
+@app.route('/api/jobs/<job_type>/stream')
+def api_job_stream(job_type):
+    """
+    Server-Sent Events stream of one background job's progress.
+    Emits `progress` events as the job advances and a final `complete` event
+    once it reaches a terminal state (or when no job exists).
+    """
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if job_type not in BACKGROUND_JOBS:
+        return jsonify({'error': 'Unknown job type'}), 404
+
+    user_code = session['user_code']
+    job = job_scheduler.get(user_code, job_type)
+
+    def _event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate_remote():
+        # The job belongs to another server process: follow it through the shared registry.
+        last_seen = None
+        idle_since = time.time()
+        while True:
+            snapshot = job_scheduler.status(user_code, job_type)
+            if not snapshot or snapshot['state'] in TERMINAL_JOB_STATES:
+                yield _event('complete', snapshot or {'job_type': job_type, 'state': None})
+                return
+            seen = (snapshot['state'], snapshot['attempts'], snapshot['progress']['done'], snapshot['progress']['phase'])
+            if seen != last_seen:
+                last_seen = seen
+                idle_since = time.time()
+                yield _event('progress', snapshot)
+            elif time.time() - idle_since >= SSE_KEEPALIVE_SECONDS:
+                idle_since = time.time()
+                yield ': keepalive\n\n'
+            time.sleep(SSE_REMOTE_POLL_SECONDS)
+
+    def generate():
+        if not job:
+            yield from generate_remote()
+            return
+
+        version = -1
+        while True:
+            snapshot = job.to_dict()
+            if snapshot['state'] in TERMINAL_JOB_STATES:
+                yield _event('complete', snapshot)
+                return
+            if job.version != version:
+                version = job.version
+                yield _event('progress', snapshot)
+            else:
+                # Comment line keeps proxies from closing an idle stream.
+                yield ': keepalive\n\n'
+            job.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/jobs/<job_type>/cancel', methods=['POST'])
+def api_job_cancel(job_type):
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if job_type not in BACKGROUND_JOBS:
+        return jsonify({'error': 'Unknown job type'}), 404
+
+    if not job_scheduler.cancel(session['user_code'], job_type):
+        return jsonify({'error': 'No active job to cancel'}), 404
+    return jsonify({'success': True})
+
+
+def _is_admin_request():
+    """Admin endpoints are disabled unless ADMIN_TOKEN is configured."""
+    admin_token = app.config.get('ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    provided = request.headers.get('X-Admin-Token') or request.args.get('token') or ''
+    return secrets.compare_digest(provided, admin_token)
+
+
+@app.route('/api/storage')
+def api_storage():
+    """Bytes stored for the current user code, by category."""
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    usage = storage_ledger.usage(session['user_code'])
+    return jsonify({
+        'usage': usage,
+        'total': sum(usage.values()),
+        'evictable': sum(usage.get(category, 0) for category in EVICTABLE_CATEGORIES),
+        'quota': app.config['USER_QUOTA_BYTES'] or None
+    })
+
+
+@app.route('/api/admin/storage')
+def api_admin_storage():
+    """Totals by category and the user codes using the most disk."""
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 500)
+    return jsonify({
+        'totals': storage_ledger.totals(),
+        'top_users': storage_ledger.top_users(limit),
+        'quota': app.config['USER_QUOTA_BYTES'] or None
+    })
+
+
+@app.route('/api/admin/cache_stats')
+def api_admin_cache_stats():
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        'series_cache': series_cache.stats(),
+        'columns_cache': columns_cache.stats(),
+        'expiry': expiry_index.stats(time.time()),
+        'game': game_cache_stats()
+    })
+
+
+@app.route('/api/admin/profiles')
+def api_admin_profiles():
+    """Profiles in the diagnostics folder, newest first."""
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    folder = app.config['DIAGNOSTICS_FOLDER']
+    profiles = []
+    for name in sorted(os.listdir(folder), reverse=True):
+        if name.endswith(PROFILE_SUFFIX):
+            profiles.append({'name': name, 'bytes': os.path.getsize(os.path.join(folder, name))})
+    return jsonify({'profiles': profiles})
+
+
+@app.route('/api/admin/profiles/<name>')
+def api_admin_profile(name):
+    """One profile, as collapsed stacks for flamegraph.pl or speedscope."""
+    if not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    if not name.endswith(PROFILE_SUFFIX):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(os.path.abspath(app.config['DIAGNOSTICS_FOLDER']), name, mimetype='text/plain')
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text format metrics for every server process."""
+    if not app.config['METRICS_PUBLIC'] and not _is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(render_metrics(collect_metrics()), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/logout')
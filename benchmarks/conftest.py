@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The tests import the app's top-level modules, like the benchmark scripts beside them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+"""
+Time the density_finder_rs and density_numpy backends on synthetic threads.
+
+    python benchmarks/density_bench.py [--sizes 1000,10000,100000,1000000] [--repeat 3] [--json out.json]
+
+Prints the best of `--repeat` runs per function, thread size and backend (backends that
+are not installed are skipped), and optionally writes the same numbers as JSON.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from density_parity import backend_calls, parse_sizes  # noqa: E402
+from synthetic_threads import make_thread  # noqa: E402
+
+# Imported directly rather than through density_backend, so both can be timed side by side.
+BACKEND_MODULES = {'rust': 'density_finder_rs', 'numpy': 'density_numpy'}
+
+
+def best_time(call, backend, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call(backend)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=parse_sizes, default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--participants', type=int, default=3)
+    parser.add_argument('--only', help='comma-separated function names to time')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    backends = {}
+    for name, module in BACKEND_MODULES.items():
+        try:
+            backends[name] = importlib.import_module(module)
+        except ImportError:
+            print(f"[BENCH] Skipping {name}: {module} is not installed")
+    only = set(args.only.split(',')) if args.only else None
+
+    results = []
+    for size in args.sizes:
+        participants = [f'user_{i}' for i in range(args.participants)]
+        messages = make_thread(size, participants=args.participants)
+        print(f"\n{size} messages")
+        print(f"  {'function':<42}" + ''.join(f'{name:>12}' for name in backends))
+        for name, call in backend_calls(messages, participants):
+            if only and name not in only:
+                continue
+            timings = {backend: best_time(call, module, args.repeat) for backend, module in backends.items()}
+            results.append({'function': name, 'messages': size, 'seconds': timings})
+            print(f"  {name:<42}" + ''.join(f'{timings[backend] * 1000:>10.2f}ms' for backend in backends))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'repeat': args.repeat, 'participants': args.participants, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
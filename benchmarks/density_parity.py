@@ -0,0 +1,92 @@
+"""
+Check that density_numpy returns exactly what density_finder_rs does on synthetic threads.
+
+    python benchmarks/density_parity.py [--sizes 1000,10000,100000] [--seeds 3]
+
+Exits non-zero on the first size/seed where any function disagrees. Emoji counting is
+not compared: the NumPy backend classifies emojis with the `emoji` package rather than
+the Rust `emojis` crate.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_columns import MessageColumns  # noqa: E402
+from synthetic_threads import make_thread  # noqa: E402
+
+THRESHOLD_SETS = [
+    (1.5, 3.0, 60_000, 120_000, 3),
+    (1.0, 2.0, 30_000, 60_000, 2),
+    (3.0, 5.0, 300_000, 600_000, 5),
+]
+
+
+def backend_calls(messages, participants):
+    """(name, fn(backend)) for every density function, on one thread."""
+    columns = MessageColumns(messages)
+    sender = participants[0]
+    sender_id = columns.sender_id(sender)
+    daily = lambda b: b.aggregate_daily_counts(messages)  # noqa: E731
+    gaps = lambda b: b.extract_conversation_gaps(messages)  # noqa: E731
+    return [
+        ('find_highest_density_period', lambda b: b.find_highest_density_period(messages, 7)),
+        ('find_participant_density_period/max', lambda b: b.find_participant_density_period(messages, 7, sender, True)),
+        ('find_participant_density_period/min', lambda b: b.find_participant_density_period(messages, 7, sender, False)),
+        ('compute_top_words', lambda b: b.compute_top_words(messages, 20)),
+        ('count_specific_string', lambda b: b.count_specific_string(messages, 'lol')),
+        ('aggregate_daily_counts', daily),
+        ('split_sent_received_daily_counts', lambda b: b.split_sent_received_daily_counts(messages, sender)),
+        ('build_group_chat_trends_series', lambda b: b.build_group_chat_trends_series([{'daily_counts': daily(b)}])),
+        ('build_uploader_trends_series', lambda b: b.build_uploader_trends_series(*b.split_sent_received_daily_counts(messages, sender))),
+        ('detect_conversations', lambda b: b.detect_conversations(messages)),
+        ('extract_conversation_gaps', gaps),
+        ('sweep_conversation_counts', lambda b: b.sweep_conversation_counts(*gaps(b), THRESHOLD_SETS)),
+        ('find_highest_density_period_columns', lambda b: b.find_highest_density_period_columns(columns.timestamps, 7)),
+        ('find_participant_density_period_columns', lambda b: b.find_participant_density_period_columns(columns.timestamps, columns.sender_ids, 7, sender_id, True)),
+        ('compute_top_words_columns', lambda b: b.compute_top_words_columns(columns.content_offsets, columns.content, 20)),
+        ('count_specific_string_columns', lambda b: b.count_specific_string_columns(columns.content_offsets, columns.content, 'lol')),
+        ('aggregate_daily_counts_columns', lambda b: b.aggregate_daily_counts_columns(columns.timestamps)),
+        ('extract_conversation_gaps_columns', lambda b: b.extract_conversation_gaps_columns(columns.timestamps, columns.sender_ids)),
+        ('detect_conversations_columns', lambda b: b.detect_conversations_columns(columns.timestamps, columns.sender_ids, columns.senders)),
+    ]
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=parse_sizes, default=[1_000, 10_000, 100_000])
+    parser.add_argument('--seeds', type=int, default=3)
+    args = parser.parse_args()
+
+    try:
+        import density_finder_rs
+    except ImportError:
+        sys.exit('density_finder_rs is not installed; build it with `maturin develop --release` first')
+    import density_numpy
+
+    failures = 0
+    for size in args.sizes:
+        for seed in range(args.seeds):
+            participants = [f'user_{i}' for i in range(2 + seed % 4)]
+            messages = make_thread(size, participants=len(participants), seed=seed)
+            for name, call in backend_calls(messages, participants):
+                expected, actual = call(density_finder_rs), call(density_numpy)
+                if expected != actual:
+                    failures += 1
+                    print(f"[PARITY] {name} differs for {size} messages (seed {seed})")
+                    print(f"  rust:  {str(expected)[:300]}")
+                    print(f"  numpy: {str(actual)[:300]}")
+            print(f"[PARITY] {size} messages, seed {seed}: checked")
+
+    if failures:
+        sys.exit(f'{failures} mismatches')
+    print("[PARITY] All functions match")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""
+End-to-end benchmark: upload a (synthetic) Instagram export through the chunked upload
+API, then time every /api/* endpoint cold and warm, the background trend jobs and the
+guessing game. Results are printed and written as JSON for regression tracking.
+
+    python benchmarks/e2e_bench.py --threads 30 --messages 3000 --json results.json
+    python benchmarks/e2e_bench.py --export my_export.zip --url http://localhost:7000 --admin-token ...
+
+By default the app runs in this process (Flask test client) with its data in a temporary
+directory; --url benchmarks a running server instead. "cold" is the first request after
+ingest, "warm" the min / median / max of --warm-runs repeats. Endpoints answering 202
+while a background job runs are polled, so their cold time is the job's time.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import secrets
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from export_generator import add_generator_arguments, generate_export, generator_options  # noqa: E402
+
+# The upload page sends 10MB chunks (templates/index.html).
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+
+TREND_ENDPOINTS = (
+    '/api/group_chat_trends',
+    '/api/uploader_message_trends',
+    '/api/people_talked_trends',
+    '/api/convo_stats',
+)
+GAME_MODES = ('message', 'stats')
+GAME_DIFFICULTIES = ('easy', 'medium', 'hard')
+
+
+class InProcessClient:
+    """The app imported into this process, driven through Flask's test client."""
+    def __init__(self, workdir):
+        os.makedirs(workdir, exist_ok=True)
+        os.chdir(workdir)  # the app keeps its data folders relative to the working directory
+        os.environ.setdefault('ADMIN_TOKEN', secrets.token_hex(16))
+        sys.path.insert(0, REPO_DIR)
+        import app as app_module
+        import density_backend
+        self.app = app_module.app
+        self.client = self.app.test_client()
+        self.admin_token = self.app.config['ADMIN_TOKEN']
+        self.passcode = self.app.config['COMPUTE_PASSCODE']
+        self.backend = density_backend.BACKEND_NAME
+
+    def request(self, method, path, json_body=None, data=None, form=None, headers=None):
+        response = self.client.open(path, method=method, json=json_body, data=form if form is not None else data, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """A running server, with a cookie jar for the session."""
+    def __init__(self, base_url, admin_token=None, passcode=None):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.admin_token = admin_token
+        self.passcode = passcode
+        self.backend = None
+
+    def request(self, method, path, json_body=None, data=None, form=None, headers=None):
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif data is not None:
+            headers['Content-Type'] = 'application/octet-stream'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+
+class Recorder:
+    def __init__(self, client, warm_runs, job_timeout):
+        self.client = client
+        self.warm_runs = warm_runs
+        self.job_timeout = job_timeout
+        self.results = []
+
+    def _timed(self, method, path, **kwargs):
+        started = time.perf_counter()
+        status, body = self.client.request(method, path, **kwargs)
+        return time.perf_counter() - started, status, body
+
+    def _until_ready(self, method, path, **kwargs):
+        """Repeat a request while it answers 202; returns (total seconds, polls, status, body)."""
+        started = time.perf_counter()
+        polls = 0
+        while True:
+            polls += 1
+            status, body = self.client.request(method, path, **kwargs)
+            if status != 202 or time.perf_counter() - started > self.job_timeout:
+                return time.perf_counter() - started, polls, status, body
+            time.sleep(0.05)
+
+    def once(self, name, method, path, extra=None, **kwargs):
+        seconds, status, body = self._timed(method, path, **kwargs)
+        self.add(dict({'name': name, 'method': method, 'path': path, 'status': status, 'seconds': seconds}, **(extra or {})))
+        return status, body
+
+    def cold_warm(self, name, method, path, wait=False, extra=None, **kwargs):
+        """Time the first request (polling through 202s when `wait`), then --warm-runs repeats."""
+        result = {'name': name, 'method': method, 'path': path}
+        if wait:
+            seconds, polls, status, body = self._until_ready(method, path, **kwargs)
+            result['polls'] = polls
+        else:
+            seconds, status, body = self._timed(method, path, **kwargs)
+        result.update(status=status, cold_seconds=seconds)
+
+        warm = []
+        for _ in range(self.warm_runs):
+            seconds, warm_status, _ = self._timed(method, path, **kwargs)
+            warm.append(seconds)
+            if warm_status != status:
+                result['warm_status'] = warm_status
+        if warm:
+            result['warm_seconds'] = {'min': min(warm), 'median': statistics.median(warm), 'max': max(warm), 'runs': len(warm)}
+        result.update(extra or {})
+        self.add(result)
+        return status, body
+
+    def add(self, result):
+        self.results.append(result)
+        cold = result.get('cold_seconds', result.get('seconds'))
+        warm = result.get('warm_seconds', {}).get('median')
+        warm_text = f'{warm * 1000:10.1f}ms' if warm is not None else ' ' * 12
+        print(f"  {result['name']:<52} {result['status']:>4} {cold * 1000:10.1f}ms {warm_text}")
+
+
+def upload_export(recorder, client, export_path, access_code, chunk_size):
+    """Chunked upload of export_path under access_code; returns the /upload/complete body."""
+    file_size = os.path.getsize(export_path)
+    total_chunks = max(1, -(-file_size // chunk_size))
+    status, body = recorder.once('upload.init', 'POST', '/upload/init', json_body={
+        'access_code': access_code, 'filename': os.path.basename(export_path),
+        'total_chunks': total_chunks, 'file_size': file_size,
+    })
+    if status != 200:
+        raise RuntimeError(f'/upload/init failed: {status} {body}')
+
+    started = time.perf_counter()
+    with open(export_path, 'rb') as f:
+        for chunk_number in range(total_chunks):
+            status, body = client.request(
+                'POST', f'/upload/chunk?upload_id={access_code}&chunk_number={chunk_number}', data=f.read(chunk_size)
+            )
+            if status != 200:
+                raise RuntimeError(f'/upload/chunk {chunk_number} failed: {status} {body}')
+    seconds = time.perf_counter() - started
+    recorder.add({
+        'name': 'upload.chunks', 'method': 'POST', 'path': '/upload/chunk', 'status': 200, 'seconds': seconds,
+        'chunks': total_chunks, 'bytes': file_size, 'mb_per_second': file_size / 1e6 / seconds if seconds else None,
+    })
+
+    status, body = recorder.once('upload.complete (ingest)', 'POST', '/upload/complete', json_body={'upload_id': access_code})
+    if status != 200:
+        raise RuntimeError(f'/upload/complete failed: {status} {body}')
+    return body
+
+
+def bench_threads(recorder, conversations, sample_size, passcode):
+    """Thread analysis cold for every thread, then the per-thread endpoints on the largest ones."""
+    sizes = {}
+    for conv in conversations:
+        status, body = recorder.once(
+            'GET /api/conversation/<id> (cold)', 'GET', f"/api/conversation/{urllib.parse.quote(conv['id'])}",
+            extra={'thread': conv['id']}
+        )
+        if status == 200 and body:
+            sizes[conv['id']] = recorder.results[-1]['messages'] = body.get('total_messages', 0)
+
+    sample = sorted(sizes, key=sizes.get, reverse=True)[:sample_size]
+    for thread_id in sample:
+        quoted = urllib.parse.quote(thread_id)
+        participants = [p.get('name') for conv in conversations if conv['id'] == thread_id for p in conv.get('participants', [])]
+        extra = {'thread': thread_id, 'messages': sizes[thread_id]}
+        recorder.cold_warm('GET /api/conversation/<id> (cached)', 'GET', f'/api/conversation/{quoted}', extra=extra)
+        recorder.cold_warm('GET /api/conversation/<id>/sessions', 'GET', f'/api/conversation/{quoted}/sessions?limit=50', extra=extra)
+        for find_max in (True, False):
+            recorder.cold_warm(f'POST /api/participant_period (find_max={find_max})', 'POST', '/api/participant_period', extra=extra, json_body={
+                'conversation_id': thread_id, 'participant': participants[0] if participants else '', 'days': 7, 'find_max': find_max,
+            })
+        recorder.cold_warm('POST /api/custom_density', 'POST', '/api/custom_density', extra=extra, json_body={'conversation_id': thread_id, 'days': 7})
+        recorder.cold_warm('POST /api/compute_word', 'POST', '/api/compute_word', extra=extra, json_body={'conversation_id': thread_id, 'passcode': passcode})
+        recorder.cold_warm('POST /api/compute_emoji', 'POST', '/api/compute_emoji', extra=extra, json_body={'conversation_id': thread_id})
+        recorder.cold_warm('POST /api/count_specific_string', 'POST', '/api/count_specific_string', extra=extra, json_body={'conversation_id': thread_id, 'string': 'lol'})
+    return sample
+
+
+def bench_game(recorder, rounds_per_mode):
+    recorder.cold_warm('GET /api/game/options', 'GET', '/api/game/options')
+    round_ids = []
+    for mode in GAME_MODES:
+        for difficulty in GAME_DIFFICULTIES:
+            status, body = recorder.cold_warm(f'POST /api/game/round ({mode}/{difficulty})', 'POST', '/api/game/round', json_body={'mode': mode, 'difficulty': difficulty})
+            if status == 200 and body:
+                round_ids.append(body['round_id'])
+        recorder.cold_warm(f'POST /api/game/rounds ({mode}, count={rounds_per_mode})', 'POST', '/api/game/rounds', json_body={'mode': mode, 'count': rounds_per_mode})
+    if round_ids:
+        recorder.cold_warm('POST /api/game/guess', 'POST', '/api/game/guess', json_body={'round_id': round_ids[0], 'conversation_id': 'not-a-thread'})
+
+
+def bench_user_endpoints(recorder, client):
+    for path in TREND_ENDPOINTS:
+        recorder.cold_warm(f'GET {path}', 'GET', path, wait=True)
+    recorder.cold_warm('GET /api/group_chat_trends?full=1', 'GET', '/api/group_chat_trends?full=1', wait=True)
+    recorder.cold_warm('GET /api/multitasking', 'GET', '/api/multitasking', wait=True)
+    recorder.cold_warm('POST /api/convo_sweep', 'POST', '/api/convo_sweep', wait=True, json_body={
+        'param': 'cross_sender_multiplier', 'values': [1.0, 2.0, 3.0, 4.0, 6.0],
+    })
+    recorder.cold_warm('GET /api/jobs', 'GET', '/api/jobs')
+    recorder.cold_warm('GET /api/jobs/convo_stats', 'GET', '/api/jobs/convo_stats')
+    recorder.cold_warm('GET /api/storage', 'GET', '/api/storage')
+    if client.admin_token:
+        headers = {'X-Admin-Token': client.admin_token}
+        recorder.cold_warm('GET /api/admin/storage', 'GET', '/api/admin/storage', headers=headers)
+        recorder.cold_warm('GET /api/admin/cache_stats', 'GET', '/api/admin/cache_stats', headers=headers)
+
+
+def bench_shared_chat(recorder, client, access_code, thread_id):
+    """Share a thread to a second code and open it there, which reuses the shared analysis."""
+    target_code = f'{access_code}-shared'
+    recorder.once('POST /api/share_chat', 'POST', '/api/share_chat', json_body={'conversation_id': thread_id, 'target_code': target_code})
+    client.request('POST', '/login', form={'code': target_code})
+    recorder.once('GET /api/conversation/<id> (shared copy, cold)', 'GET', f'/api/conversation/{urllib.parse.quote(thread_id)}')
+    recorder.once('POST /api/delete_account (shared copy)', 'POST', '/api/delete_account')
+    client.request('POST', '/login', form={'code': access_code})
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--export', help='upload this export zip instead of generating one')
+    parser.add_argument('--url', help='benchmark a running server instead of an in-process app')
+    parser.add_argument('--admin-token', help='X-Admin-Token for /api/admin/* (with --url)')
+    parser.add_argument('--passcode', help='COMPUTE_PASSCODE for /api/compute_word on large threads (with --url)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--warm-runs', type=int, default=5)
+    parser.add_argument('--sample-threads', type=int, default=3, help='largest threads to run the per-thread endpoints on')
+    parser.add_argument('--game-batch', type=int, default=5)
+    parser.add_argument('--job-timeout', type=float, default=600.0)
+    parser.add_argument('--keep', action='store_true', help='keep the uploaded data (and the temporary directory)')
+    parser.add_argument('--json', help='write results to this file')
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    workdir = tempfile.mkdtemp(prefix='chv-bench-')
+    meta = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'warm_runs': args.warm_runs,
+        'chunk_size': args.chunk_size,
+    }
+    try:
+        if args.export:
+            export_path = os.path.abspath(args.export)
+            meta['export'] = {'path': export_path, 'bytes': os.path.getsize(export_path)}
+        else:
+            export_path = os.path.join(workdir, 'export.zip')
+            options = generator_options(args)
+            started = time.perf_counter()
+            meta['export'] = dict(generate_export(export_path, **options), options=options, generate_seconds=time.perf_counter() - started)
+        print(f"[BENCH] Export: {meta['export']}")
+
+        if args.url:
+            client = HttpClient(args.url, args.admin_token, args.passcode)
+            meta['target'] = args.url
+        else:
+            client = InProcessClient(os.path.join(workdir, 'app'))
+            meta['target'] = 'in-process'
+        meta['density_backend'] = client.backend
+
+        recorder = Recorder(client, args.warm_runs, args.job_timeout)
+        access_code = f'bench{secrets.token_hex(6)}'
+        print(f"  {'name':<52} {'code':>4} {'cold':>12} {'warm p50':>12}")
+        complete = upload_export(recorder, client, export_path, access_code, args.chunk_size)
+        if complete.get('needs_username'):
+            client.request('POST', '/upload/set_me', json_body={'code': access_code, 'username': meta['export'].get('uploader', 'bench_user')})
+
+        recorder.cold_warm('GET /api/auth-status', 'GET', '/api/auth-status')
+        _, conversations = recorder.cold_warm('GET /api/conversations', 'GET', '/api/conversations')
+        sample = bench_threads(recorder, conversations or [], args.sample_threads, client.passcode)
+        bench_user_endpoints(recorder, client)
+        bench_game(recorder, args.game_batch)
+        if sample:
+            bench_shared_chat(recorder, client, access_code, sample[0])
+        if not args.keep:
+            recorder.once('POST /api/delete_account', 'POST', '/api/delete_account')
+
+        report = {'meta': meta, 'results': recorder.results}
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"[BENCH] Wrote {json_path}")
+    finally:
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f"[BENCH] Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Generate a synthetic Instagram data export for benchmarking.
+
+    python benchmarks/export_generator.py export.zip --threads 50 --messages 2000 --group-ratio 0.3
+
+Writes the export layout the upload flow expects,
+your_instagram_activity/messages/inbox/<thread>/message_N.json, either as a zip (when the
+output ends in .zip) or as a directory tree. Like real exports, text is stored as
+latin-1 escaped UTF-8, message_1.json holds the newest messages and long threads are
+split into several files.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_threads import MEDIA_KINDS, make_thread  # noqa: E402
+
+EXPORT_ROOT = 'your_instagram_activity'
+INBOX_PATH = f'{EXPORT_ROOT}/messages/inbox'
+
+FIRST_NAMES = ('alex', 'sam', 'jordan', 'taylor', 'casey', 'morgan', 'riley', 'jamie', 'quinn', 'avery', 'drew', 'kai')
+
+# Stand-in bytes for media files when they are written (--write-media).
+MEDIA_BYTES = 2048
+
+
+def _instagram_encode(value):
+    """Instagram's export encoding: every UTF-8 byte of a string as its own \\u00XX escape."""
+    if isinstance(value, str):
+        return value.encode('utf-8').decode('latin-1')
+    if isinstance(value, list):
+        return [_instagram_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _instagram_encode(v) for k, v in value.items()}
+    return value
+
+
+def _thread_size(rng, mean, spread):
+    """Messages in one thread: log-normal around `mean` (spread 0 gives every thread `mean`)."""
+    if spread <= 0:
+        return mean
+    return max(1, int(rng.lognormvariate(math.log(mean) - spread ** 2 / 2, spread)))
+
+
+def _media_items(messages):
+    for message in messages:
+        for kind in MEDIA_KINDS:
+            yield from message.get(kind, ())
+
+
+def generate_threads(threads=20, messages_per_thread=2000, size_spread=1.0, group_ratio=0.3,
+                     max_group_size=8, burstiness=0.95, emoji_rate=0.1, media_ratio=0.05,
+                     uploader='bench_user', seed=0):
+    """Yield (thread_id, title, participants, messages) with messages sorted oldest first."""
+    rng = random.Random(seed)
+    for index in range(threads):
+        if rng.random() < group_ratio:
+            others = [f'{rng.choice(FIRST_NAMES)}_{index}_{n}' for n in range(rng.randint(2, max(max_group_size - 1, 2)))]
+            title = f'Group {index}'
+        else:
+            others = [f'{rng.choice(FIRST_NAMES)}_{index}']
+            title = others[0]
+        participants = others + [uploader]
+        thread_id = f"{title.lower().replace(' ', '')}_{1000000000 + index}"
+        messages = make_thread(
+            _thread_size(rng, messages_per_thread, size_spread), seed=rng.randrange(2 ** 32),
+            emoji_rate=emoji_rate, burstiness=burstiness, media_ratio=media_ratio,
+            senders=participants, uploader=uploader
+        )
+        for uri_owner in _media_items(messages):
+            uri_owner['uri'] = f"{INBOX_PATH}/{thread_id}/{uri_owner['uri']}"  # exports use full paths
+        yield thread_id, title, participants, messages
+
+
+def _thread_files(thread_id, title, participants, messages, messages_per_file):
+    """(name, JSON bytes) per message file, message_1.json holding the newest messages."""
+    newest_first = messages[::-1]
+    for number, start in enumerate(range(0, max(len(newest_first), 1), messages_per_file), 1):
+        payload = _instagram_encode({
+            'participants': [{'name': name} for name in participants],
+            'messages': newest_first[start:start + messages_per_file],
+            'title': title,
+            'is_still_participant': True,
+            'thread_path': f'inbox/{thread_id}',
+        })
+        yield f'message_{number}.json', json.dumps(payload, indent=2).encode('ascii')
+
+
+def generate_export(output, messages_per_file=10000, write_media=False, **thread_options):
+    """
+    Write an export to `output` (.zip or directory). Returns a summary with the thread,
+    message and file counts, the uploader name and the bytes written.
+    """
+    as_zip = output.endswith('.zip')
+    summary = {'threads': 0, 'messages': 0, 'files': 0, 'uploader': thread_options.get('uploader', 'bench_user')}
+    archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) if as_zip else None
+
+    def write(relative_path, data):
+        summary['files'] += 1
+        if archive is not None:
+            archive.writestr(relative_path, data)
+            return
+        path = os.path.join(output, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    try:
+        for thread_id, title, participants, messages in generate_threads(**thread_options):
+            thread_path = f'{INBOX_PATH}/{thread_id}'
+            for name, data in _thread_files(thread_id, title, participants, messages, messages_per_file):
+                write(f'{thread_path}/{name}', data)
+            if write_media:
+                for item in _media_items(messages):
+                    write(item['uri'], os.urandom(MEDIA_BYTES))
+            summary['threads'] += 1
+            summary['messages'] += len(messages)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if as_zip:
+        summary['bytes'] = os.path.getsize(output)
+    else:
+        summary['bytes'] = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(output) for name in names)
+    return summary
+
+
+def add_generator_arguments(parser):
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=2000, help='mean messages per thread')
+    parser.add_argument('--size-spread', type=float, default=1.0, help='log-normal sigma of thread sizes; 0 = all equal')
+    parser.add_argument('--group-ratio', type=float, default=0.3, help='share of threads that are group chats')
+    parser.add_argument('--max-group-size', type=int, default=8)
+    parser.add_argument('--burstiness', type=float, default=0.95, help='share of messages continuing a burst')
+    parser.add_argument('--emoji-rate', type=float, default=0.1)
+    parser.add_argument('--media-ratio', type=float, default=0.05)
+    parser.add_argument('--messages-per-file', type=int, default=10000, help='split threads into message_N.json files of this size')
+    parser.add_argument('--write-media', action='store_true', help='also write placeholder media files')
+    parser.add_argument('--uploader', default='bench_user')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generator_options(args):
+    """generate_export keyword arguments from parsed add_generator_arguments options."""
+    return {
+        'threads': args.threads,
+        'messages_per_thread': args.messages,
+        'size_spread': args.size_spread,
+        'group_ratio': args.group_ratio,
+        'max_group_size': args.max_group_size,
+        'burstiness': args.burstiness,
+        'emoji_rate': args.emoji_rate,
+        'media_ratio': args.media_ratio,
+        'messages_per_file': args.messages_per_file,
+        'write_media': args.write_media,
+        'uploader': args.uploader,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help='export.zip or a directory')
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(generate_export(args.output, **generator_options(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import random
+
+
+WORDS = (
+    'hey', 'lol', 'ok', 'what', 'tonight', 'dinner', 'meeting', 'sure', 'haha', 'yes', 'no',
+    'maybe', 'later', 'thanks', 'love', 'that', 'game', 'movie', 'work', 'tomorrow',
+)
+EMOJIS = ('😂', '❤', '👍', '😭', '🔥', '🙏', '😊')
+MEDIA_KINDS = ('photos', 'videos', 'audio_files')
+
+# Content Instagram gives the uploader's shared posts; the app detects the uploader by it.
+ATTACHMENT_MARKER = 'You sent an attachment.'
+
+START_MS = 1_600_000_000_000
+
+
+def make_thread(message_count, participants=3, seed=0, emoji_rate=0.1, burstiness=0.95,
+                media_ratio=0.0, senders=None, uploader=None):
+    """
+    A time-sorted Instagram-style message list: bursts of quick back-and-forth separated by
+    gaps of hours to days, so density windows and conversation detection have structure.
+
+    burstiness: share of messages that continue a burst (mean burst length 1 / (1 - burstiness))
+    media_ratio: share of messages that are a photo, video or voice message instead of text;
+        media entries carry a uri relative to the thread folder (e.g. photos/12.jpg)
+    senders: sender names (default user_0 .. user_{participants - 1})
+    uploader: sender whose media is sometimes a shared post with ATTACHMENT_MARKER content
+    """
+    rng = random.Random(seed)
+    senders = list(senders) if senders else [f'user_{i}' for i in range(participants)]
+    messages = []
+    ts = START_MS + rng.randint(0, 30 * 86_400_000)
+    sender = senders[0]
+    for index in range(message_count):
+        if rng.random() < burstiness:
+            ts += int(rng.expovariate(1 / 45_000))
+        else:
+            ts += rng.randint(3_600_000, 3 * 86_400_000)  # quiet period before a new burst
+        if rng.random() < 0.6:
+            sender = rng.choice(senders)
+
+        message = {'sender_name': sender, 'timestamp_ms': ts}
+        if rng.random() < media_ratio:
+            if sender == uploader and rng.random() < 0.3:
+                message['content'] = ATTACHMENT_MARKER
+                message['share'] = {'link': f'https://www.instagram.com/p/{index:x}/'}
+            else:
+                kind = rng.choice(MEDIA_KINDS)
+                extension = {'photos': 'jpg', 'videos': 'mp4', 'audio_files': 'mp4'}[kind]
+                message[kind] = [{'uri': f'{kind}/{index}.{extension}', 'creation_timestamp': ts // 1000}]
+        else:
+            words = rng.choices(WORDS, k=rng.randint(1, 8))
+            if rng.random() < emoji_rate:
+                words.append(rng.choice(EMOJIS))
+            message['content'] = ' '.join(words)
+        messages.append(message)
+    return messages
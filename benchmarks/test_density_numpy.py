@@ -0,0 +1,118 @@
+"""
+The NumPy density backend against hand-computed results, so the backend the app
+falls back to is checked even where density_finder_rs is not built.
+
+    python -m pytest benchmarks/test_density_numpy.py
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import density_numpy  # noqa: E402
+from message_columns import MessageColumns  # noqa: E402
+
+MONDAY_MS = 1_600_041_600_000  # 2020-09-14T00:00:00Z
+HOUR_MS = 3_600_000
+DAY_MS = 24 * HOUR_MS
+
+
+def _messages(rows):
+    """[(offset_ms, sender, content), ...] -> export-style messages from MONDAY_MS."""
+    return [
+        {'timestamp_ms': MONDAY_MS + offset, 'sender_name': sender, 'content': content}
+        for offset, sender, content in rows
+    ]
+
+
+def test_highest_density_window():
+    # A quiet first message, a four-message burst a day later, then a straggler.
+    messages = _messages([(hours * HOUR_MS, 'a', 'hi') for hours in (0, 30, 31, 32, 33, 80)])
+    expected = (MONDAY_MS + 30 * HOUR_MS, MONDAY_MS + 33 * HOUR_MS)
+    assert density_numpy.find_highest_density_period(messages, 1) == expected
+
+    timestamps = MessageColumns(messages).timestamps
+    assert density_numpy.find_highest_density_period_columns(timestamps, 1) == expected
+
+
+def test_participant_density_window():
+    messages = _messages([
+        (0, 'a', 'x'), (HOUR_MS, 'b', 'x'), (2 * HOUR_MS, 'a', 'x'), (3 * HOUR_MS, 'a', 'x'),
+        (48 * HOUR_MS, 'a', 'x'), (49 * HOUR_MS, 'b', 'x'), (72 * HOUR_MS, 'b', 'x'),
+    ])
+    # Windows may start at the first five messages; the one at 0h holds three of a's.
+    assert density_numpy.find_participant_density_period(messages, 1, 'a', True) == (MONDAY_MS, MONDAY_MS + 3 * HOUR_MS)
+    # The first window with a single message from a starts at 3h.
+    assert density_numpy.find_participant_density_period(messages, 1, 'a', False) == (
+        MONDAY_MS + 3 * HOUR_MS, MONDAY_MS + 3 * HOUR_MS
+    )
+
+
+def test_daily_counts():
+    messages = _messages([(0, 'me', 'a'), (HOUR_MS, 'you', 'b'), (23 * HOUR_MS, 'me', 'c'), (DAY_MS, 'you', 'd')])
+    messages.append({'sender_name': 'me', 'content': 'no timestamp'})
+
+    assert density_numpy.aggregate_daily_counts(messages) == {'2020-09-14': 3, '2020-09-15': 1}
+    assert density_numpy.aggregate_daily_counts_columns(MessageColumns(messages).timestamps) == {
+        '2020-09-14': 3, '2020-09-15': 1
+    }
+    assert density_numpy.split_sent_received_daily_counts(messages, 'me') == (
+        {'2020-09-14': 2}, {'2020-09-14': 1, '2020-09-15': 1}
+    )
+
+
+def test_trend_series_moving_average():
+    daily_counts = {
+        '2020-09-14': 1, '2020-09-15': 2, '2020-09-16': 3, '2020-09-21': 4,
+        'not-a-date': 5, '2020-09-22': -1,
+    }
+    (daily, weekly) = density_numpy.build_group_chat_trends_series([{'daily_counts': daily_counts}])
+
+    # Days without messages are not filled in; the 7-day average runs over listed days.
+    assert daily == (['2020-09-14', '2020-09-15', '2020-09-16', '2020-09-21'], [1, 2, 3, 4], [1.0, 1.5, 2.0, 2.5], 7)
+    # Weeks start on Monday; the 4-week average of 6 and 4 is 5.
+    assert weekly == (['2020-09-14', '2020-09-21'], [6, 4], [6.0, 5.0], 4)
+
+
+def test_trend_series_rounds_half_away_from_zero():
+    daily, _ = density_numpy.build_group_chat_trends_series([{'daily_counts': {
+        '2020-09-14': 1, '2020-09-15': 0, '2020-09-16': 0, '2020-09-17': 1,
+    }}])
+    # 1/3 -> 0.33 and 2/4 -> 0.5; 1/2 -> 0.5 stays exact.
+    assert daily[2] == [1.0, 0.5, 0.33, 0.5]
+
+
+def test_detect_conversations():
+    seconds = 1000
+    messages = _messages([
+        (0, 'a', 'hey'), (30 * seconds, 'b', 'hi'), (60 * seconds, 'a', 'ok'),
+        (DAY_MS, 'b', 'back'), (DAY_MS + 20 * seconds, 'a', 'yes'),
+        (DAY_MS + 40 * seconds, 'b', 'so'), (DAY_MS + 60 * seconds, 'a', 'bye'),
+        (2 * DAY_MS, 'b', 'alone'),
+    ])
+    result = density_numpy.detect_conversations(messages)
+
+    # Every gap changes sender, so the cross-sender threshold applies: the median gap
+    # (30s) times 3 is under the 120s floor. The two day-long gaps split, and the lone
+    # last message is below min_messages.
+    assert result['conversations'] == [
+        {
+            'id': 0, 'start_ms': MONDAY_MS, 'end_ms': MONDAY_MS + 60 * seconds, 'message_count': 3,
+            'average_response_time': 30_000.0, 'leans': {'a': 2 / 3, 'b': 1 / 3},
+        },
+        {
+            'id': 1, 'start_ms': MONDAY_MS + DAY_MS, 'end_ms': MONDAY_MS + DAY_MS + 60 * seconds, 'message_count': 4,
+            'average_response_time': 20_000.0, 'leans': {'a': 0.5, 'b': 0.5},
+        },
+    ]
+
+    aggregation = result['thread_aggregation']
+    assert aggregation['total_conversations'] == 2
+    assert aggregation['avg_in_convo_response_time'] == 24_000.0
+    assert aggregation['avg_time_between_convos'] == DAY_MS - 60 * seconds
+    assert aggregation['avg_participation_leans'] == pytest.approx({'a': 7 / 12, 'b': 5 / 12})
+    assert aggregation['convos_per_day'] == {'2020-09-14': 1, '2020-09-15': 1}
+    assert aggregation['avg_msg_count_per_convo'] == 3.5
+    assert aggregation['avg_duration_ms_per_convo'] == 60_000.0
+
+    columns = MessageColumns(messages)
+    assert density_numpy.detect_conversations_columns(columns.timestamps, columns.sender_ids, columns.senders) == result
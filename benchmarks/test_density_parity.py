@@ -0,0 +1,29 @@
+"""
+pytest version of density_parity.py, so CI compares the backends on every change:
+
+    python -m pytest benchmarks/test_density_parity.py
+
+Skipped where density_finder_rs is not built.
+"""
+import pytest
+
+from density_parity import backend_calls
+from synthetic_threads import make_thread
+
+density_finder_rs = pytest.importorskip('density_finder_rs')
+density_numpy = pytest.importorskip('density_numpy')
+
+SIZES = (1_000, 10_000)
+SEEDS = range(3)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('size', SIZES)
+def test_backends_match(size, seed):
+    participants = [f'user_{i}' for i in range(2 + seed % 4)]
+    messages = make_thread(size, participants=len(participants), seed=seed)
+    mismatches = [
+        name for name, call in backend_calls(messages, participants)
+        if call(density_finder_rs) != call(density_numpy)
+    ]
+    assert not mismatches, f'{size} messages, seed {seed}: {mismatches}'
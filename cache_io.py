@@ -0,0 +1,237 @@
+import fcntl
+import json
+import os
+import secrets
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import CACHE_IO_BYTES, CACHE_IO_SECONDS
+
+
+LEASE_HEARTBEAT_SECONDS = 10
+LEASE_STALE_SECONDS = 60
+
+
+def current_owner_id():
+    """Identify this process in lease files and the shared job registry."""
+    # Recomputed on every call so forked server workers do not report their parent's pid.
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Called as observer([(path, delta_bytes), ...]) for writes and removals made through
+# this module (and reported with notify_storage), to keep per-user storage accounting current.
+_storage_observer = None
+
+
+def set_storage_observer(observer):
+    global _storage_observer
+    _storage_observer = observer
+
+
+def notify_storage(path, delta):
+    notify_storage_changes([(path, delta)])
+
+
+def notify_storage_changes(changes):
+    changes = [(path, delta) for path, delta in changes if delta]
+    if _storage_observer is not None and changes:
+        try:
+            _storage_observer(changes)
+        except Exception as e:
+            print(f"[STORAGE] Failed to record {len(changes)} storage changes: {e}")
+
+
+def file_sizes(path):
+    """[(file_path, bytes), ...] for a file or every file in a tree (symlinks are not followed)."""
+    if os.path.islink(path):
+        return []
+    if not os.path.isdir(path):
+        try:
+            return [(path, os.path.getsize(path))]
+        except OSError:
+            return []
+    sizes = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                sizes.append((file_path, os.lstat(file_path).st_size))
+            except OSError:
+                pass
+    return sizes
+
+
+def path_size(path):
+    """Bytes in a file or directory tree (symlinks are not followed); 0 if missing."""
+    return sum(size for _, size in file_sizes(path))
+
+
+def remove_path(path):
+    """Delete a file or directory tree and report the bytes freed, file by file. Returns that count."""
+    sizes = file_sizes(path) if _storage_observer is not None else []
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+    notify_storage_changes((file_path, -size) for file_path, size in sizes)
+    return sum(size for _, size in sizes)
+
+
+_READ_SECONDS = CACHE_IO_SECONDS.labels('read')
+_READ_BYTES = CACHE_IO_BYTES.labels('read')
+_WRITE_SECONDS = CACHE_IO_SECONDS.labels('write')
+_WRITE_BYTES = CACHE_IO_BYTES.labels('write')
+
+
+def read_json(path):
+    """Load a JSON cache file. Raises OSError or ValueError like json.load."""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+    payload = json.loads(data)
+    _READ_SECONDS.observe(time.perf_counter() - started)
+    _READ_BYTES.inc(len(data))
+    return payload
+
+
+def atomic_write_json(path, payload):
+    """Write JSON to a temp file in the target directory, then rename it over `path`."""
+    started = time.perf_counter()
+    directory = os.path.dirname(path) or '.'
+    old_size = path_size(path) if _storage_observer is not None else 0
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f)
+            f.flush()
+            os.fsync(f.fileno())
+            new_size = os.fstat(f.fileno()).st_size
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _WRITE_SECONDS.observe(time.perf_counter() - started)
+    _WRITE_BYTES.inc(new_size)
+    notify_storage(path, new_size - old_size)
+
+
+@contextmanager
+def file_lock(path):
+    """Blocking exclusive flock on `path`, for short read-modify-writes shared across processes."""
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class FileLease:
+    """
+    Cross-process lease backed by an O_EXCL lock file.
+
+    While held, a heartbeat thread refreshes the lock file's mtime. A lease whose
+    mtime is older than `stale_after` belongs to a dead process and may be taken over.
+    """
+    def __init__(self, path, stale_after=LEASE_STALE_SECONDS, heartbeat_interval=LEASE_HEARTBEAT_SECONDS):
+        self.path = path
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval
+        self.acquired = False
+        self._token = None
+        self._stop = None
+
+    def __enter__(self):
+        self.try_acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def try_acquire(self):
+        if self.acquired:
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if not self._break_if_stale():
+                return False
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                return False
+
+        self._token = secrets.token_hex(8)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'owner': current_owner_id(), 'token': self._token, 'acquired_at': time.time()}, f)
+
+        self.acquired = True
+        self._stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(self._stop,), daemon=True).start()
+        return True
+
+    def release(self):
+        if not self.acquired:
+            return
+        self.acquired = False
+        self._stop.set()
+        if self._still_owned():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _still_owned(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f).get('token') == self._token
+        except (OSError, ValueError):
+            return False
+
+    def _heartbeat(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            if not self._still_owned():
+                print(f"[LEASE] Lost lease {self.path}")
+                return
+            try:
+                os.utime(self.path)
+            except OSError:
+                return
+
+    def _break_if_stale(self):
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except FileNotFoundError:
+            return True
+        if age < self.stale_after:
+            return False
+
+        tomb_path = f'{self.path}.stale.{secrets.token_hex(4)}'
+        try:
+            os.rename(self.path, tomb_path)
+        except FileNotFoundError:
+            return True
+
+        # Another process may have refreshed or replaced the lease between our stat and rename.
+        if time.time() - os.path.getmtime(tomb_path) < self.stale_after:
+            try:
+                os.link(tomb_path, self.path)
+            except FileExistsError:
+                pass
+            os.remove(tomb_path)
+            return False
+
+        os.remove(tomb_path)
+        print(f"[LEASE] Took over stale lease {self.path}")
+        return True
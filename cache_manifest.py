@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import secrets
+import time
+
+from cache_io import atomic_write_json, file_lock, remove_path
+from message_store import message_files
+
+
+# One manifest per thread folder and one per user folder. The cached_ prefix keeps
+# it out of thread fingerprints like the artifacts it describes.
+MANIFEST_NAME = 'cached_manifest.json'
+MANIFEST_LOCK_NAME = '.cached_manifest.lock'
+
+THREAD_SCOPE = 'thread'
+USER_SCOPE = 'user'
+
+# Raw inputs an artifact can depend on besides other artifacts.
+INPUT_MESSAGES = 'messages'      # the thread's message_*.json files
+INPUT_THREADS = 'threads'        # the set of threads in the user's inbox and their fingerprints
+INPUT_UPLOADER = 'uploader'      # the username in me.json
+
+
+class Artifact:
+    """A cached file or directory, the schema version it was written with, and what it is built from."""
+    def __init__(self, path, scope, version, deps):
+        self.path = path
+        self.scope = scope
+        self.version = version
+        self.deps = deps
+
+
+# Bump an artifact's version when its format changes; it and everything depending on
+# it is then rebuilt on next use. Artifacts written before the manifest existed are
+# treated as version 1.
+ARTIFACTS = {
+    # Per-thread copies predate the shared analysis store, whose keys carry this version.
+    # v2: convo_stats included.
+    'analysis': Artifact('cached_analysis.json', THREAD_SCOPE, 2, (INPUT_MESSAGES,)),
+    'convo_metadata': Artifact('cached_convo_metadata.json', THREAD_SCOPE, 1, (INPUT_MESSAGES,)),
+    'convo_aggregate': Artifact('cached_convo_aggregate.json', THREAD_SCOPE, 1, ('convo_metadata',)),
+    'session_index': Artifact('cached_session_index.json', THREAD_SCOPE, 1, ('convo_metadata',)),
+    'convo_gaps': Artifact('cached_convo_gaps.json', THREAD_SCOPE, 1, (INPUT_MESSAGES,)),
+    'thread_summary': Artifact('cached_thread_summary.json', THREAD_SCOPE, 1, (INPUT_MESSAGES,)),
+    'game_stats': Artifact('cached_game_stats.json', THREAD_SCOPE, 1, (INPUT_MESSAGES,)),
+    'group_trends': Artifact('cached_group_chat_trends', USER_SCOPE, 1, (INPUT_THREADS, INPUT_UPLOADER, 'thread_summary')),
+    'uploader_trends': Artifact('cached_uploader_message_trends', USER_SCOPE, 1, (INPUT_THREADS, INPUT_UPLOADER, 'thread_summary')),
+    'people_talked_trends': Artifact('cached_people_talked_trends', USER_SCOPE, 1, (INPUT_THREADS, INPUT_UPLOADER, 'thread_summary')),
+    # v2: per_chat_convos_per_day added.
+    'convo_stats': Artifact('cached_convo_stats.json', USER_SCOPE, 2, (INPUT_THREADS, 'convo_aggregate')),
+    'game_index': Artifact('cached_game_index.json', USER_SCOPE, 1, (INPUT_THREADS,)),
+}
+
+
+def _hash(parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8', 'surrogateescape'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:32]
+
+
+def messages_fingerprint(thread_folder):
+    """Size and mtime of the thread's message files; stat only, nothing is read."""
+    parts = []
+    for path in message_files(thread_folder):
+        stat = os.stat(path)
+        parts.extend([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return _hash(parts)
+
+
+def threads_fingerprint(user_path):
+    """
+    Thread list plus the stored thread fingerprints' mtime. Update uploads rewrite
+    the fingerprints file and shared chats add inbox entries, so either changes this.
+    """
+    inbox_path = os.path.join(user_path, 'inbox')
+    parts = sorted(os.listdir(inbox_path)) if os.path.isdir(inbox_path) else []
+    try:
+        parts.append(os.stat(os.path.join(user_path, 'thread_fingerprints.json')).st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return _hash(parts)
+
+
+def uploader_fingerprint(user_path):
+    try:
+        with open(os.path.join(user_path, 'me.json'), 'r') as f:
+            return _hash([json.load(f).get('username')])
+    except (OSError, ValueError):
+        return _hash([None])
+
+
+def read_manifest(scope_dir):
+    try:
+        with open(os.path.join(scope_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def artifact_path(scope_dir, name):
+    return os.path.join(scope_dir, ARTIFACTS[name].path)
+
+
+def current_inputs(scope_dir, name, manifest=None):
+    """Fingerprint every dependency of an artifact as it stands now."""
+    artifact = ARTIFACTS[name]
+    manifest = read_manifest(scope_dir) if manifest is None else manifest
+    inputs = {}
+    for dep in artifact.deps:
+        if dep == INPUT_MESSAGES:
+            inputs[dep] = messages_fingerprint(scope_dir)
+        elif dep == INPUT_THREADS:
+            inputs[dep] = threads_fingerprint(scope_dir)
+        elif dep == INPUT_UPLOADER:
+            inputs[dep] = uploader_fingerprint(scope_dir)
+        elif ARTIFACTS[dep].scope == artifact.scope:
+            inputs[dep] = (manifest.get(dep) or {}).get('build_id', 'legacy')
+        else:
+            # Per-thread artifacts behind a user-level one: their schema version
+            # matters; their content is covered by the threads fingerprint.
+            inputs[dep] = f'v{ARTIFACTS[dep].version}'
+    return inputs
+
+
+def is_fresh(scope_dir, name):
+    """True if the artifact exists and was built from the current inputs at the current schema version."""
+    artifact = ARTIFACTS[name]
+    if not os.path.exists(artifact_path(scope_dir, name)):
+        return False
+
+    manifest = read_manifest(scope_dir)
+    entry = manifest.get(name)
+    if entry is None:
+        # Written before the manifest existed: inputs unknown, keep it unless the schema moved on.
+        return artifact.version == 1
+    if entry.get('version') != artifact.version:
+        return False
+    return entry.get('inputs') == current_inputs(scope_dir, name, manifest)
+
+
+def record_build(scope_dir, name):
+    """
+    Record a build of an artifact against its current inputs. Call it before writing
+    the artifact: a reader then never sees a new file without its entry, and inputs
+    that change while a long build runs leave the result stale.
+    """
+    with file_lock(os.path.join(scope_dir, MANIFEST_LOCK_NAME)):
+        manifest = read_manifest(scope_dir)
+        manifest[name] = {
+            'version': ARTIFACTS[name].version,
+            'inputs': current_inputs(scope_dir, name, manifest),
+            'build_id': secrets.token_hex(8),
+            'built_at': time.time(),
+        }
+        atomic_write_json(os.path.join(scope_dir, MANIFEST_NAME), manifest)
+
+
+def dependents(name):
+    """Artifacts that depend on `name`, directly or transitively."""
+    found = []
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        for other, artifact in ARTIFACTS.items():
+            if current in artifact.deps and other not in found:
+                found.append(other)
+                pending.append(other)
+    return found
+
+
+def invalidate(scope_dir, name):
+    """Delete an artifact and its same-scope dependents along with their manifest entries."""
+    scope = ARTIFACTS[name].scope
+    names = [name] + [other for other in dependents(name) if ARTIFACTS[other].scope == scope]
+    with file_lock(os.path.join(scope_dir, MANIFEST_LOCK_NAME)):
+        manifest = read_manifest(scope_dir)
+        for target in names:
+            remove_path(artifact_path(scope_dir, target))
+            manifest.pop(target, None)
+        atomic_write_json(os.path.join(scope_dir, MANIFEST_NAME), manifest)
+
+
+def ensure_fresh(scope_dir, name):
+    """Drop the artifact if it is stale so callers can rebuild it. Returns True if it is usable."""
+    if is_fresh(scope_dir, name):
+        return True
+    if os.path.exists(artifact_path(scope_dir, name)):
+        print(f"[CACHE STALE] Invalidating {name} in {scope_dir}")
+        invalidate(scope_dir, name)
+    return False
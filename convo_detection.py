@@ -0,0 +1,270 @@
+import os
+
+from density_backend import detect_conversations, extract_conversation_gaps, sweep_conversation_counts
+from cache_io import atomic_write_json, read_json
+from cache_manifest import ensure_fresh, record_build
+from message_store import message_files, load_message_file
+from session_index import SESSION_INDEX_NAME, build_session_index, write_session_index
+
+
+# Per-session output of detect_conversations for one thread.
+METADATA_NAME = 'cached_convo_metadata.json'
+# Just the thread-level aggregates, small enough to read for every thread in a reduce.
+AGGREGATE_NAME = 'cached_convo_aggregate.json'
+# Gap and sender-change arrays, enough to re-segment a thread under other thresholds.
+GAPS_NAME = 'cached_convo_gaps.json'
+
+# detect_conversations keyword defaults, in sweep_conversation_counts tuple order.
+DEFAULT_CONVO_THRESHOLDS = {
+    'same_sender_multiplier': 1.5,
+    'cross_sender_multiplier': 3.0,
+    'same_sender_floor_ms': 60_000,
+    'cross_sender_floor_ms': 120_000,
+    'min_messages': 3,
+}
+INTEGER_THRESHOLDS = ('same_sender_floor_ms', 'cross_sender_floor_ms', 'min_messages')
+
+
+def load_thread_messages(thread_folder):
+    """Load all messages for a thread folder, sorted by timestamp."""
+    messages = []
+    for file_path in message_files(thread_folder):
+        messages.extend(load_message_file(file_path)['messages'])
+    return sorted(messages, key=lambda x: x['timestamp_ms'])
+
+
+def write_thread_detection(thread_folder, thread_result):
+    """Cache detect_conversations output: session metadata, its query index and the small aggregate file."""
+    if not ensure_fresh(thread_folder, 'convo_metadata'):
+        record_build(thread_folder, 'convo_metadata')
+        atomic_write_json(os.path.join(thread_folder, METADATA_NAME), thread_result)
+    record_build(thread_folder, 'session_index')
+    write_session_index(thread_folder, thread_result)
+    record_build(thread_folder, 'convo_aggregate')
+    atomic_write_json(os.path.join(thread_folder, AGGREGATE_NAME), thread_result.get('thread_aggregation', {}))
+
+
+def _read_cached_json(path):
+    try:
+        return read_json(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_artifact(thread_folder, name, path):
+    """Read a per-thread cache if the manifest says it is still current, else drop it and return None."""
+    if not ensure_fresh(thread_folder, name):
+        return None
+    return _read_cached_json(path)
+
+
+def load_thread_aggregate(thread_folder, messages=None):
+    """
+    Return the thread-level convo aggregates for a thread, computing and caching them
+    if needed. Returns None when the thread has no messages.
+    """
+    aggregate = _read_artifact(thread_folder, 'convo_aggregate', os.path.join(thread_folder, AGGREGATE_NAME))
+    if aggregate is not None:
+        return aggregate
+
+    thread_result = _read_artifact(thread_folder, 'convo_metadata', os.path.join(thread_folder, METADATA_NAME))
+    if thread_result is None:
+        if messages is None:
+            messages = load_thread_messages(thread_folder)
+        if not messages:
+            return None
+        thread_result = detect_conversations(messages)
+
+    try:
+        write_thread_detection(thread_folder, thread_result)
+    except Exception as e:
+        print(f"[CONVO_DETECT] Failed to write cache for {os.path.basename(thread_folder)}: {e}")
+    return thread_result.get('thread_aggregation', {})
+
+
+def load_session_index(thread_folder):
+    """
+    Return the session index for a thread, building it from cached session metadata
+    (or by running detection) if needed. Returns None when the thread has no messages.
+    """
+    index = _read_artifact(thread_folder, 'session_index', os.path.join(thread_folder, SESSION_INDEX_NAME))
+    if index is not None:
+        return index
+
+    thread_result = _read_artifact(thread_folder, 'convo_metadata', os.path.join(thread_folder, METADATA_NAME))
+    if thread_result is None:
+        messages = load_thread_messages(thread_folder)
+        if not messages:
+            return None
+        thread_result = detect_conversations(messages)
+
+    try:
+        write_thread_detection(thread_folder, thread_result)
+    except Exception as e:
+        print(f"[CONVO_DETECT] Failed to write cache for {os.path.basename(thread_folder)}: {e}")
+    return build_session_index(thread_result)
+
+
+def load_thread_gaps(thread_folder, messages=None):
+    """
+    Return the cached gap arrays for a thread as {'gaps', 'sender_changed',
+    'median_same', 'median_diff'}, extracting them if needed. Returns None when the
+    thread has no messages.
+    """
+    gaps_path = os.path.join(thread_folder, GAPS_NAME)
+    cached = _read_artifact(thread_folder, 'convo_gaps', gaps_path)
+    if cached is not None:
+        return cached
+
+    if messages is None:
+        messages = load_thread_messages(thread_folder)
+    if not messages:
+        return None
+
+    gaps, sender_changed, median_same, median_diff = extract_conversation_gaps(messages)
+    payload = {
+        'gaps': gaps,
+        'sender_changed': sender_changed,
+        'median_same': median_same,
+        'median_diff': median_diff,
+    }
+    try:
+        record_build(thread_folder, 'convo_gaps')
+        atomic_write_json(gaps_path, payload)
+    except Exception as e:
+        print(f"[CONVO_DETECT] Failed to write gaps for {os.path.basename(thread_folder)}: {e}")
+    return payload
+
+
+def detect_thread(thread_folder):
+    """
+    Pool task for compute_all_convo_stats: make sure a thread's aggregate and gap
+    caches exist and return the aggregate. Runs in worker processes, so it only
+    touches the thread folder and returns the small aggregate dict.
+    """
+    messages = None
+    needs_messages = not (
+        ensure_fresh(thread_folder, 'convo_gaps')
+        and (ensure_fresh(thread_folder, 'convo_aggregate')
+             or ensure_fresh(thread_folder, 'convo_metadata'))
+    )
+    if needs_messages:
+        messages = load_thread_messages(thread_folder)
+        if not messages:
+            return None
+
+    load_thread_gaps(thread_folder, messages)
+    return load_thread_aggregate(thread_folder, messages)
+
+
+def threshold_tuple(thresholds):
+    return tuple(thresholds[name] for name in DEFAULT_CONVO_THRESHOLDS)
+
+
+def sweep_conversation_totals(thread_gaps, threshold_sets):
+    """Total conversation count across threads for each threshold set."""
+    totals = [0] * len(threshold_sets)
+    for gaps in thread_gaps:
+        counts = sweep_conversation_counts(
+            gaps['gaps'],
+            gaps['sender_changed'],
+            gaps['median_same'],
+            gaps['median_diff'],
+            threshold_sets
+        )
+        totals = [total + count for total, count in zip(totals, counts)]
+    return totals
+
+
+def reduce_convo_stats(thread_aggregates):
+    """
+    Combine [(conversation, thread_aggregation), ...] into the user-level summary
+    stored in cached_convo_stats.json. Averages are weighted by each thread's
+    conversation count.
+    """
+    global_total_convos = 0
+    global_total_response_time = 0.0
+    global_response_time_conversation_count = 0
+    global_leans: dict = {}
+    global_leans_conversation_count = 0
+    global_total_msg_count = 0.0
+    global_msg_count_conversation_count = 0
+    global_total_duration_ms = 0.0
+    global_duration_conversation_count = 0
+    global_convos_per_day: dict = {}
+    global_avg_time_between_convos = 0.0
+    global_time_between_convos_conversation_count = 0
+    per_chat_convos_per_day: dict = {}
+
+    for conv, thread_agg in thread_aggregates:
+        thread_agg = thread_agg or {}
+        total_c = thread_agg.get('total_conversations', 0)
+        if total_c == 0:
+            continue
+
+        global_total_convos += total_c
+
+        art = thread_agg.get('avg_in_convo_response_time', 0.0)
+        if art > 0:
+            global_total_response_time += art * total_c
+            global_response_time_conversation_count += total_c
+
+        atbc = thread_agg.get('avg_time_between_convos', 0.0)
+        if atbc > 0:
+            global_avg_time_between_convos += atbc * total_c
+            global_time_between_convos_conversation_count += total_c
+
+        participation = thread_agg.get('avg_participation_leans', {})
+        if participation:
+            for sender, pct in participation.items():
+                global_leans[sender] = global_leans.get(sender, 0.0) + pct * total_c
+            global_leans_conversation_count += total_c
+
+        avg_msg_count = thread_agg.get('avg_msg_count_per_convo', 0.0)
+        if avg_msg_count > 0:
+            global_total_msg_count += avg_msg_count * total_c
+            global_msg_count_conversation_count += total_c
+
+        avg_duration_ms = thread_agg.get('avg_duration_ms_per_convo', 0.0)
+        if avg_duration_ms > 0:
+            global_total_duration_ms += avg_duration_ms * total_c
+            global_duration_conversation_count += total_c
+
+        chat_cpd = thread_agg.get('convos_per_day', {})
+        for date_str, cnt in chat_cpd.items():
+            global_convos_per_day[date_str] = global_convos_per_day.get(date_str, 0) + cnt
+
+        # Store per-chat conversation counts for the trends chart
+        if chat_cpd:
+            per_chat_convos_per_day[conv['id']] = {
+                'title': conv.get('title', conv['id']),
+                'convos_per_day': chat_cpd,
+            }
+
+    avg_participation = {}
+    if global_leans_conversation_count > 0:
+        for sender, total_pct in global_leans.items():
+            avg_participation[sender] = total_pct / global_leans_conversation_count
+
+    return {
+        'total_conversations': global_total_convos,
+        'avg_in_convo_response_time': (
+            global_total_response_time / global_response_time_conversation_count
+            if global_response_time_conversation_count > 0 else 0.0
+        ),
+        'avg_time_between_convos': (
+            global_avg_time_between_convos / global_time_between_convos_conversation_count
+            if global_time_between_convos_conversation_count > 0 else 0.0
+        ),
+        'avg_participation_leans': avg_participation,
+        'avg_msg_count_per_convo': (
+            global_total_msg_count / global_msg_count_conversation_count
+            if global_msg_count_conversation_count > 0 else 0.0
+        ),
+        'avg_duration_ms_per_convo': (
+            global_total_duration_ms / global_duration_conversation_count
+            if global_duration_conversation_count > 0 else 0.0
+        ),
+        'convos_per_day': global_convos_per_day,
+        'per_chat_convos_per_day': per_chat_convos_per_day,
+    }
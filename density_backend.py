@@ -0,0 +1,59 @@
+import importlib
+import os
+
+from metrics import OPERATION_SECONDS, timed
+
+
+# Which implementation of the density_finder_rs API the app computes with:
+# 'rust' (the compiled extension), 'numpy' (density_numpy) or 'auto', which uses the
+# extension when it is installed and NumPy otherwise. Read at import so every module
+# (and every process pool worker) resolves the same backend.
+DENSITY_BACKEND = os.getenv('DENSITY_BACKEND', 'auto')
+
+BACKEND_MODULES = {
+    'rust': 'density_finder_rs',
+    'numpy': 'density_numpy',
+}
+
+
+def load_backend(name):
+    """Import the module behind a DENSITY_BACKEND setting; returns (backend name, module)."""
+    if name == 'auto':
+        try:
+            return 'rust', importlib.import_module(BACKEND_MODULES['rust'])
+        except ImportError:
+            print("[DENSITY] density_finder_rs is not installed, using the NumPy backend")
+            return 'numpy', importlib.import_module(BACKEND_MODULES['numpy'])
+    if name not in BACKEND_MODULES:
+        raise ValueError(f'Unknown density backend: {name}')
+    return name, importlib.import_module(BACKEND_MODULES[name])
+
+
+BACKEND_NAME, _backend = load_backend(DENSITY_BACKEND)
+
+
+def _timed(name):
+    """The backend function `name`, observed in chv_operation_duration_seconds."""
+    return timed(OPERATION_SECONDS.labels(f'density.{name}'), getattr(_backend, name))
+
+
+find_highest_density_period = _timed('find_highest_density_period')
+find_participant_density_period = _timed('find_participant_density_period')
+compute_top_words = _timed('compute_top_words')
+compute_top_emojis = _timed('compute_top_emojis')
+count_specific_string = _timed('count_specific_string')
+aggregate_daily_counts = _timed('aggregate_daily_counts')
+split_sent_received_daily_counts = _timed('split_sent_received_daily_counts')
+build_group_chat_trends_series = _timed('build_group_chat_trends_series')
+build_uploader_trends_series = _timed('build_uploader_trends_series')
+detect_conversations = _timed('detect_conversations')
+extract_conversation_gaps = _timed('extract_conversation_gaps')
+sweep_conversation_counts = _timed('sweep_conversation_counts')
+find_highest_density_period_columns = _timed('find_highest_density_period_columns')
+find_participant_density_period_columns = _timed('find_participant_density_period_columns')
+compute_top_words_columns = _timed('compute_top_words_columns')
+compute_top_emojis_columns = _timed('compute_top_emojis_columns')
+count_specific_string_columns = _timed('count_specific_string_columns')
+aggregate_daily_counts_columns = _timed('aggregate_daily_counts_columns')
+extract_conversation_gaps_columns = _timed('extract_conversation_gaps_columns')
+detect_conversations_columns = _timed('detect_conversations_columns')
@@ -0,0 +1,491 @@
+import datetime
+from collections import Counter
+
+import numpy as np
+
+try:
+    import emoji  # optional; compute_top_emojis falls back to the emoji code point blocks
+except ImportError:
+    emoji = None
+
+
+# NumPy implementation of the density_finder_rs API, selected through density_backend
+# when the extension is not built (or DENSITY_BACKEND=numpy). Results match the Rust
+# functions; the text functions (top words / emojis, string counts) are plain Python
+# since there is nothing to vectorize, and emoji detection uses the `emoji` package
+# rather than the Rust `emojis` crate, so rare symbols can be classified differently.
+
+MS_PER_DAY = 86_400_000
+MISSING_SENDER = 0xFFFFFFFF
+INT64_MAX = 2**63 - 1
+
+STOP_WORDS = frozenset([
+    "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "from", "as", "is", "was", "are", "were", "be", "been", "being", "have", "has", "had", "do", "does", "did", "will", "would", "could", "should", "may", "might", "can", "i", "you", "he", "she", "it", "we", "they", "them", "their", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our", "attachment",
+])
+
+# Blocks used to spot emojis when the `emoji` package is not installed.
+EMOJI_RANGES = (
+    (0x1F000, 0x1FAFF),
+    (0x2600, 0x27BF),
+    (0x2B00, 0x2BFF),
+    (0x2190, 0x21FF),
+    (0x2300, 0x23FF),
+)
+
+
+def _is_int(value):
+    return isinstance(value, int)
+
+
+def _column(obj, dtype):
+    """A buffer-protocol column as a NumPy array, without copying; rejects the wrong item type."""
+    values = np.asarray(memoryview(obj))
+    if values.dtype != dtype:
+        raise BufferError(f'expected a buffer of {np.dtype(dtype).name}, got {values.dtype.name}')
+    return values.reshape(-1)
+
+
+def _check_same_length(a, b, what):
+    if len(a) != len(b):
+        raise ValueError(f'{what} must have the same length')
+
+
+def _day_keys(days):
+    """'%Y-%m-%d' keys for an array of days since the epoch."""
+    return np.datetime_as_string(days.astype('datetime64[D]'), unit='D').tolist()
+
+
+def _round_cents(values):
+    """Round half away from zero to 2 decimals, like f64::round in the Rust version."""
+    scaled = values * 100.0
+    floor = np.floor(scaled)
+    return (floor + (scaled - floor >= 0.5)) / 100.0
+
+
+def _message_timestamp(message):
+    if not isinstance(message, dict):
+        return None
+    ts = message.get('timestamp_ms')
+    return ts if _is_int(ts) and ts >= 0 else None
+
+
+def _sorted_sender_rows(timestamps, sender_ids):
+    """Rows with both a timestamp and a sender, stably sorted by timestamp."""
+    keep = (timestamps >= 0) & (sender_ids != MISSING_SENDER)
+    timestamps, sender_ids = timestamps[keep], sender_ids[keep]
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], sender_ids[order].astype(np.int64)
+
+
+def _sender_rows(data):
+    """Timestamps and interned sender ids of messages with both, sorted by timestamp."""
+    ids, senders, timestamps, sender_ids = {}, [], [], []
+    for message in data:
+        ts = _message_timestamp(message)
+        if ts is None:
+            continue
+        sender = message.get('sender_name')
+        if not isinstance(sender, str):
+            continue
+        sender_id = ids.get(sender)
+        if sender_id is None:
+            sender_id = ids[sender] = len(senders)
+            senders.append(sender)
+        timestamps.append(ts)
+        sender_ids.append(sender_id)
+    timestamps = np.array(timestamps, dtype=np.int64)
+    sender_ids = np.array(sender_ids, dtype=np.int64)
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], sender_ids[order], senders
+
+
+def _contents(data):
+    for message in data:
+        if isinstance(message, dict):
+            content = message.get('content')
+            if isinstance(content, str):
+                yield content
+
+
+def _column_contents(content_offsets, content):
+    offsets = _column(content_offsets, np.uint64).tolist()
+    blob = bytes(memoryview(content))
+    for start, end in zip(offsets, offsets[1:]):
+        if end > start:
+            try:
+                yield blob[start:end].decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+
+
+def _highest_density_window(timestamps, window_ms):
+    n = len(timestamps)
+    if n <= 1:
+        return (0, 0)
+    # For each start, the window runs to the last message within window_ms of it.
+    ends = np.searchsorted(timestamps, timestamps + window_ms, side='right')
+    best = int(np.argmax(ends - np.arange(n)))
+    return (int(timestamps[best]), int(timestamps[ends[best] - 1]))
+
+
+def _participant_count_window(timestamps, matches, window_ms, find_max):
+    """
+    Window of `window_ms` (starting at a message) with the most (or fewest) matching
+    messages. Windows that would run past the last message are not considered.
+    """
+    n = len(timestamps)
+    if n <= 1:
+        return (0, 0)
+    last = int(timestamps[-1])
+    starts = n
+    if window_ms <= last:
+        past_end = np.flatnonzero(timestamps > last - window_ms)
+        starts = int(past_end[0]) if len(past_end) else n
+    if starts == 0:
+        return (int(timestamps[0]), int(timestamps[0]))
+
+    index = np.arange(starts)
+    ends = np.maximum(np.searchsorted(timestamps, timestamps[:starts] + window_ms, side='left'), index)
+    matched = np.concatenate(([0], np.cumsum(matches, dtype=np.int64)))
+    counts = matched[ends] - matched[index]
+
+    if find_max:
+        best = int(np.argmax(counts))
+        if counts[best] == 0:
+            return (int(timestamps[0]), int(timestamps[0]))
+    else:
+        best = int(np.argmin(counts))
+    end = min(max(int(ends[best]) - 1, 0), n - 1)
+    return (int(timestamps[best]), int(timestamps[end]))
+
+
+def find_highest_density_period(data, period):
+    if len(data) <= 1:
+        return (0, 0)
+    timestamps = np.array([message['timestamp_ms'] for message in data], dtype=np.int64)
+    return _highest_density_window(timestamps, period * MS_PER_DAY)
+
+
+def find_participant_density_period(data, period, participant, find_max):
+    if len(data) <= 1:
+        return (0, 0)
+    timestamps = np.array([message['timestamp_ms'] for message in data], dtype=np.int64)
+    matches = np.array([message['sender_name'] == participant for message in data], dtype=bool)
+    return _participant_count_window(timestamps, matches, period * MS_PER_DAY, find_max)
+
+
+def find_highest_density_period_columns(timestamps, period):
+    timestamps = np.maximum(_column(timestamps, np.int64), 0)
+    return _highest_density_window(timestamps, period * MS_PER_DAY)
+
+
+def find_participant_density_period_columns(timestamps, sender_ids, period, participant_id, find_max):
+    timestamps = np.maximum(_column(timestamps, np.int64), 0)
+    sender_ids = _column(sender_ids, np.uint32)
+    _check_same_length(timestamps, sender_ids, 'timestamps and sender_ids')
+    return _participant_count_window(timestamps, sender_ids == participant_id, period * MS_PER_DAY, find_max)
+
+
+def _top_words(contents, top_n):
+    # Count raw words first so each distinct word is only cleaned once.
+    raw_counts = Counter()
+    for content in contents:
+        raw_counts.update(content.lower().split())
+    counts = Counter()
+    for raw_word, count in raw_counts.items():
+        cleaned = ''.join(c for c in raw_word if c.isalnum())
+        if len(cleaned) > 1 and cleaned not in STOP_WORDS:
+            counts[cleaned] += count
+    return sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))[:top_n]
+
+
+def _is_emoji(ch):
+    if emoji is not None:
+        return ch in emoji.EMOJI_DATA or ch + '\ufe0f' in emoji.EMOJI_DATA
+    code = ord(ch)
+    return any(lo <= code <= hi for lo, hi in EMOJI_RANGES)
+
+
+def _top_emojis(contents, top_n):
+    counts = Counter()
+    for content in contents:
+        counts.update(Counter(content))
+    emojis = [(ch, count) for ch, count in counts.items() if _is_emoji(ch)]
+    return sorted(emojis, key=lambda pair: (-pair[1], pair[0]))[:top_n]
+
+
+def _count_occurrences(contents, target_string):
+    if not target_string:
+        return 0
+    needle = target_string.lower()
+    return sum(content.lower().count(needle) for content in contents)
+
+
+def compute_top_words(data, top_n):
+    return _top_words(_contents(data), top_n)
+
+
+def compute_top_emojis(data, top_n):
+    return _top_emojis(_contents(data), top_n)
+
+
+def count_specific_string(data, target_string):
+    return _count_occurrences(_contents(data), target_string)
+
+
+def compute_top_words_columns(content_offsets, content, top_n):
+    return _top_words(_column_contents(content_offsets, content), top_n)
+
+
+def compute_top_emojis_columns(content_offsets, content, top_n):
+    return _top_emojis(_column_contents(content_offsets, content), top_n)
+
+
+def count_specific_string_columns(content_offsets, content, target_string):
+    return _count_occurrences(_column_contents(content_offsets, content), target_string)
+
+
+def _daily_counts(timestamps):
+    days, counts = np.unique(timestamps // MS_PER_DAY, return_counts=True)
+    return dict(zip(_day_keys(days), counts.tolist()))
+
+
+def aggregate_daily_counts(data):
+    timestamps = [ts for ts in map(_message_timestamp, data) if ts is not None]
+    return _daily_counts(np.array(timestamps, dtype=np.int64))
+
+
+def aggregate_daily_counts_columns(timestamps):
+    timestamps = _column(timestamps, np.int64)
+    return _daily_counts(timestamps[timestamps >= 0])
+
+
+def split_sent_received_daily_counts(data, uploader_username):
+    timestamps, sent = [], []
+    for message in data:
+        ts = _message_timestamp(message)
+        if ts is None:
+            continue
+        sender = message.get('sender_name')
+        if not isinstance(sender, str):
+            continue
+        timestamps.append(ts)
+        sent.append(sender == uploader_username)
+    timestamps = np.array(timestamps, dtype=np.int64)
+    sent = np.array(sent, dtype=bool)
+    return (_daily_counts(timestamps[sent]), _daily_counts(timestamps[~sent]))
+
+
+def _valid_date_key(key):
+    if not isinstance(key, str) or len(key) != 10:
+        return False
+    try:
+        datetime.datetime.strptime(key, '%Y-%m-%d')
+    except ValueError:
+        return False
+    return True
+
+
+def _normalize_daily_counts(daily_counts, totals=None):
+    totals = Counter() if totals is None else totals
+    for key, value in daily_counts.items():
+        if _valid_date_key(key) and _is_int(value) and value >= 0:
+            totals[key] += value
+    return totals
+
+
+def _moving_average(values, window_size):
+    if window_size == 0:
+        return np.zeros(len(values))
+    running = np.cumsum(values)
+    running[window_size:] -= running[:-window_size].copy()
+    sample_len = np.minimum(np.arange(1, len(values) + 1), window_size)
+    return _round_cents(running / sample_len)
+
+
+def _trend_series(daily_totals):
+    daily_keys = sorted(daily_totals)
+    daily_values = np.array([daily_totals[key] for key in daily_keys], dtype=np.int64)
+    days = np.array(daily_keys, dtype='datetime64[D]').astype(np.int64)
+
+    # 1970-01-01 was a Thursday; weeks start on Monday.
+    week_starts, week_index = np.unique(days - (days + 3) % 7, return_inverse=True)
+    weekly_values = np.bincount(week_index, weights=daily_values, minlength=len(week_starts)).astype(np.int64)
+
+    return (
+        (daily_keys, daily_values.tolist(), _moving_average(daily_values, 7).tolist(), 7),
+        (_day_keys(week_starts), weekly_values.tolist(), _moving_average(weekly_values, 4).tolist(), 4),
+    )
+
+
+def build_group_chat_trends_series(data):
+    totals = Counter()
+    for group_chat in data:
+        if isinstance(group_chat, dict) and isinstance(group_chat.get('daily_counts'), dict):
+            _normalize_daily_counts(group_chat['daily_counts'], totals)
+    return _trend_series(totals)
+
+
+def build_uploader_trends_series(sent_daily_counts, received_daily_counts):
+    sent_daily, sent_weekly = _trend_series(_normalize_daily_counts(sent_daily_counts))
+    received_daily, received_weekly = _trend_series(_normalize_daily_counts(received_daily_counts))
+    return (sent_daily + sent_weekly, received_daily + received_weekly)
+
+
+def _conversation_gaps(timestamps, sender_ids):
+    gaps = np.diff(timestamps)
+    changed = sender_ids[1:] != sender_ids[:-1]
+    same, diff = gaps[~changed], gaps[changed]
+    median_same = int(np.partition(same, len(same) // 2)[len(same) // 2]) if len(same) else 300_000  # 5 mins
+    median_diff = int(np.partition(diff, len(diff) // 2)[len(diff) // 2]) if len(diff) else 1_200_000  # 20 mins
+    return gaps, changed, median_same, median_diff
+
+
+def _split_thresholds(median_same, median_diff, same_mult, cross_mult, same_floor, cross_floor):
+    def scaled(median, multiplier):
+        # Like Rust's f64 -> u64 cast: truncate, NaN and negatives to 0, capped (here at i64::MAX).
+        value = float(median) * multiplier
+        return min(int(value), INT64_MAX) if value > 0 else 0
+    return max(scaled(median_same, same_mult), same_floor), max(scaled(median_diff, cross_mult), cross_floor)
+
+
+def extract_conversation_gaps(data):
+    """(gaps_ms, sender_changed, median_same_ms, median_diff_ms) for a thread."""
+    timestamps, sender_ids, _ = _sender_rows(data)
+    gaps, changed, median_same, median_diff = _conversation_gaps(timestamps, sender_ids)
+    return gaps.tolist(), changed.tolist(), median_same, median_diff
+
+
+def extract_conversation_gaps_columns(timestamps, sender_ids):
+    timestamps = _column(timestamps, np.int64)
+    sender_ids = _column(sender_ids, np.uint32)
+    _check_same_length(timestamps, sender_ids, 'timestamps and sender_ids')
+    gaps, changed, median_same, median_diff = _conversation_gaps(*_sorted_sender_rows(timestamps, sender_ids))
+    return gaps.tolist(), changed.tolist(), median_same, median_diff
+
+
+def sweep_conversation_counts(gaps, sender_changed, median_same, median_diff, threshold_sets):
+    """Conversation counts detect_conversations would find under each threshold set, from cached gaps."""
+    if len(gaps) != len(sender_changed):
+        raise ValueError('gaps and sender_changed must have the same length')
+    gaps = np.asarray(gaps, dtype=np.int64)
+    changed = np.asarray(sender_changed, dtype=bool)
+    n = len(gaps) + 1
+
+    counts = []
+    for same_mult, cross_mult, same_floor, cross_floor, min_messages in threshold_sets:
+        threshold_same, threshold_diff = _split_thresholds(median_same, median_diff, same_mult, cross_mult, same_floor, cross_floor)
+        splits = np.flatnonzero(gaps > np.where(changed, threshold_diff, threshold_same)) + 1
+        lengths = np.diff(np.concatenate(([0], splits, [n])))
+        counts.append(int(np.count_nonzero(lengths >= min_messages)))
+    return counts
+
+
+def _detect_sessions(timestamps, sender_ids, senders, same_sender_multiplier, cross_sender_multiplier,
+                     same_sender_floor_ms, cross_sender_floor_ms, min_messages):
+    n = len(timestamps)
+    if n == 0:
+        return {'conversations': [], 'thread_aggregation': {}}
+
+    gaps, changed, median_same, median_diff = _conversation_gaps(timestamps, sender_ids)
+    threshold_same, threshold_diff = _split_thresholds(
+        median_same, median_diff, same_sender_multiplier, cross_sender_multiplier,
+        same_sender_floor_ms, cross_sender_floor_ms
+    )
+    split = gaps > np.where(changed, threshold_diff, threshold_same)
+
+    # Conversation boundaries: message indexes [starts[k], ends[k]).
+    starts = np.concatenate(([0], np.flatnonzero(split) + 1))
+    ends = np.concatenate((starts[1:], [n]))
+    sizes = ends - starts
+
+    # In-conversation replies: gaps that did not split and where the sender changed.
+    replies = changed & ~split
+    reply_ms = np.concatenate(([0], np.cumsum(np.where(replies, gaps, 0))))
+    reply_n = np.concatenate(([0], np.cumsum(replies, dtype=np.int64)))
+    reply_totals = reply_ms[ends - 1] - reply_ms[starts]
+    reply_counts = reply_n[ends - 1] - reply_n[starts]
+
+    # Messages per (conversation, sender).
+    sender_span = int(sender_ids.max()) + 1
+    convo_of = np.repeat(np.arange(len(starts)), sizes)
+    pairs, pair_counts = np.unique(convo_of * sender_span + sender_ids, return_counts=True)
+    pair_convo, pair_sender = pairs // sender_span, pairs % sender_span
+
+    kept = np.flatnonzero(sizes >= min_messages)
+    renumber = np.full(len(starts), -1)
+    renumber[kept] = np.arange(len(kept))
+    pair_keep = renumber[pair_convo] >= 0
+    pair_convo, pair_sender, pair_counts = renumber[pair_convo[pair_keep]], pair_sender[pair_keep], pair_counts[pair_keep]
+    pair_share = pair_counts / sizes[kept][pair_convo]
+
+    starts_ms, ends_ms, sizes = timestamps[starts[kept]], timestamps[ends[kept] - 1], sizes[kept]
+    reply_totals, reply_counts = reply_totals[kept], reply_counts[kept]
+    total = len(kept)
+
+    leans = [{} for _ in range(total)]
+    for convo, sender, share in zip(pair_convo.tolist(), pair_sender.tolist(), pair_share.tolist()):
+        leans[convo][senders[sender]] = share
+
+    average_responses = np.divide(reply_totals, reply_counts, out=np.zeros(total), where=reply_counts > 0)
+    conversations = [
+        {
+            'id': index,
+            'start_ms': start_ms,
+            'end_ms': end_ms,
+            'message_count': size,
+            'average_response_time': average_response,
+            'leans': convo_leans,
+        }
+        for index, (start_ms, end_ms, size, average_response, convo_leans) in enumerate(zip(
+            starts_ms.tolist(), ends_ms.tolist(), sizes.tolist(), average_responses.tolist(), leans
+        ))
+    ]
+
+    avg_participation_leans = {}
+    if total:
+        # bincount adds each sender's shares in conversation order, as the Rust loop does.
+        share_sums = np.bincount(pair_sender, weights=pair_share, minlength=sender_span)
+        for sender in np.unique(pair_sender).tolist():
+            avg_participation_leans[senders[sender]] = float(share_sums[sender]) / total
+
+    response_count = int(reply_counts.sum())
+    between = starts_ms[1:] - ends_ms[:-1]
+    days, day_counts = np.unique(starts_ms // MS_PER_DAY, return_counts=True)
+    return {
+        'conversations': conversations,
+        'thread_aggregation': {
+            'total_conversations': total,
+            'avg_in_convo_response_time': int(reply_totals.sum()) / response_count if response_count else 0.0,
+            'avg_time_between_convos': int(between.sum()) / len(between) if len(between) else 0.0,
+            'avg_participation_leans': avg_participation_leans,
+            'convos_per_day': dict(zip(_day_keys(days), day_counts.tolist())),
+            'avg_msg_count_per_convo': int(sizes.sum()) / total if total else 0.0,
+            'avg_duration_ms_per_convo': int((ends_ms - starts_ms).sum()) / total if total else 0.0,
+        },
+    }
+
+
+def detect_conversations(data, same_sender_multiplier=1.5, cross_sender_multiplier=3.0,
+                         same_sender_floor_ms=60_000, cross_sender_floor_ms=120_000, min_messages=3):
+    timestamps, sender_ids, senders = _sender_rows(data)
+    return _detect_sessions(
+        timestamps, sender_ids, senders, same_sender_multiplier, cross_sender_multiplier,
+        same_sender_floor_ms, cross_sender_floor_ms, min_messages
+    )
+
+
+def detect_conversations_columns(timestamps, sender_ids, senders, same_sender_multiplier=1.5,
+                                 cross_sender_multiplier=3.0, same_sender_floor_ms=60_000,
+                                 cross_sender_floor_ms=120_000, min_messages=3):
+    """detect_conversations over message columns; `senders[i]` is the name behind sender id i."""
+    timestamps = _column(timestamps, np.int64)
+    sender_ids = _column(sender_ids, np.uint32)
+    _check_same_length(timestamps, sender_ids, 'timestamps and sender_ids')
+    if np.any((sender_ids != MISSING_SENDER) & (sender_ids >= len(senders))):
+        raise ValueError('sender id out of range for senders')
+    timestamps, sender_ids = _sorted_sender_rows(timestamps, sender_ids)
+    return _detect_sessions(
+        timestamps, sender_ids, senders, same_sender_multiplier, cross_sender_multiplier,
+        same_sender_floor_ms, cross_sender_floor_ms, min_messages
+    )
@@ -0,0 +1,107 @@
+import contextlib
+import os
+import secrets
+import shutil
+import sqlite3
+
+
+# Deleted trees are renamed into this folder next to them, then removed by the reaper.
+TRASH_DIR_NAME = '.trash'
+
+
+class ExpiryIndex:
+    """
+    When each expiring path (user folder, upload chunk folder) is due, in one SQLite
+    file shared by every server process, so the reaper never has to scan for them.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS expiry (
+                    path TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS expiry_due ON expiry (expires_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def schedule(self, path, expires_at):
+        """Set (or move) the expiry of `path`."""
+        with self._connection() as conn:
+            conn.execute('''
+                INSERT INTO expiry (path, expires_at) VALUES (?, ?)
+                ON CONFLICT (path) DO UPDATE SET expires_at = excluded.expires_at
+            ''', (path, expires_at))
+
+    def cancel(self, path):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM expiry WHERE path = ?', (path,))
+
+    def claim_due(self, now, limit):
+        """Remove and return up to `limit` paths due by `now`, oldest first. Each path goes to one caller."""
+        with self._connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            paths = [row[0] for row in conn.execute(
+                'SELECT path FROM expiry WHERE expires_at <= ? ORDER BY expires_at LIMIT ?', (now, limit)
+            )]
+            conn.executemany('DELETE FROM expiry WHERE path = ?', [(path,) for path in paths])
+        return paths
+
+    def add_missing(self, entries):
+        """Schedule [(path, expires_at), ...] for paths not in the index yet."""
+        with self._connection() as conn:
+            conn.executemany('INSERT OR IGNORE INTO expiry (path, expires_at) VALUES (?, ?)', entries)
+
+    def get_meta(self, key):
+        with self._connection() as conn:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def stats(self, now):
+        with self._connection() as conn:
+            total, due = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(expires_at <= ?), 0) FROM expiry', (now,)
+            ).fetchone()
+        return {'scheduled': total, 'due': due}
+
+
+def move_to_trash(path):
+    """
+    Rename `path` into the trash folder beside it; a rename is instant however large
+    the tree is. Returns False if `path` is already gone.
+    """
+    trash_dir = os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+    os.makedirs(trash_dir, exist_ok=True)
+    try:
+        os.rename(path, os.path.join(trash_dir, f'{os.path.basename(path)}.{secrets.token_hex(4)}'))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def purge_trash(parent, limit):
+    """Delete up to `limit` trees from parent's trash folder. Returns how many were removed."""
+    trash_dir = os.path.join(parent, TRASH_DIR_NAME)
+    if not os.path.isdir(trash_dir):
+        return 0
+
+    removed = 0
+    for name in sorted(os.listdir(trash_dir))[:limit]:
+        shutil.rmtree(os.path.join(trash_dir, name), ignore_errors=True)
+        removed += 1
+    return removed
@@ -3,79 +3,114 @@ import datetime
 import json
 import os
 import secrets
+import threading
 import time
 import random
-from glob import glob
 from collections import Counter
-from density_finder_rs import find_highest_density_period  # type: ignore
+from density_backend import find_highest_density_period
+from cache_io import atomic_write_json, read_json
+from cache_manifest import ensure_fresh, record_build
+from message_store import message_files, load_message_file
+from game_index import load_game_index, game_index_build_id, read_message_range
+from game_pool import RoundPool
+from round_store import create_round_store
 
 
 game_bp = Blueprint('game', __name__)
 
 
-ROUND_STORE = {}
 ROUND_TTL_SECONDS = 60 * 60
+ROUND_STORE_NAME = 'game_rounds.sqlite3'
 
+# Stats rounds lock the stats to one of these trailing periods.
+STATS_PERIOD_DAYS = (7, 14, 30, 60, 90)
+# Per-thread stats for every period above, built from one load of the thread.
+GAME_STATS_NAME = 'cached_game_stats.json'
 
-def _cleanup_round_store():
-    cutoff = time.time() - ROUND_TTL_SECONDS
-    expired_keys = [key for key, value in ROUND_STORE.items() if value.get('created_at', 0) < cutoff]
-    for key in expired_keys:
-        ROUND_STORE.pop(key, None)
 
+_round_store = None
+_round_pool = None
+_init_lock = threading.Lock()
 
-def _user_inbox_path(user_code):
-    return os.path.join(current_app.config['UPLOAD_FOLDER'], user_code, 'inbox')
 
+def _get_round_store():
+    """The round store picked by GAME_ROUND_STORE, created on first use."""
+    global _round_store
+    with _init_lock:
+        if _round_store is None:
+            config = current_app.config
+            _round_store = create_round_store(
+                config['GAME_ROUND_STORE'],
+                ROUND_TTL_SECONDS,
+                config['GAME_ROUND_STORE_MAX_ROUNDS'],
+                path=os.path.join(config['UPLOAD_FOLDER'], ROUND_STORE_NAME),
+            )
+        return _round_store
 
-def _get_conversations(user_code):
-    user_path = _user_inbox_path(user_code)
-    if not os.path.exists(user_path):
-        return []
 
-    conversations = []
-    for folder in os.listdir(user_path):
-        folder_path = os.path.join(user_path, folder)
-        if not os.path.isdir(folder_path) and not os.path.islink(folder_path):
-            continue
+def game_cache_stats():
+    """Round store and round pool metrics for the admin stats endpoint."""
+    return {
+        'round_store': _get_round_store().stats(),
+        'round_pool': _round_pool.stats() if _round_pool is not None else None,
+    }
+
+
+def discard_user_rounds(user_code):
+    """Forget the user's pooled rounds once their data is deleted or expires."""
+    if _round_pool is not None:
+        _round_pool.discard(user_code)
 
-        try:
-            message_files = glob(os.path.join(folder_path, 'message_*.json'))
-            if not message_files:
-                continue
 
-            with open(message_files[0], encoding='raw_unicode_escape') as f:
-                data = json.loads(f.read().encode('raw_unicode_escape').decode())
+def _get_round_pool():
+    """The process-wide round pool, created on first use with the app's settings."""
+    global _round_pool
+    with _init_lock:
+        if _round_pool is None:
+            app = current_app._get_current_object()
 
-            title = data.get('title', folder)
-            participants = data.get('participants', [])
-            conversations.append({
-                'id': folder,
-                'title': title,
-                'participants': participants,
-            })
-        except Exception:
-            continue
+            # The refill thread runs outside any request, so give it the app context.
+            def generate(user_code, mode, difficulty):
+                with app.app_context():
+                    return _generate_round(user_code, mode, difficulty)
 
-    return sorted(conversations, key=lambda x: x['title'].lower())
+            def generation(user_code):
+                with app.app_context():
+                    return game_index_build_id(os.path.join(app.config['UPLOAD_FOLDER'], user_code))
+
+            _round_pool = RoundPool(
+                generate,
+                generation,
+                size=app.config['GAME_POOL_SIZE'],
+                refill_per_second=app.config['GAME_POOL_REFILL_PER_SECOND'],
+            )
+        return _round_pool
+
+
+def _user_inbox_path(user_code):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], user_code, 'inbox')
+
+
+def _get_conversations(user_code):
+    """Game index entries for the user's threads, sorted by title."""
+    return load_game_index(os.path.join(current_app.config['UPLOAD_FOLDER'], user_code))['threads']
 
 
 def _load_messages(user_code, conversation_id):
     conv_path = os.path.join(_user_inbox_path(user_code), conversation_id)
     messages = []
 
-    for file_path in glob(os.path.join(conv_path, 'message_*.json')):
-        with open(file_path, encoding='raw_unicode_escape') as f:
-            parsed = json.loads(f.read().encode('raw_unicode_escape').decode())
-            messages.extend(parsed.get('messages', []))
+    for file_path in message_files(conv_path):
+        parsed = load_message_file(file_path)
+        messages.extend(parsed.get('messages', []))
 
     return sorted(messages, key=lambda x: x.get('timestamp_ms', 0))
 
 
-def _pick_segment(messages, difficulty):
-    count = len(messages)
+def _pick_segment_bounds(count, difficulty):
+    """[start, end) of a random segment sized and placed for the difficulty, out of `count` messages."""
     if count == 0:
-        return []
+        return 0, 0
 
     if difficulty == 'hard':
         desired_min, desired_max = 25, 50
@@ -101,7 +136,7 @@ def _pick_segment(messages, difficulty):
     start_index = random.randint(start_floor, max(start_floor, start_ceiling))
     end_index = min(count, start_index + seg_len)
 
-    return messages[start_index:end_index]
+    return start_index, end_index
 
 
 def _extract_participant_names(conversation):
@@ -365,6 +400,38 @@ def _sample_period_messages(messages, period_days):
     return sampled
 
 
+def build_period_stats(messages):
+    """Full stats for each trailing period in STATS_PERIOD_DAYS, keyed by the period as a string."""
+    sender_counts = Counter(m.get('sender_name', 'Unknown') for m in messages)
+    sender_map = {sender: f'Person {idx + 1}' for idx, (sender, _) in enumerate(sender_counts.most_common())}
+    return {
+        str(period_days): _build_stats(_sample_period_messages(messages, period_days), sender_map)
+        for period_days in STATS_PERIOD_DAYS
+    }
+
+
+def _load_period_stats(user_code, conversation_id):
+    """Cached per-period stats for a thread, computed from its messages when missing or stale."""
+    thread_folder = os.path.join(_user_inbox_path(user_code), conversation_id)
+    stats_path = os.path.join(thread_folder, GAME_STATS_NAME)
+    if ensure_fresh(thread_folder, 'game_stats'):
+        try:
+            return read_json(stats_path)
+        except (OSError, ValueError):
+            pass
+
+    messages = _load_messages(user_code, conversation_id)
+    if not messages:
+        return None
+    period_stats = build_period_stats(messages)
+    try:
+        record_build(thread_folder, 'game_stats')
+        atomic_write_json(stats_path, period_stats)
+    except Exception as e:
+        print(f"[GAME_STATS] Failed to cache stats for {conversation_id}: {e}")
+    return period_stats
+
+
 def _trim_stats_for_difficulty(stats, difficulty):
     if difficulty != 'hard':
         return stats
@@ -401,50 +468,30 @@ def game_options():
     return jsonify({'options': options})
 
 
-@game_bp.route('/api/game/round', methods=['POST'])
-def game_round():
-    if 'user_code' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
-
-    payload = request.get_json(silent=True) or {}
+def _parse_round_request(payload):
+    """(mode, difficulty, error_response) from a round request body."""
     mode = (payload.get('mode') or 'message').strip().lower()
     difficulty = (payload.get('difficulty') or 'medium').strip().lower()
 
     if mode not in ('message', 'stats'):
-        return jsonify({'error': 'Invalid mode'}), 400
+        return mode, difficulty, (jsonify({'error': 'Invalid mode'}), 400)
 
     if difficulty not in ('easy', 'medium', 'hard'):
-        return jsonify({'error': 'Invalid difficulty'}), 400
-
-    _cleanup_round_store()
-    user_code = session['user_code']
+        return mode, difficulty, (jsonify({'error': 'Invalid difficulty'}), 400)
 
-    conversations = _get_conversations(user_code)
-    valid_conversations = []
-    for conv in conversations:
-        msg_count_hint = 0
-        try:
-            first_file = glob(os.path.join(_user_inbox_path(user_code), conv['id'], 'message_*.json'))
-            if first_file:
-                with open(first_file[0], encoding='raw_unicode_escape') as f:
-                    parsed = json.loads(f.read().encode('raw_unicode_escape').decode())
-                    msg_count_hint = len(parsed.get('messages', []))
-        except Exception:
-            pass
+    return mode, difficulty, None
 
-        if msg_count_hint > 0:
-            valid_conversations.append(conv)
 
+def _generate_round(user_code, mode, difficulty):
+    """
+    Build a round without registering it: {'payload', 'answer'}, or None when the
+    user has no conversation to draw from.
+    """
+    valid_conversations = [conv for conv in _get_conversations(user_code) if conv.get('message_count', 0) > 0]
     if not valid_conversations:
-        return jsonify({'error': 'No conversations with messages found'}), 404
+        return None
 
     chosen = random.choice(valid_conversations)
-    messages = _load_messages(user_code, chosen['id'])
-    if not messages:
-        return jsonify({'error': 'Selected conversation has no messages'}), 404
-
-    sender_counts = Counter(m.get('sender_name', 'Unknown') for m in messages)
-    sender_map = {sender: f'Person {idx + 1}' for idx, (sender, _) in enumerate(sender_counts.most_common())}
     uploader_username = _load_uploader_username(user_code)
 
     response_payload = {
@@ -453,34 +500,89 @@ def game_round():
         'hint': {
             'is_group_chat': len(chosen.get('participants', [])) > 2,
             'participant_count': len(chosen.get('participants', [])),
-            'total_history_messages': len(messages),
+            'total_history_messages': chosen['message_count'],
         },
     }
 
     if mode == 'message':
-        segment = _pick_segment(messages, difficulty)
+        # Only the files holding the segment are read, not the whole thread.
+        start_index, end_index = _pick_segment_bounds(chosen['message_count'], difficulty)
+        segment = read_message_range(os.path.join(_user_inbox_path(user_code), chosen['id']), chosen, start_index, end_index - start_index)
+        if not segment:
+            return None
         # Only trust persisted uploader identity for right/blue message placement.
         user_sender_name = uploader_username
         response_payload['messages'] = _serialize_messages(segment, anonymize=True, user_sender_name=user_sender_name)
     else:
-        period_for_stats = random.choice([7, 14, 30, 60, 90])
-        scoped_messages = _sample_period_messages(messages, period_for_stats)
-        built_stats = _build_stats(scoped_messages, sender_map)
+        period_stats = _load_period_stats(user_code, chosen['id'])
+        if not period_stats:
+            return None
+
+        period_for_stats = random.choice(STATS_PERIOD_DAYS)
+        built_stats = period_stats[str(period_for_stats)]
         response_payload['locked_period_days'] = period_for_stats
         response_payload['stats'] = _trim_stats_for_difficulty(built_stats, difficulty)
 
-    round_id = secrets.token_urlsafe(16)
-    ROUND_STORE[round_id] = {
-        'created_at': time.time(),
-        'user_code': user_code,
-        'conversation_id': chosen['id'],
-        'title': chosen['title'],
-        'participant_count': len(chosen.get('participants', [])),
-        'mode': mode,
+    return {
+        'payload': response_payload,
+        'answer': {
+            'conversation_id': chosen['id'],
+            'title': chosen['title'],
+            'participant_count': len(chosen.get('participants', [])),
+            'mode': mode,
+        },
     }
 
-    response_payload['round_id'] = round_id
-    return jsonify(response_payload)
+
+def _issue_round(user_code, generated):
+    """Register a generated round for guessing and return its response payload."""
+    round_id = secrets.token_urlsafe(16)
+    _get_round_store().put(round_id, dict(generated['answer'], created_at=time.time(), user_code=user_code))
+    return dict(generated['payload'], round_id=round_id)
+
+
+@game_bp.route('/api/game/round', methods=['POST'])
+def game_round():
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    mode, difficulty, error = _parse_round_request(request.get_json(silent=True) or {})
+    if error:
+        return error
+
+    user_code = session['user_code']
+
+    rounds = _get_round_pool().take(user_code, mode, difficulty)
+    if not rounds:
+        return jsonify({'error': 'No conversations with messages found'}), 404
+
+    return jsonify(_issue_round(user_code, rounds[0]))
+
+
+@game_bp.route('/api/game/rounds', methods=['POST'])
+def game_rounds():
+    """Several rounds at once so the client can prefetch."""
+    if 'user_code' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    payload = request.get_json(silent=True) or {}
+    mode, difficulty, error = _parse_round_request(payload)
+    if error:
+        return error
+
+    try:
+        count = int(payload.get('count', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count must be an integer'}), 400
+    count = min(max(count, 1), current_app.config['GAME_BATCH_MAX'])
+
+    user_code = session['user_code']
+
+    rounds = _get_round_pool().take(user_code, mode, difficulty, count=count)
+    if not rounds:
+        return jsonify({'error': 'No conversations with messages found'}), 404
+
+    return jsonify({'rounds': [_issue_round(user_code, generated) for generated in rounds]})
 
 
 @game_bp.route('/api/game/guess', methods=['POST'])
@@ -495,8 +597,7 @@ def game_guess():
     if not round_id or not guessed_conversation_id:
         return jsonify({'error': 'round_id and conversation_id are required'}), 400
 
-    _cleanup_round_store()
-    round_data = ROUND_STORE.get(round_id)
+    round_data = _get_round_store().get(round_id)
 
     if not round_data:
         return jsonify({'error': 'Round not found or expired'}), 404
@@ -0,0 +1,188 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from cache_io import atomic_write_json, read_json
+from cache_manifest import ensure_fresh, record_build, read_manifest, messages_fingerprint
+from message_store import message_files, load_message_file
+
+
+# Per-user summary of every thread the guessing game can draw from, so a round never
+# has to list or parse the whole inbox.
+GAME_INDEX_NAME = 'cached_game_index.json'
+
+# Parsed indexes by user folder, tagged with the manifest build they came from, so
+# back-to-back rounds do not re-read the file.
+LOADED_INDEX_LIMIT = 64
+_loaded_indexes = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def _timestamp(message):
+    try:
+        return int(message.get('timestamp_ms', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def build_thread_entry(thread_folder, thread_id, fingerprint):
+    """
+    Index entry for one thread: title, participants, message and sender counts, and
+    a per-file table of message counts, timestamp ranges and offsets into the
+    thread's time-ordered messages. Returns None for a thread without message files.
+    """
+    files = []
+    sender_counts = Counter()
+    title, participants = thread_id, []
+    for index, path in enumerate(message_files(thread_folder)):
+        data = load_message_file(path)
+        if index == 0:
+            title = data.get('title', thread_id)
+            participants = data.get('participants', [])
+        messages = data.get('messages', [])
+        timestamps = [_timestamp(m) for m in messages]
+        sender_counts.update(m.get('sender_name', 'Unknown') for m in messages)
+        files.append({
+            'name': os.path.basename(path),
+            'count': len(messages),
+            'first_ms': min(timestamps) if timestamps else None,
+            'last_ms': max(timestamps) if timestamps else None,
+        })
+    if not files:
+        return None
+
+    # Exports split a thread into files covering consecutive time ranges. When they
+    # do, the files ordered by time give each file's offset into the sorted thread.
+    non_empty = sorted((f for f in files if f['count']), key=lambda f: f['first_ms'])
+    ordered = all(prev['last_ms'] <= cur['first_ms'] for prev, cur in zip(non_empty, non_empty[1:]))
+    offset = 0
+    for file_entry in non_empty:
+        file_entry['offset'] = offset if ordered else None
+        offset += file_entry['count']
+
+    return {
+        'id': thread_id,
+        'title': title,
+        'participants': participants,
+        'message_count': sum(f['count'] for f in files),
+        'sender_counts': dict(sender_counts),
+        'files': files,
+        'ordered': ordered,
+        'fingerprint': fingerprint,
+    }
+
+
+def build_game_index(user_path, previous=None):
+    """Index every thread in the user's inbox, reusing entries from `previous` for unchanged threads."""
+    inbox_path = os.path.join(user_path, 'inbox')
+    reusable = {entry['id']: entry for entry in (previous or {}).get('threads', [])}
+    threads = []
+    if os.path.isdir(inbox_path):
+        for thread_id in os.listdir(inbox_path):
+            thread_folder = os.path.join(inbox_path, thread_id)
+            if not os.path.isdir(thread_folder):
+                continue
+            try:
+                fingerprint = messages_fingerprint(thread_folder)
+                entry = reusable.get(thread_id)
+                if entry is None or entry.get('fingerprint') != fingerprint:
+                    entry = build_thread_entry(thread_folder, thread_id, fingerprint)
+            except Exception as e:
+                print(f"[GAME_INDEX] Skipping {thread_id}: {e}")
+                continue
+            if entry is not None:
+                threads.append(entry)
+
+    threads.sort(key=lambda t: t['title'].lower())
+    return {'threads': threads}
+
+
+def _read_index(index_path):
+    try:
+        return read_json(index_path)
+    except (OSError, ValueError):
+        return None
+
+
+def _remember(user_path, build_id, index):
+    if build_id is None:
+        return
+    with _loaded_lock:
+        _loaded_indexes[user_path] = (build_id, index)
+        _loaded_indexes.move_to_end(user_path)
+        while len(_loaded_indexes) > LOADED_INDEX_LIMIT:
+            _loaded_indexes.popitem(last=False)
+
+
+def game_index_build_id(user_path):
+    """Build id of the user's current game index (rebuilding it if stale); changes whenever the index does."""
+    load_game_index(user_path)
+    return (read_manifest(user_path).get('game_index') or {}).get('build_id')
+
+
+def load_game_index(user_path):
+    """Return the user's game index, rebuilding it (incrementally) when the inbox changed."""
+    if not os.path.isdir(os.path.join(user_path, 'inbox')):
+        # Expired or deleted while the session lives on; never recreate the folder's manifest.
+        with _loaded_lock:
+            _loaded_indexes.pop(user_path, None)
+        return {'threads': []}
+    index_path = os.path.join(user_path, GAME_INDEX_NAME)
+    with _loaded_lock:
+        loaded = _loaded_indexes.get(user_path)
+    # Read before the freshness check, which deletes a stale index we can still reuse entries from.
+    previous = loaded[1] if loaded else _read_index(index_path)
+    if ensure_fresh(user_path, 'game_index'):
+        build_id = (read_manifest(user_path).get('game_index') or {}).get('build_id')
+        if loaded and build_id is not None and loaded[0] == build_id:
+            return loaded[1]
+        if loaded:
+            previous = _read_index(index_path)  # another process rebuilt it
+        if previous is not None:
+            _remember(user_path, build_id, previous)
+            return previous
+
+    # Recorded up front against the inputs as they are now; changes during the build leave it stale.
+    record_build(user_path, 'game_index')
+    build_id = (read_manifest(user_path).get('game_index') or {}).get('build_id')
+    index = build_game_index(user_path, previous)
+    _remember(user_path, build_id, index)
+    try:
+        atomic_write_json(index_path, index)
+    except Exception as e:
+        print(f"[GAME_INDEX] Failed to write index for {os.path.basename(user_path)}: {e}")
+    print(f"[GAME_INDEX] Indexed {len(index['threads'])} threads for {os.path.basename(user_path)}")
+    return index
+
+
+def read_message_range(thread_folder, entry, start, count):
+    """
+    Messages [start, start + count) of a thread in timestamp order, parsing only the
+    files that overlap the range. Falls back to loading the whole thread when its
+    files are not split by time or no longer match the index.
+    """
+    wanted = []
+    if entry.get('ordered'):
+        end = start + count
+        for file_entry in sorted((f for f in entry['files'] if f['count']), key=lambda f: f['offset']):
+            if file_entry['offset'] < end and start < file_entry['offset'] + file_entry['count']:
+                wanted.append(file_entry)
+
+    messages = []
+    try:
+        if not wanted:
+            raise FileNotFoundError(thread_folder)
+        for file_entry in wanted:
+            file_messages = load_message_file(os.path.join(thread_folder, file_entry['name'])).get('messages', [])
+            if len(file_messages) != file_entry['count']:
+                raise ValueError(f"{file_entry['name']} changed since it was indexed")
+            messages.extend(sorted(file_messages, key=_timestamp))
+        first = wanted[0]['offset']
+    except (OSError, ValueError):
+        messages = []
+        for path in message_files(thread_folder):
+            messages.extend(load_message_file(path).get('messages', []))
+        messages.sort(key=_timestamp)
+        first = 0
+
+    return messages[start - first:start - first + count]
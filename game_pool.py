@@ -0,0 +1,112 @@
+import collections
+import queue
+import threading
+import time
+
+
+class RoundPool:
+    """
+    Pre-generated game rounds per (user code, mode, difficulty), kept topped up by a
+    background thread so a round request usually just pops one.
+
+    `generate(user_code, mode, difficulty)` returns a round or None. `generation(user_code)`
+    identifies the data a round was built from; rounds from an older generation
+    (the inbox changed since) are discarded instead of served.
+    """
+    def __init__(self, generate, generation, size=3, refill_per_second=5.0, max_users=256):
+        self.generate = generate
+        self.generation = generation
+        self.size = size
+        self.refill_interval = 1.0 / refill_per_second if refill_per_second > 0 else 0.0
+        self.max_users = max_users
+        self._pools = collections.OrderedDict()  # user_code -> {(mode, difficulty): deque of (generation, round)}
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._requests = queue.Queue()
+        self._worker = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._refill_loop, daemon=True)
+            self._worker.start()
+
+    def _user_pools(self, user_code):
+        pools = self._pools.get(user_code)
+        if pools is None:
+            pools = self._pools[user_code] = {}
+            while len(self._pools) > self.max_users:
+                self._pools.popitem(last=False)
+        self._pools.move_to_end(user_code)
+        return pools
+
+    def take(self, user_code, mode, difficulty, count=1):
+        """
+        Pop up to `count` ready rounds, generating the rest inline, and schedule a refill.
+        Returns the rounds (fewer than `count` if generation produced none).
+        """
+        generation = self.generation(user_code)
+        rounds = []
+        with self._lock:
+            pool = self._user_pools(user_code).setdefault((mode, difficulty), collections.deque())
+            while pool and len(rounds) < count:
+                round_generation, pooled = pool.popleft()
+                if round_generation == generation:
+                    rounds.append(pooled)
+        while len(rounds) < count:
+            generated = self.generate(user_code, mode, difficulty)
+            if generated is None:
+                break
+            rounds.append(generated)
+        self.request_refill(user_code, mode, difficulty)
+        return rounds
+
+    def request_refill(self, user_code, mode, difficulty):
+        key = (user_code, mode, difficulty)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._ensure_worker()
+        self._requests.put(key)
+
+    def discard(self, user_code):
+        """Drop a user's pooled rounds, e.g. when their data is deleted."""
+        with self._lock:
+            self._pools.pop(user_code, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._pools),
+                'rounds': sum(len(pool) for pools in self._pools.values() for pool in pools.values()),
+                'pending_refills': len(self._pending),
+            }
+
+    def _refill_loop(self):
+        while True:
+            user_code, mode, difficulty = key = self._requests.get()
+            try:
+                self._refill(user_code, mode, difficulty)
+            except Exception as e:
+                print(f"[GAME_POOL] Refill failed for {user_code} {mode}/{difficulty}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _refill(self, user_code, mode, difficulty):
+        generation = self.generation(user_code)
+        while True:
+            with self._lock:
+                pool = self._user_pools(user_code).setdefault((mode, difficulty), collections.deque())
+                # Stale rounds would only be discarded on take; make room for fresh ones now.
+                while pool and pool[0][0] != generation:
+                    pool.popleft()
+                if len(pool) >= self.size:
+                    return
+            generated = self.generate(user_code, mode, difficulty)
+            if generated is None:
+                return
+            with self._lock:
+                self._user_pools(user_code).setdefault((mode, difficulty), collections.deque()).append((generation, generated))
+            if self.refill_interval:
+                time.sleep(self.refill_interval)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import shutil
+import zlib
+
+from cache_io import atomic_write_json, notify_storage, remove_path
+from message_store import is_message_file, logical_name, open_message_file, write_message_file
+
+
+INBOX_MARKER = 'messages/inbox/'
+FINGERPRINTS_NAME = 'thread_fingerprints.json'
+
+
+def _safe_component(name):
+    """A single path component that cannot leave the folder it is joined onto."""
+    return name not in ('', '.', '..') and '\\' not in name and '\0' not in name
+
+
+def _under(path, root):
+    root = os.path.realpath(root)
+    return os.path.commonpath([os.path.realpath(path), root]) == root
+
+
+def zip_inbox_threads(zip_ref):
+    """
+    Group the export's inbox entries by thread folder: {thread_id: [(relative_path, ZipInfo), ...]}.
+    Entries whose thread id or path is not a plain relative path (.., absolute, backslashes) are skipped.
+    """
+    threads = {}
+    for info in zip_ref.infolist():
+        if INBOX_MARKER not in info.filename or info.filename.endswith('/'):
+            continue
+        relative_path = info.filename.split(INBOX_MARKER)[-1]
+        thread_id, _, rest = relative_path.partition('/')
+        if not rest:
+            continue
+        if not _safe_component(thread_id) or not all(_safe_component(part) for part in rest.split('/')):
+            print(f"[UPLOAD] Skipping unsafe zip entry {info.filename!r}")
+            continue
+        threads.setdefault(thread_id, []).append((rest, info))
+    return threads
+
+
+def _fingerprint(entries):
+    """Hash of (relative path, size, CRC32) for a thread's files."""
+    digest = hashlib.sha256()
+    for relative_path, size, crc in sorted(entries):
+        digest.update(f'{relative_path}\0{size}\0{crc:08x}\n'.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+
+def zip_thread_fingerprint(entries):
+    # Size and CRC come from the zip directory, so no file is decompressed.
+    return _fingerprint((rest, info.file_size, info.CRC) for rest, info in entries)
+
+
+def disk_thread_fingerprint(thread_folder):
+    """
+    Fingerprint an extracted thread the same way as its zip entries (reads every file
+    once). Compressed message files count under their original name and content.
+    """
+    entries = []
+    for root, _, files in os.walk(thread_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            relative_path = os.path.relpath(path, thread_folder).replace(os.sep, '/')
+            if '/' not in relative_path and relative_path.startswith(('cached_', '.')):
+                # Our own per-thread caches and temp files, not part of the export.
+                continue
+            message_file = '/' not in relative_path and is_message_file(relative_path)
+            crc, size = 0, 0
+            with (open_message_file(path) if message_file else open(path, 'rb')) as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+            if message_file:
+                relative_path = logical_name(relative_path)
+            entries.append((relative_path, size, crc))
+    return _fingerprint(entries)
+
+
+def extract_threads(zip_ref, threads, inbox_path, thread_ids=None, compression='none'):
+    """
+    Extract the given threads (default: all) into inbox_path, replacing existing
+    thread folders. Message JSON is stored per `compression` (see message_store).
+    """
+    fingerprints = {}
+    for thread_id, entries in threads.items():
+        if thread_ids is not None and thread_id not in thread_ids:
+            continue
+        if not _safe_component(thread_id) or '/' in thread_id:
+            raise ValueError(f'Unsafe thread id: {thread_id!r}')
+        thread_folder = os.path.join(inbox_path, thread_id)
+        # Checked before anything is removed; a shared chat's symlink is only unlinked.
+        if not os.path.islink(thread_folder) and (
+                not _under(thread_folder, inbox_path)
+                or os.path.realpath(thread_folder) == os.path.realpath(inbox_path)):
+            raise ValueError(f'Thread folder escapes the inbox: {thread_id!r}')
+        if os.path.islink(thread_folder):
+            # A chat shared from another code; never write through into its files.
+            os.unlink(thread_folder)
+        elif os.path.isdir(thread_folder):
+            # Drops the thread's message files and every per-thread cache with them.
+            remove_path(thread_folder)
+        for relative_path, info in entries:
+            extract_path = os.path.join(thread_folder, relative_path)
+            if not _under(extract_path, thread_folder):
+                raise ValueError(f'Zip entry escapes its thread folder: {info.filename!r}')
+            os.makedirs(os.path.dirname(extract_path), exist_ok=True)
+            with zip_ref.open(info) as source:
+                if '/' not in relative_path and is_message_file(relative_path):
+                    extract_path = write_message_file(source, extract_path, compression)
+                else:
+                    with open(extract_path, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+            notify_storage(extract_path, os.path.getsize(extract_path))
+        fingerprints[thread_id] = zip_thread_fingerprint(entries)
+    return fingerprints
+
+
+def load_fingerprints(user_path):
+    """Stored thread fingerprints, computing them from disk for uploads that predate them."""
+    path = os.path.join(user_path, FINGERPRINTS_NAME)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    inbox_path = os.path.join(user_path, 'inbox')
+    fingerprints = {}
+    if os.path.isdir(inbox_path):
+        for thread_id in os.listdir(inbox_path):
+            thread_folder = os.path.join(inbox_path, thread_id)
+            if os.path.isdir(thread_folder) and not os.path.islink(thread_folder):
+                fingerprints[thread_id] = disk_thread_fingerprint(thread_folder)
+    return fingerprints
+
+
+def save_fingerprints(user_path, fingerprints):
+    atomic_write_json(os.path.join(user_path, FINGERPRINTS_NAME), fingerprints)
+
+
+def apply_inbox_update(zip_ref, user_path, compression='none'):
+    """
+    Merge a newer export into an existing inbox: threads whose fingerprint changed
+    are re-extracted, new threads are added, everything else is left untouched
+    (including its per-thread caches). Threads missing from the newer export are
+    kept, since exports are cumulative.
+
+    Returns {'added': [...], 'changed': [...], 'unchanged': count}.
+    """
+    threads = zip_inbox_threads(zip_ref)
+    if not threads:
+        raise Exception('Instagram inbox folder not found in zip')
+
+    fingerprints = load_fingerprints(user_path)
+    added, changed = [], []
+    unchanged = 0
+    for thread_id, entries in threads.items():
+        previous = fingerprints.get(thread_id)
+        if previous is None:
+            added.append(thread_id)
+        elif previous != zip_thread_fingerprint(entries):
+            changed.append(thread_id)
+        else:
+            unchanged += 1
+
+    inbox_path = os.path.join(user_path, 'inbox')
+    fingerprints.update(extract_threads(
+        zip_ref, threads, inbox_path, thread_ids=set(added) | set(changed), compression=compression
+    ))
+    save_fingerprints(user_path, fingerprints)
+    return {'added': sorted(added), 'changed': sorted(changed), 'unchanged': unchanged}
@@ -0,0 +1,508 @@
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from cache_io import current_owner_id
+from metrics import JOB_SECONDS, JOB_WAIT_SECONDS
+from profiling import DEFAULT_INTERVAL_SECONDS, profile_current_thread, profile_filename
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+TERMINAL_JOB_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Lower numbers are picked first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+# Finished job records are kept briefly so status polls can observe the outcome.
+FINISHED_JOB_TTL_SECONDS = 5 * 60
+
+# Registry rows whose owner stopped heartbeating are treated as abandoned.
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 60
+# Progress-only updates are written to the registry at most this often per job.
+REGISTRY_PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class JobCancelled(Exception):
+    """Raised from inside a job target once cancellation has been requested."""
+
+
+class Job:
+    """Tracks one queued or running computation for a (user, job type) pair."""
+    def __init__(self, user_code, job_type, target, priority, max_retries, profile=False):
+        self.user_code = user_code
+        self.job_type = job_type
+        self.target = target
+        self.priority = priority
+        self.max_retries = max_retries
+        self.profile = profile
+        self.attempts = 0
+        self.state = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.retry_at = None
+        self.error = None
+        self.cancel_requested = False
+        self.progress_done = 0
+        self.progress_total = None
+        self.phase = None
+        self.progress_started_at = None
+        self.version = 0
+        self._changed = threading.Condition()
+        self._on_change = None
+
+    @property
+    def key(self):
+        return (self.user_code, self.job_type)
+
+    def check_cancelled(self):
+        """Cooperative cancellation point for long-running job targets."""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def report_progress(self, done=None, total=None, phase=None):
+        """Record structured progress; also acts as a cancellation point."""
+        if phase is not None and phase != self.phase:
+            self.phase = phase
+            self.progress_started_at = time.time()
+        if total is not None:
+            self.progress_total = total
+        if done is not None:
+            self.progress_done = done
+        self.touch()
+        self.check_cancelled()
+
+    def touch(self):
+        """Wake anyone waiting in `wait_for_change`."""
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+        if self._on_change:
+            self._on_change(self)
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes past `version` or `timeout` elapses. Returns the current version."""
+        with self._changed:
+            if self.version == version:
+                self._changed.wait(timeout)
+            return self.version
+
+    def eta_seconds(self):
+        # Linear extrapolation over the current phase only.
+        if not self.progress_total or not self.progress_done or not self.progress_started_at:
+            return None
+        elapsed = time.time() - self.progress_started_at
+        remaining = max(0, self.progress_total - self.progress_done)
+        return round(elapsed / self.progress_done * remaining, 1)
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'job_type': self.job_type,
+            'state': self.state,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'max_retries': self.max_retries,
+            'profiled': self.profile,
+            'queued_seconds': round((self.started_at or now) - self.created_at, 2),
+            'elapsed_seconds': round((self.finished_at or now) - self.started_at, 2) if self.started_at else 0,
+            'retry_in_seconds': round(max(0.0, self.retry_at - now), 2) if self.retry_at else None,
+            'error': self.error,
+            'progress': {
+                'done': self.progress_done,
+                'total': self.progress_total,
+                'phase': self.phase,
+                'eta_seconds': self.eta_seconds(),
+            },
+        }
+
+
+class SQLiteJobRegistry:
+    """
+    Job state shared by every server process through one SQLite file.
+
+    Each process writes its own jobs' status and heartbeats them; other processes
+    read those rows to dedupe submissions, report status and request cancellation.
+    """
+    def __init__(self, path):
+        self.path = path
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    user_code TEXT NOT NULL,
+                    job_type TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    status_json TEXT NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    heartbeat_at REAL NOT NULL,
+                    PRIMARY KEY (user_code, job_type)
+                )
+            ''')
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _row_to_status(self, row):
+        state, status_json, heartbeat_at = row
+        if state in ACTIVE_JOB_STATES and time.time() - heartbeat_at > JOB_STALE_SECONDS:
+            return None
+        if state in TERMINAL_JOB_STATES and time.time() - heartbeat_at > FINISHED_JOB_TTL_SECONDS:
+            return None
+        return json.loads(status_json)
+
+    def record(self, job):
+        """Upsert the job's status. Returns True when another process has requested cancellation."""
+        # A pending cancel request survives updates from the same owner's active job.
+        with self._connection() as conn:
+            conn.execute('''
+                INSERT INTO jobs (user_code, job_type, owner, state, status_json, cancel_requested, heartbeat_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_code, job_type) DO UPDATE SET
+                    cancel_requested = CASE
+                        WHEN jobs.owner = excluded.owner AND jobs.state IN ('queued', 'running')
+                        THEN MAX(jobs.cancel_requested, excluded.cancel_requested)
+                        ELSE excluded.cancel_requested
+                    END,
+                    owner = excluded.owner,
+                    state = excluded.state,
+                    status_json = excluded.status_json,
+                    heartbeat_at = excluded.heartbeat_at
+            ''', (
+                job.user_code, job.job_type, current_owner_id(), job.state,
+                json.dumps(job.to_dict()), int(job.cancel_requested), time.time()
+            ))
+            (cancel_requested,) = conn.execute(
+                'SELECT cancel_requested FROM jobs WHERE user_code = ? AND job_type = ?',
+                (job.user_code, job.job_type)
+            ).fetchone()
+        return bool(cancel_requested)
+
+    def status(self, user_code, job_type):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT state, status_json, heartbeat_at FROM jobs WHERE user_code = ? AND job_type = ?',
+                (user_code, job_type)
+            ).fetchone()
+        return self._row_to_status(row) if row else None
+
+    def jobs_for_user(self, user_code):
+        with self._connection() as conn:
+            rows = conn.execute(
+                'SELECT state, status_json, heartbeat_at FROM jobs WHERE user_code = ?', (user_code,)
+            ).fetchall()
+        return [status for status in (self._row_to_status(row) for row in rows) if status]
+
+    def queue_depth(self):
+        with self._connection() as conn:
+            (count,) = conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE state = ? AND heartbeat_at >= ?',
+                (JOB_QUEUED, time.time() - JOB_STALE_SECONDS)
+            ).fetchone()
+        return count
+
+    def request_cancel(self, user_code, job_type):
+        with self._connection() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET cancel_requested = 1 '
+                'WHERE user_code = ? AND job_type = ? AND state IN (?, ?) AND heartbeat_at >= ?',
+                (user_code, job_type, JOB_QUEUED, JOB_RUNNING, time.time() - JOB_STALE_SECONDS)
+            )
+        return cursor.rowcount > 0
+
+    def clear(self, user_code, job_type):
+        """Delete a finished (or abandoned) row; a live job keeps its row and any cancel request."""
+        with self._connection() as conn:
+            conn.execute(
+                'DELETE FROM jobs WHERE user_code = ? AND job_type = ? '
+                'AND (state NOT IN (?, ?) OR heartbeat_at < ?)',
+                (user_code, job_type, JOB_QUEUED, JOB_RUNNING, time.time() - JOB_STALE_SECONDS)
+            )
+
+    def heartbeat(self, keys):
+        """Refresh this process's active rows and return the keys with pending cancel requests."""
+        owner = current_owner_id()
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                'UPDATE jobs SET heartbeat_at = ? WHERE user_code = ? AND job_type = ? AND owner = ?',
+                [(now, user_code, job_type, owner) for user_code, job_type in keys]
+            )
+            conn.execute(
+                'DELETE FROM jobs WHERE state NOT IN (?, ?) AND heartbeat_at < ?',
+                (JOB_QUEUED, JOB_RUNNING, now - FINISHED_JOB_TTL_SECONDS)
+            )
+            rows = conn.execute(
+                'SELECT user_code, job_type FROM jobs WHERE owner = ? AND cancel_requested = 1', (owner,)
+            ).fetchall()
+        return {tuple(row) for row in rows}
+
+
+class JobScheduler:
+    """
+    Bounded worker pool for background computations.
+
+    Jobs are deduplicated by (user_code, job_type): submitting while a job for the
+    same key is queued or running returns the existing job. Ready jobs are served
+    by priority, failed attempts are retried with exponential backoff, and queued
+    or running jobs can be cancelled (running targets stop at their next
+    `job.check_cancelled()` call).
+
+    With a `registry`, job state is mirrored to storage shared by every server
+    process, and the status methods also report jobs owned by other processes.
+    Jobs submitted with `profile=True` have each attempt sampled into a collapsed-stack
+    file under `profile_folder`.
+    """
+    def __init__(self, max_workers=4, retry_backoff_seconds=2.0, registry=None,
+                 profile_folder=None, profile_interval=DEFAULT_INTERVAL_SECONDS):
+        self.max_workers = max(1, int(max_workers))
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.registry = registry
+        self.profile_folder = profile_folder
+        self.profile_interval = profile_interval
+        self._recorded = {}
+        # _recorded is updated from every thread that touches a job, not only under _cond.
+        self._recorded_lock = threading.Lock()
+        self._heartbeat_thread = None
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._ready = []
+        self._delayed = []
+        self._seq = itertools.count()
+        self._workers = []
+
+    def _ensure_workers(self):
+        # Started lazily so forked server workers each get their own live pool.
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if self.registry and not (self._heartbeat_thread and self._heartbeat_thread.is_alive()):
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self._heartbeat_thread.start()
+
+    def _on_job_change(self, job):
+        if not self.registry:
+            return
+        # State transitions are always written; progress-only updates are throttled.
+        now = time.time()
+        with self._recorded_lock:
+            last_state, last_written = self._recorded.get(job.key, (None, 0))
+            if job.state == last_state and now - last_written < REGISTRY_PROGRESS_INTERVAL_SECONDS:
+                return
+            self._recorded[job.key] = (job.state, now)
+        try:
+            if self.registry.record(job) and job.state == JOB_RUNNING:
+                # Picked up by the target's next progress report or cancellation check.
+                job.cancel_requested = True
+        except sqlite3.Error as e:
+            print(f"[JOB_REGISTRY] Failed to record {job.job_type} for user {job.user_code}: {e}")
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._cond:
+                active = {key: job for key, job in self._jobs.items() if job.state in ACTIVE_JOB_STATES}
+            try:
+                cancel_keys = self.registry.heartbeat(list(active))
+            except sqlite3.Error as e:
+                print(f"[JOB_REGISTRY] Heartbeat failed: {e}")
+                continue
+            # Apply cancel requests that other processes wrote to the registry.
+            for user_code, job_type in cancel_keys:
+                if (user_code, job_type) in active:
+                    self.cancel(user_code, job_type)
+
+    def _prune_finished(self):
+        cutoff = time.time() - FINISHED_JOB_TTL_SECONDS
+        stale_keys = [
+            key for key, job in self._jobs.items()
+            if job.state in TERMINAL_JOB_STATES and job.finished_at and job.finished_at < cutoff
+        ]
+        with self._recorded_lock:
+            for key in stale_keys:
+                self._jobs.pop(key, None)
+                self._recorded.pop(key, None)
+
+    def submit(self, user_code, job_type, target, priority=PRIORITY_NORMAL, max_retries=2, profile=False):
+        """Queue `target(user_code, job)` unless an equivalent job is active. Returns (job, created)."""
+        with self._cond:
+            self._prune_finished()
+            existing = self._jobs.get((user_code, job_type))
+            if existing and existing.state in ACTIVE_JOB_STATES:
+                if priority < existing.priority and existing.state == JOB_QUEUED and existing.retry_at is None:
+                    existing.priority = priority
+                    heapq.heappush(self._ready, (priority, next(self._seq), existing))
+                return existing, False
+
+            job = Job(user_code, job_type, target, priority, max_retries, profile)
+            job._on_change = self._on_job_change
+            self._jobs[job.key] = job
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+            self._ensure_workers()
+            self._cond.notify()
+        job.touch()
+        return job, True
+
+    def get(self, user_code, job_type):
+        """Return the local Job object for the key, if this process owns one."""
+        with self._cond:
+            self._prune_finished()
+            return self._jobs.get((user_code, job_type))
+
+    def status(self, user_code, job_type):
+        """Status dict for the key from this process or, failing that, the shared registry."""
+        job = self.get(user_code, job_type)
+        if job:
+            return job.to_dict()
+        if self.registry:
+            return self.registry.status(user_code, job_type)
+        return None
+
+    def jobs_for_user(self, user_code):
+        """Status dicts for every job the user has in this process or the shared registry."""
+        with self._cond:
+            self._prune_finished()
+            local = {job_type: job.to_dict() for (code, job_type), job in self._jobs.items() if code == user_code}
+        if self.registry:
+            for status in self.registry.jobs_for_user(user_code):
+                local.setdefault(status['job_type'], status)
+        return list(local.values())
+
+    def clear(self, user_code, job_type):
+        """Forget a finished job so the next request can start a fresh one."""
+        with self._cond:
+            job = self._jobs.get((user_code, job_type))
+            if job and job.state not in ACTIVE_JOB_STATES:
+                self._jobs.pop(job.key, None)
+        if self.registry and not (job and job.state in ACTIVE_JOB_STATES):
+            self.registry.clear(user_code, job_type)
+
+    def cancel(self, user_code, job_type):
+        """Request cancellation. Returns False when no active job exists for the key."""
+        with self._cond:
+            job = self._jobs.get((user_code, job_type))
+            active = job is not None and job.state in ACTIVE_JOB_STATES
+            if active:
+                job.cancel_requested = True
+                if job.state == JOB_QUEUED:
+                    # Queued entries are skipped lazily when a worker pops them.
+                    job.state = JOB_CANCELLED
+                    job.finished_at = time.time()
+        # Registry writes can wait on SQLite, so they happen after releasing _cond.
+        if not active:
+            return bool(self.registry and self.registry.request_cancel(user_code, job_type))
+        job.touch()
+        return True
+
+    def queue_depth(self):
+        if self.registry:
+            return self.registry.queue_depth()
+        with self._cond:
+            return sum(1 for job in self._jobs.values() if job.state == JOB_QUEUED)
+
+    def _next_job(self):
+        with self._cond:
+            job = self._claim_next()
+        job.touch()
+        return job
+
+    def _claim_next(self):
+        """Mark the next ready job running, waiting for one if needed. Call with _cond held."""
+        while True:
+            now = time.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, job = heapq.heappop(self._delayed)
+                job.retry_at = None
+                heapq.heappush(self._ready, (job.priority, seq, job))
+
+            while self._ready:
+                priority, _, job = heapq.heappop(self._ready)
+                # Skip cancelled entries and stale duplicates left by priority bumps.
+                if job.state != JOB_QUEUED or job.retry_at is not None or priority != job.priority:
+                    continue
+                if self._jobs.get(job.key) is not job:
+                    continue
+                job.state = JOB_RUNNING
+                job.attempts += 1
+                job.started_at = job.started_at or now
+                return job
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._cond.wait(timeout)
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job.attempts == 1:
+                JOB_WAIT_SECONDS.labels(job.job_type).observe(job.started_at - job.created_at)
+            started = time.perf_counter()
+            try:
+                with self._profile(job):
+                    job.target(job.user_code, job)
+            except JobCancelled:
+                print(f"[JOB_CANCELLED] {job.job_type} for user {job.user_code}")
+                outcome = JOB_CANCELLED
+                self._finish(job, JOB_CANCELLED)
+            except Exception as e:
+                print(f"[JOB_ERROR] {job.job_type} attempt {job.attempts} failed for user {job.user_code}: {e}")
+                traceback.print_exc()
+                outcome = 'error'
+                self._retry_or_fail(job, str(e))
+            else:
+                print(f"[JOB_DONE] {job.job_type} for user {job.user_code}")
+                outcome = JOB_DONE
+                self._finish(job, JOB_DONE)
+            JOB_SECONDS.labels(job.job_type, outcome).observe(time.perf_counter() - started)
+
+    def _profile(self, job):
+        if not (job.profile and self.profile_folder):
+            return contextlib.nullcontext()
+        name = profile_filename('job', job.job_type, job.user_code, f'attempt{job.attempts}')
+        return profile_current_thread(os.path.join(self.profile_folder, name), self.profile_interval)
+
+    def _finish(self, job, state):
+        with self._cond:
+            job.state = state
+            job.finished_at = time.time()
+        job.touch()
+
+    def _retry_or_fail(self, job, error):
+        with self._cond:
+            job.error = error
+            if job.cancel_requested:
+                job.state = JOB_CANCELLED
+                job.finished_at = time.time()
+            elif job.attempts <= job.max_retries:
+                delay = self.retry_backoff_seconds * (2 ** (job.attempts - 1))
+                job.state = JOB_QUEUED
+                job.retry_at = time.time() + delay
+                heapq.heappush(self._delayed, (job.retry_at, next(self._seq), job))
+                self._cond.notify()
+            else:
+                job.state = JOB_FAILED
+                job.finished_at = time.time()
+        job.touch()
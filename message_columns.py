@@ -0,0 +1,113 @@
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+
+
+# Sender id for messages without a sender name (matches density_finder_rs and density_numpy).
+MISSING_SENDER = 0xFFFFFFFF
+
+
+class MessageColumns:
+    """
+    One thread's time-sorted messages as typed arrays. The *_columns functions of both
+    density backends read these through the buffer protocol; the Rust ones compute
+    without holding the GIL.
+
+    timestamps: int64, -1 where a message has none
+    sender_ids: uint32 indexes into `senders`, MISSING_SENDER where a message has none
+    content / content_offsets: message i's UTF-8 content is content[offsets[i]:offsets[i + 1]]
+    """
+    def __init__(self, messages):
+        self.timestamps = array('q')
+        self.sender_ids = array('I')
+        self.content_offsets = array('Q', [0])
+        self.senders = []
+        self._sender_ids = {}
+        content = bytearray()
+
+        for message in messages:
+            ts = message.get('timestamp_ms')
+            self.timestamps.append(ts if isinstance(ts, int) and ts >= 0 else -1)
+
+            sender = message.get('sender_name')
+            if isinstance(sender, str):
+                sender_id = self._sender_ids.get(sender)
+                if sender_id is None:
+                    sender_id = self._sender_ids[sender] = len(self.senders)
+                    self.senders.append(sender)
+                self.sender_ids.append(sender_id)
+            else:
+                self.sender_ids.append(MISSING_SENDER)
+
+            text = message.get('content')
+            if isinstance(text, str):
+                # Lone surrogates survive as invalid UTF-8, which the Rust side skips
+                # just as it skips strings it cannot extract from dicts.
+                content += text.encode('utf-8', 'surrogatepass')
+            self.content_offsets.append(len(content))
+
+        self.content = bytes(content)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self):
+        arrays = (self.timestamps, self.sender_ids, self.content_offsets)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.content) + sum(len(s) for s in self.senders)
+
+    def sender_id(self, name):
+        """Id of a sender name; an id no message has if the name never appears."""
+        return self._sender_ids.get(name, len(self.senders))
+
+    def count_between(self, start_ms, end_ms):
+        """Messages with start_ms <= timestamp < end_ms."""
+        return bisect.bisect_left(self.timestamps, end_ms) - bisect.bisect_left(self.timestamps, start_ms)
+
+    def count_sender_between(self, sender_id, start_ms, end_ms):
+        lo = bisect.bisect_left(self.timestamps, start_ms)
+        hi = bisect.bisect_left(self.timestamps, end_ms)
+        return sum(1 for i in range(lo, hi) if self.sender_ids[i] == sender_id)
+
+
+class ColumnsCache:
+    """Byte-budgeted LRU of MessageColumns, validated against the thread's message fingerprint."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (fingerprint, columns)
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1].nbytes
+
+    def get(self, key, fingerprint):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._drop(key)
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, fingerprint, columns):
+        with self._lock:
+            self._drop(key)
+            if columns.nbytes > self.max_bytes:
+                return
+            self._entries[key] = (fingerprint, columns)
+            self._bytes += columns.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
@@ -0,0 +1,112 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from glob import glob
+
+from metrics import MESSAGE_BYTES_READ
+
+try:
+    import zstandard  # optional; only needed for MESSAGE_COMPRESSION=zstd
+except ImportError:
+    zstandard = None
+
+
+# Extracted message_*.json files are stored compressed; the suffix says how.
+COMPRESSION_SUFFIXES = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def resolve_compression(name):
+    """Validate a MESSAGE_COMPRESSION setting, falling back to gzip when zstandard is missing."""
+    if name not in COMPRESSION_SUFFIXES:
+        raise ValueError(f'Unknown message compression: {name}')
+    if name == 'zstd' and zstandard is None:
+        print("[MESSAGE_STORE] zstandard is not installed, storing messages with gzip")
+        return 'gzip'
+    return name
+
+
+def logical_name(path):
+    """message_1.json for message_1.json, message_1.json.gz and message_1.json.zst."""
+    name = os.path.basename(path)
+    for suffix in ('.gz', '.zst'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def is_message_file(path):
+    name = logical_name(path)
+    return name.startswith('message_') and name.endswith('.json')
+
+
+def message_files(thread_folder):
+    """A thread's message files in name order, whichever way each is stored."""
+    by_name = {}
+    for pattern in ('message_*.json', 'message_*.json.gz', 'message_*.json.zst'):
+        for path in glob(os.path.join(thread_folder, pattern)):
+            name = logical_name(path)
+            # A raw file next to its compressed copy is left over from an interrupted
+            # compression; the compressed copy is complete (it is renamed into place).
+            if name not in by_name or by_name[name].endswith('.json'):
+                by_name[name] = path
+    return [by_name[name] for name in sorted(by_name)]
+
+
+def open_message_file(path):
+    """Binary stream over a message file's JSON, decompressing as it is read."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f'zstandard is required to read {path}')
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def read_message_bytes(path):
+    with open_message_file(path) as f:
+        data = f.read()
+    MESSAGE_BYTES_READ.inc(len(data))
+    return data
+
+
+def load_message_file(path):
+    """Parse a message file, undoing Instagram's latin-1 escaped UTF-8."""
+    raw = read_message_bytes(path)
+    return json.loads(raw.decode('raw_unicode_escape').encode('raw_unicode_escape').decode())
+
+
+def write_message_file(source, path, compression):
+    """
+    Copy the binary stream `source` to `path` (a logical message_*.json path),
+    compressed per `compression`. Returns the path written.
+    """
+    target_path = path + COMPRESSION_SUFFIXES[compression]
+    directory = os.path.dirname(target_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(target_path)}.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as raw_target:
+            if compression == 'gzip':
+                with gzip.GzipFile(filename=os.path.basename(path), mode='wb', compresslevel=GZIP_LEVEL, fileobj=raw_target) as target:
+                    shutil.copyfileobj(source, target)
+            elif compression == 'zstd':
+                with zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw_target, closefd=False) as target:
+                    shutil.copyfileobj(source, target)
+            else:
+                shutil.copyfileobj(source, raw_target)
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return target_path
@@ -0,0 +1,277 @@
+import bisect
+import functools
+import json
+import math
+import threading
+import time
+
+
+# Latency buckets in seconds, from a cached JSON read up to a full inbox computation.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager observing the seconds spent inside it."""
+    __slots__ = ('_child', '_started')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _Metric:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """The child for these label values; resolve it once and keep it on hot paths."""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def collect(self):
+        return {_label_key(self.labelnames, values): child.value for values, child in self._items()}
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def collect(self):
+        samples = {}
+        for values, child in self._items():
+            with child._lock:
+                samples[_label_key(self.labelnames, values)] = child.counts + [child.sum]
+        return samples
+
+
+def _label_key(labelnames, values):
+    return json.dumps(sorted(zip(labelnames, values)))
+
+
+class Registry:
+    """
+    Metrics of one process. `snapshot()` is a JSON-able dict so server processes can
+    publish theirs for whichever process is scraped, which sums them with
+    `merge_snapshots()` and formats the result with `render()`.
+
+    Collectors are called at snapshot time and return
+    [(name, kind, help, [(labels dict, value), ...]), ...] for counters and gauges kept
+    elsewhere (cache stats, queue depth), so reading them costs nothing between scrapes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Duplicate metric: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = {}
+        for metric in metrics:
+            family = {'kind': metric.kind, 'help': metric.documentation, 'samples': metric.collect()}
+            if metric.kind == 'histogram':
+                family['buckets'] = list(metric.buckets)
+            families[metric.name] = family
+        for collector in collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                print(f"[METRICS] Collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            add_samples(families, collected)
+        return {'collected_at': time.time(), 'families': families}
+
+
+def add_samples(families, collected):
+    """Add collector output to snapshot families, summing samples that already exist."""
+    for name, kind, documentation, samples in collected:
+        family = families.setdefault(name, {'kind': kind, 'help': documentation, 'samples': {}})
+        for labels, value in samples:
+            key = json.dumps(sorted((k, str(v)) for k, v in labels.items()))
+            family['samples'][key] = family['samples'].get(key, 0) + (value or 0)
+
+
+def merge_snapshots(snapshots):
+    """Sum the families of several process snapshots (histogram buckets element-wise)."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.get('families', {}).items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = json.loads(json.dumps(family))
+                continue
+            if target['kind'] != family['kind'] or target.get('buckets') != family.get('buckets'):
+                continue
+            for key, value in family['samples'].items():
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value
+                elif family['kind'] == 'histogram':
+                    target['samples'][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def render(families):
+    """Prometheus text exposition format (version 0.0.4) for merged snapshot families."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for key in sorted(family['samples']):
+            pairs = [tuple(pair) for pair in json.loads(key)]
+            value = family['samples'][key]
+            if family['kind'] != 'histogram':
+                lines.append(f'{name}{_format_labels(pairs)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for upper, count in zip(family['buckets'] + [math.inf], value[:-1]):
+                cumulative += count
+                le = '+Inf' if math.isinf(upper) else str(float(upper))
+                lines.append(f'{name}_bucket{_format_labels(pairs + [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(pairs)} {_format_value(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(pairs)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed(child, fn):
+    """Wrap `fn` so every call is observed by the histogram child `child`."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - started)
+    return wrapper
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'chv_http_request_duration_seconds', 'Time to build a response, by route.', ('method', 'endpoint', 'status')
+)
+OPERATION_SECONDS = registry.histogram(
+    'chv_operation_duration_seconds', 'Time spent in heavy internal operations.', ('operation',)
+)
+CACHE_IO_SECONDS = registry.histogram(
+    'chv_cache_io_duration_seconds', 'Time to read or write a JSON cache file.', ('op',)
+)
+CACHE_IO_BYTES = registry.counter(
+    'chv_cache_io_bytes_total', 'Bytes read from or written to JSON cache files.', ('op',)
+)
+MESSAGE_BYTES_READ = registry.counter(
+    'chv_message_bytes_read_total', 'Decompressed bytes read from message files.'
+)
+CACHE_REQUESTS = registry.counter(
+    'chv_cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result')
+)
+JOB_SECONDS = registry.histogram(
+    'chv_job_duration_seconds', 'Run time of each background job attempt, by outcome.', ('job_type', 'outcome')
+)
+JOB_WAIT_SECONDS = registry.histogram(
+    'chv_job_queue_wait_seconds', 'Time from submitting a background job to its first attempt.', ('job_type',)
+)
@@ -0,0 +1,110 @@
+import datetime
+
+
+MS_PER_DAY = 86_400_000
+
+
+def _day_key(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def session_intervals(thread_id, index, participant=None):
+    """
+    Yield (start_ms, end_ms, thread_id) for each session in a thread's session index,
+    optionally only those `participant` took part in.
+    """
+    columns = index['columns']
+    participant_id = None
+    if participant is not None:
+        if participant not in index['participants']:
+            return
+        participant_id = index['participants'].index(participant)
+
+    for i, start_ms in enumerate(columns['start_ms']):
+        if participant_id is not None and participant_id not in columns['leans'][i][0::2]:
+            continue
+        yield start_ms, columns['end_ms'][i], thread_id
+
+
+def _add_span(totals, start_ms, end_ms):
+    """Add the span [start_ms, end_ms) to per-day totals, split at UTC midnights."""
+    while start_ms < end_ms:
+        day_end = (start_ms // MS_PER_DAY + 1) * MS_PER_DAY
+        span_end = min(end_ms, day_end)
+        key = _day_key(start_ms)
+        totals[key] = totals.get(key, 0) + (span_end - start_ms)
+        start_ms = span_end
+
+
+def sweep_concurrency(intervals, top_pairs=20):
+    """
+    Sweep-line over session intervals from all threads.
+
+    Sorting the 2S start/end events dominates (O(S log S)); each start also pairs
+    with the sessions already active, which is bounded by the concurrency level.
+    Sessions that only touch (one ends as the next starts) do not overlap.
+    """
+    events = []
+    total_sessions = 0
+    for start_ms, end_ms, thread_id in intervals:
+        total_sessions += 1
+        if end_ms <= start_ms:
+            # Zero-length sessions cannot overlap anything.
+            continue
+        # Ends sort before starts at the same instant.
+        events.append((start_ms, 1, end_ms, thread_id))
+        events.append((end_ms, 0, end_ms, thread_id))
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    active = {}
+    level = 0
+    peak_level, peak_at_ms = 0, None
+    last_ms = None
+    level_ms = {}
+    daily_peak = {}
+    daily_multitasking_ms = {}
+    pair_stats = {}
+
+    for event_ms, is_start, end_ms, thread_id in events:
+        if last_ms is not None and event_ms > last_ms and level > 0:
+            level_ms[level] = level_ms.get(level, 0) + (event_ms - last_ms)
+            if level > 1:
+                _add_span(daily_multitasking_ms, last_ms, event_ms)
+        last_ms = event_ms
+
+        if is_start:
+            for other_thread, other_ends in active.items():
+                if other_thread == thread_id:
+                    continue
+                pair = (thread_id, other_thread) if thread_id < other_thread else (other_thread, thread_id)
+                stats = pair_stats.setdefault(pair, [0, 0])
+                for other_end in other_ends:
+                    stats[0] += 1
+                    stats[1] += min(end_ms, other_end) - event_ms
+            active.setdefault(thread_id, []).append(end_ms)
+            level += 1
+            day = _day_key(event_ms)
+            daily_peak[day] = max(daily_peak.get(day, 0), level)
+            if level > peak_level:
+                peak_level, peak_at_ms = level, event_ms
+        else:
+            ends = active[thread_id]
+            ends.remove(end_ms)
+            if not ends:
+                # Only threads with open sessions stay in `active`, so starts scan at most the concurrency level.
+                del active[thread_id]
+            level -= 1
+
+    top = sorted(pair_stats.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))[:top_pairs]
+    return {
+        'total_sessions': total_sessions,
+        'peak_concurrency': peak_level,
+        'peak_at_ms': peak_at_ms,
+        'concurrency_ms': {str(k): v for k, v in sorted(level_ms.items())},
+        'daily_peak': daily_peak,
+        'daily_multitasking_ms': daily_multitasking_ms,
+        'top_overlapping_threads': [
+            {'threads': list(pair), 'overlaps': stats[0], 'overlap_ms': stats[1]}
+            for pair, stats in top
+        ],
+    }
@@ -0,0 +1,98 @@
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Stack samples per second is 1 / interval; 5ms keeps the sampler's own GIL use small.
+DEFAULT_INTERVAL_SECONDS = 0.005
+
+PROFILE_SUFFIX = '.collapsed'
+
+
+def _frame_label(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{os.path.basename(code.co_filename)}:{name}'.replace(';', ':')
+
+
+def _collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a background
+    thread and counts identical stacks. Unlike cProfile this works on a thread that
+    is already running and costs the profiled code nothing between samples.
+
+    Output is the collapsed-stack format (`root;caller;callee count` per line) read by
+    flamegraph.pl, speedscope and inferno. Time spent in native code that released
+    the GIL (the Rust density backend) is attributed to the Python frame that called it.
+    """
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[_collapse(frame)] += 1
+            self.samples += 1
+            del frame
+
+    def write(self, path):
+        """Write the collapsed stacks to `path` (via a temp file, so readers never see a partial profile)."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{secrets.token_hex(4)}.tmp'
+        with open(tmp_path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(tmp_path, path)
+        print(f"[PROFILE] {self.samples} samples over {self.elapsed:.2f}s written to {path}")
+
+
+@contextmanager
+def profile_current_thread(path, interval=DEFAULT_INTERVAL_SECONDS):
+    """Sample the calling thread while the block runs, then write its collapsed stacks to `path`."""
+    sampler = StackSampler(threading.get_ident(), interval).start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        try:
+            sampler.write(path)
+        except OSError as e:
+            print(f"[PROFILE] Failed to write {path}: {e}")
+
+
+def profile_filename(*parts):
+    """Sortable, collision-free file name for a profile, e.g. 20260101-120000-ab12cd-request-GET-api_conversation.collapsed."""
+    slug = '-'.join(re.sub(r'[^A-Za-z0-9_.]+', '_', str(part)).strip('_') for part in parts if part)
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}-{slug}{PROFILE_SUFFIX}"
@@ -0,0 +1,156 @@
+import contextlib
+import heapq
+import json
+import sqlite3
+import threading
+import time
+
+
+class _StoreMetrics:
+    """Per-process counters shared by both store backends."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'puts': 0, 'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+
+    def add(self, name, amount=1):
+        if amount:
+            with self._lock:
+                self.counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class MemoryRoundStore:
+    """
+    Game rounds with a TTL in this process only. A heap ordered by expiry time makes
+    expiring (and evicting past `max_rounds`) O(log n) per round instead of a full scan.
+    """
+    def __init__(self, ttl_seconds, max_rounds):
+        self.ttl_seconds = ttl_seconds
+        self.max_rounds = max_rounds
+        self._rounds = {}  # round_id -> (expires_at, record)
+        self._heap = []    # (expires_at, round_id); entries for removed rounds are skipped lazily
+        self._lock = threading.Lock()
+        self.metrics = _StoreMetrics()
+
+    def _pop_heap(self):
+        expires_at, round_id = heapq.heappop(self._heap)
+        current = self._rounds.get(round_id)
+        if current is not None and current[0] == expires_at:
+            del self._rounds[round_id]
+            return True
+        return False
+
+    def _expire(self, now):
+        expired = 0
+        while self._heap and self._heap[0][0] <= now:
+            expired += self._pop_heap()
+        self.metrics.add('expired', expired)
+
+    def put(self, round_id, record):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            expires_at = now + self.ttl_seconds
+            self._rounds[round_id] = (expires_at, record)
+            heapq.heappush(self._heap, (expires_at, round_id))
+            evicted = 0
+            while len(self._rounds) > self.max_rounds and self._heap:
+                evicted += self._pop_heap()
+            self.metrics.add('evicted', evicted)
+        self.metrics.add('puts')
+
+    def get(self, round_id):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._rounds.get(round_id)
+        self.metrics.add('hits' if entry else 'misses')
+        return entry[1] if entry else None
+
+    def stats(self):
+        with self._lock:
+            size = len(self._rounds)
+        return dict(self.metrics.snapshot(), backend='memory', size=size, max_rounds=self.max_rounds)
+
+
+class SQLiteRoundStore:
+    """
+    Game rounds with a TTL in one SQLite file, so a guess can land on any server
+    process. Expiry and eviction go through an index on expires_at.
+    """
+    def __init__(self, path, ttl_seconds, max_rounds):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_rounds = max_rounds
+        self.metrics = _StoreMetrics()
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rounds (
+                    round_id TEXT PRIMARY KEY,
+                    record TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS rounds_expiry ON rounds (expires_at)')
+            # COUNT(*) scans the table; a trigger-maintained count keeps the size check O(1).
+            conn.execute('CREATE TABLE IF NOT EXISTS round_count (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO round_count (id, n) SELECT 0, COUNT(*) FROM rounds')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS rounds_added AFTER INSERT ON rounds BEGIN UPDATE round_count SET n = n + 1; END')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS rounds_removed AFTER DELETE ON rounds BEGIN UPDATE round_count SET n = n - 1; END')
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # Rounds are disposable; skip the per-commit sync.
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def put(self, round_id, record):
+        now = time.time()
+        with self._connection() as conn:
+            expired = conn.execute('DELETE FROM rounds WHERE expires_at <= ?', (now,)).rowcount
+            conn.execute('DELETE FROM rounds WHERE round_id = ?', (round_id,))
+            conn.execute(
+                'INSERT INTO rounds (round_id, record, expires_at) VALUES (?, ?, ?)',
+                (round_id, json.dumps(record), now + self.ttl_seconds)
+            )
+            excess = conn.execute('SELECT n FROM round_count').fetchone()[0] - self.max_rounds
+            evicted = 0
+            if excess > 0:
+                evicted = conn.execute('''
+                    DELETE FROM rounds WHERE round_id IN (
+                        SELECT round_id FROM rounds ORDER BY expires_at LIMIT ?
+                    )
+                ''', (excess,)).rowcount
+        self.metrics.add('expired', expired)
+        self.metrics.add('evicted', evicted)
+        self.metrics.add('puts')
+
+    def get(self, round_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT record FROM rounds WHERE round_id = ? AND expires_at > ?', (round_id, time.time())
+            ).fetchone()
+        self.metrics.add('hits' if row else 'misses')
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        with self._connection() as conn:
+            size = conn.execute('SELECT n FROM round_count').fetchone()[0]
+        return dict(self.metrics.snapshot(), backend='sqlite', size=size, max_rounds=self.max_rounds)
+
+
+def create_round_store(backend, ttl_seconds, max_rounds, path=None):
+    if backend == 'memory':
+        return MemoryRoundStore(ttl_seconds, max_rounds)
+    if backend == 'sqlite':
+        return SQLiteRoundStore(path, ttl_seconds, max_rounds)
+    raise ValueError(f'Unknown game round store: {backend}')
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cache_io import atomic_write_json, read_json, remove_path
+
+
+class SeriesCache:
+    """
+    Byte-budgeted LRU for derived values (the precomputed trend series).
+
+    Entries are validated against the mtime of the source they were derived from
+    and expire after `ttl_seconds`. When `spill_path` is given, entries are also
+    written through to disk so a restarted process can reload them instead of
+    recomputing; spill files go with the entries that are evicted or expire.
+    """
+    def __init__(self, max_bytes, ttl_seconds=None, spill_path=None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'oversized': 0,
+        }
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry['size']
+
+    def _insert(self, key, mtime, value, size, stored_at):
+        """Store an entry; returns the keys evicted to make room."""
+        self._drop(key)
+        if size > self.max_bytes:
+            self._stats['oversized'] += 1
+            return []
+        self._entries[key] = {'mtime': mtime, 'value': value, 'size': size, 'stored_at': stored_at}
+        self._bytes += size
+        evicted_keys = []
+        while self._bytes > self.max_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted['size']
+            self._stats['evictions'] += 1
+            evicted_keys.append(evicted_key)
+        return evicted_keys
+
+    def get(self, key, mtime):
+        """Return the cached value for `key` if it was derived from a source with this mtime."""
+        counted = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry['mtime'] != mtime:
+                    self._stats['stale'] += 1
+                    self._drop(key)
+                elif self._expired(entry['stored_at']):
+                    self._stats['expirations'] += 1
+                    counted = True
+                    self._drop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry['value']
+
+        spilled = self._read_spill(key)
+        if spilled and self._expired(spilled.get('stored_at', 0)):
+            if not counted:
+                with self._lock:
+                    self._stats['expirations'] += 1
+            self._remove_spills([key])
+        elif spilled and spilled.get('mtime') == mtime:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+                evicted_keys = self._insert(key, mtime, spilled['value'], spilled['size'], spilled['stored_at'])
+            self._remove_spills(evicted_keys)
+            return spilled['value']
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, mtime, value):
+        encoded = json.dumps(value)
+        stored_at = time.time()
+        with self._lock:
+            evicted_keys = self._insert(key, mtime, value, len(encoded), stored_at)
+        self._remove_spills(evicted_keys)
+        self._write_spill(key, {'mtime': mtime, 'stored_at': stored_at, 'size': len(encoded), 'value': value})
+
+    def _read_spill(self, key):
+        path = self.spill_path(key) if self.spill_path else None
+        if not path:
+            return None
+        try:
+            return read_json(path)
+        except (OSError, ValueError):
+            return None
+
+    def _write_spill(self, key, payload):
+        path = self.spill_path(key) if self.spill_path else None
+        if not path:
+            return
+        try:
+            # mkdir, not makedirs: a spill must not recreate a folder that was deleted.
+            os.mkdir(os.path.dirname(path))
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"[SERIES_CACHE] Failed to spill {key}: {e}")
+            return
+        try:
+            atomic_write_json(path, payload)
+        except OSError as e:
+            print(f"[SERIES_CACHE] Failed to spill {key}: {e}")
+
+    def _remove_spills(self, keys):
+        for key in keys:
+            path = self.spill_path(key) if self.spill_path else None
+            if path:
+                remove_path(path)
+
+    def stats(self):
+        with self._lock:
+            entries_by_namespace = {}
+            bytes_by_namespace = {}
+            for key, entry in self._entries.items():
+                namespace = key[0] if isinstance(key, tuple) else 'default'
+                entries_by_namespace[namespace] = entries_by_namespace.get(namespace, 0) + 1
+                bytes_by_namespace[namespace] = bytes_by_namespace.get(namespace, 0) + entry['size']
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl_seconds=self.ttl_seconds,
+                entries_by_namespace=entries_by_namespace,
+                bytes_by_namespace=bytes_by_namespace,
+            )
@@ -0,0 +1,194 @@
+import base64
+import json
+import os
+
+from cache_io import atomic_write_json
+
+
+SESSION_INDEX_NAME = 'cached_session_index.json'
+
+# Sort keys accepted by query_sessions, mapped to the index column they order by.
+SESSION_SORT_KEYS = {
+    'start': 'start_ms',
+    'message_count': 'message_count',
+    'duration': 'duration_ms',
+    'avg_response': 'average_response_time',
+}
+
+
+def build_session_index(thread_result):
+    """
+    Build a compact columnar index over detect_conversations sessions.
+
+    Columns are parallel lists in session id (start time) order. Participants are
+    interned, leans are stored as flat [participant, share, ...] lists, and each
+    non-start sort key gets a precomputed permutation ordered by (value, id).
+    """
+    participants = []
+    participant_ids = {}
+    columns = {
+        'start_ms': [],
+        'end_ms': [],
+        'duration_ms': [],
+        'message_count': [],
+        'average_response_time': [],
+        'dominant': [],
+        'dominant_share': [],
+        'leans': [],
+    }
+
+    sessions = sorted(thread_result.get('conversations') or [], key=lambda c: c.get('id', 0))
+    for session in sessions:
+        start_ms = session.get('start_ms', 0)
+        end_ms = session.get('end_ms', start_ms)
+        leans = []
+        dominant, dominant_share = -1, 0.0
+        for name in sorted(session.get('leans') or {}):
+            share = session['leans'][name]
+            if name not in participant_ids:
+                participant_ids[name] = len(participants)
+                participants.append(name)
+            leans.extend([participant_ids[name], share])
+            if share > dominant_share:
+                dominant, dominant_share = participant_ids[name], share
+
+        columns['start_ms'].append(start_ms)
+        columns['end_ms'].append(end_ms)
+        columns['duration_ms'].append(end_ms - start_ms)
+        columns['message_count'].append(session.get('message_count', 0))
+        columns['average_response_time'].append(session.get('average_response_time', 0.0))
+        columns['dominant'].append(dominant)
+        columns['dominant_share'].append(dominant_share)
+        columns['leans'].append(leans)
+
+    orders = {}
+    for column in SESSION_SORT_KEYS.values():
+        if column != 'start_ms':
+            values = columns[column]
+            orders[column] = sorted(range(len(values)), key=lambda i: (values[i], i))
+
+    return {'participants': participants, 'columns': columns, 'orders': orders}
+
+
+def write_session_index(thread_folder, thread_result):
+    atomic_write_json(os.path.join(thread_folder, SESSION_INDEX_NAME), build_session_index(thread_result))
+
+
+def _encode_cursor(sort, value, session_id):
+    raw = json.dumps([sort, value, session_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor that query_sessions issued for `sort`, or raise ValueError."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, session_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    # The seek compares the value against the sort column, so it must be a number
+    # issued for this sort (bool is an int subclass but never a column value).
+    if (cursor_sort != sort
+            or isinstance(value, bool) or not isinstance(value, (int, float))
+            or isinstance(session_id, bool) or not isinstance(session_id, int)):
+        raise ValueError('Invalid cursor')
+    return value, session_id
+
+
+def _seek(order, values, key, descending):
+    """First position in `order` strictly after `key` in scan direction."""
+    lo, hi = 0, len(order)
+    if descending:
+        # Scanning from the end: find the first position whose (value, id) >= key.
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (values[order[mid]], order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return len(order) - lo
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (values[order[mid]], order[mid]) <= key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def query_sessions(index, filters=None, sort='start', descending=False, limit=50, cursor=None):
+    """
+    Scan the index in sort order, applying filters, until `limit` sessions match.
+
+    filters may hold start_ms / end_ms (bounds on session start), min_messages,
+    participant (dominant participant name), min_duration_ms and max_duration_ms.
+    Returns (sessions, next_cursor); next_cursor is None on the last page.
+    """
+    filters = filters or {}
+    columns = index['columns']
+    participants = index['participants']
+    sort_column = SESSION_SORT_KEYS[sort]
+    values = columns[sort_column]
+    order = index['orders'].get(sort_column) or range(len(values))
+
+    dominant_id = None
+    if filters.get('participant') is not None:
+        if filters['participant'] not in participants:
+            return [], None
+        dominant_id = participants.index(filters['participant'])
+
+    start_ms, end_ms = filters.get('start_ms'), filters.get('end_ms')
+    min_messages = filters.get('min_messages')
+    min_duration, max_duration = filters.get('min_duration_ms'), filters.get('max_duration_ms')
+    by_start = sort_column == 'start_ms'
+
+    position = 0
+    if cursor is not None:
+        last_value, last_id = cursor
+        position = _seek(order, values, (last_value, last_id), descending)
+    elif by_start and not descending and start_ms is not None:
+        # Sessions are stored in start order, so the date filter is a seek.
+        position = _seek(order, values, (start_ms, -1), False)
+    elif by_start and descending and end_ms is not None:
+        position = _seek(order, values, (end_ms, len(order)), True)
+
+    results = []
+    next_cursor = None
+    for k in range(position, len(order)):
+        i = order[len(order) - 1 - k] if descending else order[k]
+        if by_start and ((not descending and end_ms is not None and values[i] > end_ms)
+                         or (descending and start_ms is not None and values[i] < start_ms)):
+            break
+        if start_ms is not None and columns['start_ms'][i] < start_ms:
+            continue
+        if end_ms is not None and columns['start_ms'][i] > end_ms:
+            continue
+        if min_messages is not None and columns['message_count'][i] < min_messages:
+            continue
+        if min_duration is not None and columns['duration_ms'][i] < min_duration:
+            continue
+        if max_duration is not None and columns['duration_ms'][i] > max_duration:
+            continue
+        if dominant_id is not None and columns['dominant'][i] != dominant_id:
+            continue
+
+        if len(results) == limit:
+            last = results[-1]
+            next_cursor = _encode_cursor(sort, columns[sort_column][last['id']], last['id'])
+            break
+
+        leans = columns['leans'][i]
+        dominant = columns['dominant'][i]
+        results.append({
+            'id': i,
+            'start_ms': columns['start_ms'][i],
+            'end_ms': columns['end_ms'][i],
+            'duration_ms': columns['duration_ms'][i],
+            'message_count': columns['message_count'][i],
+            'average_response_time': columns['average_response_time'][i],
+            'dominant_participant': participants[dominant] if dominant >= 0 else None,
+            'dominant_share': columns['dominant_share'][i],
+            'leans': {participants[leans[j]]: leans[j + 1] for j in range(0, len(leans), 2)},
+        })
+
+    return results, next_cursor
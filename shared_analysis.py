@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import shutil
+from glob import glob
+
+from cache_io import atomic_write_json, file_lock, read_json
+from cache_manifest import messages_fingerprint
+from message_store import logical_name, message_files, open_message_file
+
+
+# Per-thread cache of the content hash, keyed by the cheap stat fingerprint so the
+# message files are only re-read after they change.
+CONTENT_HASH_NAME = 'cached_content_hash.json'
+# Where a user folder keeps the hashes of chats shared into it (thread folders that are
+# symlinks into another user code), one <thread_id>.json each.
+SHARED_CONTENT_HASHES_NAME = 'cached_shared_content_hashes'
+
+ENTRY_PAYLOAD_NAME = 'analysis.json'
+LOCK_NAME = '.lock'
+
+
+def _content_hash_path(thread_folder):
+    if os.path.islink(thread_folder):
+        # A shared chat: memoize in the reading user's folder, never through the link
+        # into the owner's (which would also count against the owner's quota).
+        user_path = os.path.dirname(os.path.dirname(thread_folder))
+        return os.path.join(user_path, SHARED_CONTENT_HASHES_NAME, f'{os.path.basename(thread_folder)}.json')
+    return os.path.join(thread_folder, CONTENT_HASH_NAME)
+
+
+def thread_content_hash(thread_folder):
+    """
+    sha256 over the thread's message file names and (decompressed) bytes. Identical
+    message files give the same hash no matter which user code or folder name they
+    were uploaded under, or how they are stored.
+    """
+    fingerprint = messages_fingerprint(thread_folder)
+    cached_path = _content_hash_path(thread_folder)
+    try:
+        with open(cached_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('fingerprint') == fingerprint:
+            return cached['hash']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    for path in message_files(thread_folder):
+        digest.update(logical_name(path).encode())
+        digest.update(b'\0')
+        with open_message_file(path) as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    content_hash = digest.hexdigest()
+
+    try:
+        if os.path.dirname(cached_path) != thread_folder:
+            # mkdir, not makedirs: the user folder may have just been deleted.
+            try:
+                os.mkdir(os.path.dirname(cached_path))
+            except FileExistsError:
+                pass
+        atomic_write_json(cached_path, {'fingerprint': fingerprint, 'hash': content_hash})
+    except Exception as e:
+        print(f"[SHARED_CACHE] Failed to cache content hash for {os.path.basename(thread_folder)}: {e}")
+    return content_hash
+
+
+class SharedAnalysisCache:
+    """
+    Content-addressed store for per-thread analysis, shared by every user code.
+
+    Each entry is <root>/<key[:2]>/<key>/ holding the payload and a refs/<user_code>/<thread_id>
+    marker for every user thread that reached it. An entry is deleted once its last
+    reference is gone: references are dropped when the user code expires or the
+    thread's content no longer hashes to the entry.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash, schema_version):
+        return f'{content_hash}-v{schema_version}'
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _lock(self):
+        return file_lock(os.path.join(self.root, LOCK_NAME))
+
+    def get(self, key, user_code, thread_id):
+        """Return the stored payload (adding a reference for this user thread), or None."""
+        entry_dir = self._entry_dir(key)
+        with self._lock():
+            if not os.path.isdir(entry_dir):
+                return None
+            self._add_ref(entry_dir, user_code, thread_id)
+        try:
+            return read_json(os.path.join(entry_dir, ENTRY_PAYLOAD_NAME))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, payload, user_code, thread_id):
+        entry_dir = self._entry_dir(key)
+        with self._lock():
+            os.makedirs(entry_dir, exist_ok=True)
+            self._add_ref(entry_dir, user_code, thread_id)
+        atomic_write_json(os.path.join(entry_dir, ENTRY_PAYLOAD_NAME), payload)
+
+    @staticmethod
+    def _add_ref(entry_dir, user_code, thread_id):
+        ref_dir = os.path.join(entry_dir, 'refs', user_code)
+        os.makedirs(ref_dir, exist_ok=True)
+        open(os.path.join(ref_dir, thread_id), 'a').close()
+
+    def collect_garbage(self, upload_folder):
+        """
+        Drop references whose user code is gone or whose thread now hashes to
+        something else, then delete entries left without references.
+        Returns the number of entries deleted.
+        """
+        deleted = 0
+        for entry_dir in glob(os.path.join(self.root, '??', '*')):
+            content_hash = os.path.basename(entry_dir).rsplit('-v', 1)[0]
+            with self._lock():
+                refs_dir = os.path.join(entry_dir, 'refs')
+                for ref_path in glob(os.path.join(refs_dir, '*', '*')):
+                    user_code = os.path.basename(os.path.dirname(ref_path))
+                    thread_id = os.path.basename(ref_path)
+                    thread_folder = os.path.join(upload_folder, user_code, 'inbox', thread_id)
+                    if not self._ref_is_live(thread_folder, content_hash):
+                        os.remove(ref_path)
+                if not glob(os.path.join(refs_dir, '*', '*')):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    try:
+                        os.rmdir(os.path.dirname(entry_dir))
+                    except OSError:
+                        pass  # other entries share the prefix directory
+                    deleted += 1
+        if deleted:
+            print(f"[SHARED_CACHE] Removed {deleted} unreferenced analysis entries")
+        return deleted
+
+    @staticmethod
+    def _ref_is_live(thread_folder, content_hash):
+        # Only the cached hash is consulted; a thread whose hash was dropped (re-extracted)
+        # re-adds its reference the next time it is viewed.
+        try:
+            with open(os.path.join(thread_folder, CONTENT_HASH_NAME), 'r') as f:
+                return json.load(f).get('hash') == content_hash
+        except (OSError, ValueError):
+            return False
@@ -1,4 +1,5 @@
 use pyo3::prelude::*;
+use pyo3::buffer::{Element, PyBuffer};
 use pyo3::types::{PyDict, PyList};
 use std::collections::{HashMap, HashSet};
 use chrono::{DateTime, Datelike, Duration, NaiveDate, Utc};
@@ -25,8 +26,6 @@ fn find_highest_density_period(data: &Bound<'_, PyList>, period: u8) -> (u64, u6
         return (0, 0);
     }
 
-    let window_ms = (period as u64) * MS_PER_DAY;
-
     let mut timestamps: Vec<u64> = Vec::with_capacity(n);
     for item in data.iter() {
         let dict = item.cast::<pyo3::types::PyDict>().unwrap();
@@ -34,6 +33,15 @@ fn find_highest_density_period(data: &Bound<'_, PyList>, period: u8) -> (u64, u6
         timestamps.push(ts);
     }
 
+    highest_density_window(&timestamps, (period as u64) * MS_PER_DAY)
+}
+
+fn highest_density_window(timestamps: &[u64], window_ms: u64) -> (u64, u64) {
+    let n = timestamps.len();
+    if n <= 1 {
+        return (0, 0);
+    }
+
     let mut best_start_index: usize = 0;
     let mut best_end_index: usize = 0;
     let mut max_count: u64 = 0;
@@ -66,9 +74,52 @@ struct Message {
     sender_name: String,
 }
 
+/// Messages as parallel columns sorted by timestamp, with sender names interned to ids.
+struct SenderColumns {
+    timestamps: Vec<u64>,
+    sender_ids: Vec<u32>,
+    senders: Vec<String>,
+}
+
+impl SenderColumns {
+    fn from_messages(messages: Vec<Message>) -> SenderColumns {
+        let mut ids: HashMap<String, u32> = HashMap::new();
+        let mut senders: Vec<String> = Vec::new();
+        let mut timestamps = Vec::with_capacity(messages.len());
+        let mut sender_ids = Vec::with_capacity(messages.len());
+        for message in messages {
+            let id = match ids.get(&message.sender_name) {
+                Some(id) => *id,
+                None => {
+                    let id = senders.len() as u32;
+                    ids.insert(message.sender_name.clone(), id);
+                    senders.push(message.sender_name);
+                    id
+                }
+            };
+            timestamps.push(message.timestamp_ms);
+            sender_ids.push(id);
+        }
+        SenderColumns { timestamps, sender_ids, senders }
+    }
+}
+
 
 // max time w/o optimizations: 65-72 seconds for a 1-day period on 30k messages
 // with optimizations: 3 seconds
+fn extract_participant_matches(data: &Bound<'_, PyList>, participant: &str) -> (Vec<u64>, Vec<bool>) {
+    let mut timestamps: Vec<u64> = Vec::with_capacity(data.len());
+    let mut matches: Vec<bool> = Vec::with_capacity(data.len());
+    for item in data.iter() {
+        let dict = item.cast::<pyo3::types::PyDict>().unwrap();
+        let ts: u64 = dict.get_item("timestamp_ms").unwrap().unwrap().cast::<pyo3::types::PyInt>().unwrap().extract().unwrap();
+        let sender: String = dict.get_item("sender_name").unwrap().unwrap().extract().unwrap();
+        timestamps.push(ts);
+        matches.push(sender == participant);
+    }
+    (timestamps, matches)
+}
+
 #[pyfunction]
 fn find_participant_max_count_period(data: &Bound<'_, PyList>, period: u8, participant: String) -> (u64, u64) {
     /*
@@ -83,57 +134,11 @@ fn find_participant_max_count_period(data: &Bound<'_, PyList>, period: u8, parti
         A tuple (start_ms, end_ms) representing the start and end 
         milliseconds of the period.
     */
-    let n = data.len();
-    if n <= 1 {
+    if data.len() <= 1 {
         return (0, 0);
     }
-
-    let window_ms = (period as u64) * MS_PER_DAY;
-    let messages: Vec<Message> = data.iter().map(|item| {
-        let dict = item.cast::<pyo3::types::PyDict>().unwrap();
-        let ts: u64 = dict.get_item("timestamp_ms").unwrap().unwrap().cast::<pyo3::types::PyInt>().unwrap().extract().unwrap();
-        let sender: String = dict.get_item("sender_name").unwrap().unwrap().extract().unwrap();
-        Message {
-            timestamp_ms: ts,
-            sender_name: sender,
-        }
-    }).collect();
-    let end_ms = messages.last().unwrap().timestamp_ms;
-    let mut max_count = 0;
-    let mut best_start_index = 0;
-    let mut best_end_index = 0;
-    for (ind, msg) in messages.iter().enumerate() {
-        if msg.timestamp_ms > end_ms - window_ms {
-            println!("Skipping message at index {}: {:#?}", ind, (msg.timestamp_ms, msg.sender_name.clone()));
-            break;
-        }
-        // optimized version: ...ms
-        let (byperiod, tot): (usize, usize) = {
-            let mut count = 0;
-            let mut tot = 0;
-            for msg2 in messages[ind..].iter() {
-                if msg2.timestamp_ms >= msg.timestamp_ms + window_ms {
-                    break;
-                }
-                tot += 1;
-                if msg2.sender_name == participant {
-                    count += 1;
-                }
-            }
-            (count, tot)
-        };
-        
-
-        if byperiod > max_count {
-            max_count = byperiod;
-            best_start_index = ind;
-            // Find the end index for the best period
-            best_end_index = std::cmp::min(ind + tot - 1, n - 1); // end index // clamp it for safety but theoretically should not be required
-            // unfortunately we can't break early here like we can in the min case
-        }
-    }
-
-    return (messages[best_start_index].timestamp_ms, messages[best_end_index].timestamp_ms);
+    let (timestamps, matches) = extract_participant_matches(data, &participant);
+    participant_count_window(&timestamps, &matches, (period as u64) * MS_PER_DAY, true)
 }
 
 #[pyfunction]
@@ -148,67 +153,60 @@ fn find_participant_min_count_period(data: &Bound<'_, PyList>, period: u8, parti
         A tuple (start_ms, end_ms) representing the start and end 
         milliseconds of the period.
     */
+    if data.len() <= 1 {
+        return (0, 0);
+    }
+    let (timestamps, matches) = extract_participant_matches(data, &participant);
+    participant_count_window(&timestamps, &matches, (period as u64) * MS_PER_DAY, false)
+}
 
-    let n = data.len();
+fn participant_count_window(timestamps: &[u64], matches: &[bool], window_ms: u64, find_max: bool) -> (u64, u64) {
+    /*
+    Window of `window_ms` (starting at a message) with the most (or fewest) messages for
+    which `matches` is true. Windows that would run past the last message are not considered.
+    */
+    let n = timestamps.len();
     if n <= 1 {
         return (0, 0);
     }
-    let window_ms = (period as u64) * MS_PER_DAY;
-    let messages: Vec<Message> = data.iter().map(|item| {
-        let dict = item.cast::<pyo3::types::PyDict>().unwrap();
-        let ts: u64 = dict.get_item("timestamp_ms").unwrap().unwrap().cast::<pyo3::types::PyInt>().unwrap().extract().unwrap();
-        let sender: String = dict.get_item("sender_name").unwrap().unwrap().extract().unwrap();
-        Message {
-            timestamp_ms: ts,
-            sender_name: sender,
-        }
-    }).collect();
-    let end_ms = messages.last().unwrap().timestamp_ms;
-    //return (0, end_ms); // debugging and REMEMBER TO REMOVE
-    let mut min_count = usize::MAX;
+    let end_ms = timestamps[n - 1];
+    let mut best_count = if find_max { 0 } else { usize::MAX };
     let mut best_start_index = 0;
     let mut best_end_index = 0;
-    for (ind, msg) in messages.iter().enumerate() {
-        if msg.timestamp_ms > end_ms - window_ms {
-            println!("Skipping message at index {}: {:#?}", ind, (msg.timestamp_ms, msg.sender_name.clone()));
+    for ind in 0..n {
+        let start_ms = timestamps[ind];
+        if start_ms > end_ms.wrapping_sub(window_ms) {
             break;
         }
         // optimized version: ...ms
         let (byperiod, tot): (usize, usize) = {
             let mut count = 0;
             let mut tot = 0;
-            for msg2 in messages[ind..].iter() {
-                if msg2.timestamp_ms >= msg.timestamp_ms + window_ms {
+            for j in ind..n {
+                if timestamps[j] >= start_ms + window_ms {
                     break;
                 }
                 tot += 1;
-                if msg2.sender_name == participant {
+                if matches[j] {
                     count += 1;
                 }
             }
             (count, tot)
         };
-        
-        // // original code: ...ms
-        // let byperiod = messages.iter()
-        //     .filter(|m| m.sender_name == participant && m.timestamp_ms >= msg.timestamp_ms && m.timestamp_ms < msg.timestamp_ms + window_ms)
-        //     .count();
 
-        if byperiod < min_count {
-            min_count = byperiod;
+        let better = if find_max { byperiod > best_count } else { byperiod < best_count };
+        if better {
+            best_count = byperiod;
             best_start_index = ind;
-            // Find the end index for the best period
-            // this best index will not work because byperiod is only counting messages from participant, not all messages
-            // so we need to recalculate it
-            // use tot value for that
-            best_end_index = std::cmp::min(ind + tot - 1, n - 1); // end index // clamp it for safety but theoretically should not be required
-            if byperiod == 0 {
+            // byperiod only counts the participant's messages; tot gives the window's end index
+            best_end_index = std::cmp::min((ind + tot).saturating_sub(1), n - 1);
+            if !find_max && byperiod == 0 {
                 break; // can't do better than zero
             }
         }
     }
 
-    return (messages[best_start_index].timestamp_ms, messages[best_end_index].timestamp_ms);
+    (timestamps[best_start_index], timestamps[best_end_index])
 }
 
 // #[pyfunction]
@@ -291,16 +289,8 @@ fn find_participant_density_period(data: &Bound<'_, PyList>, period: u8, partici
     }
 }
 
-#[pyfunction]
-fn compute_top_words(data: &Bound<'_, PyList>, top_n: usize) -> Vec<(String, usize)> {
-    let stop_words: HashSet<&str> = [
-        "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "from", "as", "is", "was", "are", "were", "be", "been", "being", "have", "has", "had", "do", "does", "did", "will", "would", "could", "should", "may", "might", "can", "i", "you", "he", "she", "it", "we", "they", "them", "their", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our", "attachment",
-    ]
-    .into_iter()
-    .collect();
-
-    let mut word_counts: HashMap<String, usize> = HashMap::new();
-
+fn extract_contents(data: &Bound<'_, PyList>) -> Vec<String> {
+    let mut contents: Vec<String> = Vec::with_capacity(data.len());
     for item in data.iter() {
         let dict = match item.cast::<pyo3::types::PyDict>() {
             Ok(d) => d,
@@ -312,11 +302,29 @@ fn compute_top_words(data: &Bound<'_, PyList>, top_n: usize) -> Vec<(String, usi
             _ => continue,
         };
 
-        let content: String = match content_obj.extract() {
-            Ok(c) => c,
-            Err(_) => continue,
-        };
+        if let Ok(content) = content_obj.extract::<String>() {
+            contents.push(content);
+        }
+    }
+    contents
+}
+
+#[pyfunction]
+fn compute_top_words(data: &Bound<'_, PyList>, top_n: usize) -> Vec<(String, usize)> {
+    let contents = extract_contents(data);
+    top_words(contents.iter().map(|c| c.as_str()), top_n)
+}
+
+fn top_words<'a>(contents: impl Iterator<Item = &'a str>, top_n: usize) -> Vec<(String, usize)> {
+    let stop_words: HashSet<&str> = [
+        "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", "from", "as", "is", "was", "are", "were", "be", "been", "being", "have", "has", "had", "do", "does", "did", "will", "would", "could", "should", "may", "might", "can", "i", "you", "he", "she", "it", "we", "they", "them", "their", "this", "that", "these", "those", "my", "your", "his", "her", "its", "our", "attachment",
+    ]
+    .into_iter()
+    .collect();
+
+    let mut word_counts: HashMap<String, usize> = HashMap::new();
 
+    for content in contents {
         for raw_word in content.to_lowercase().split_whitespace() {
             let cleaned: String = raw_word.chars().filter(|c| c.is_alphanumeric()).collect();
             if cleaned.chars().count() > 1 && !stop_words.contains(cleaned.as_str()) {
@@ -334,24 +342,14 @@ fn compute_top_words(data: &Bound<'_, PyList>, top_n: usize) -> Vec<(String, usi
 
 #[pyfunction]
 fn compute_top_emojis(data: &Bound<'_, PyList>, top_n: usize) -> Vec<(String, usize)> {
-    let mut emoji_counts: HashMap<String, usize> = HashMap::new();
-
-    for item in data.iter() {
-        let dict = match item.cast::<pyo3::types::PyDict>() {
-            Ok(d) => d,
-            Err(_) => continue,
-        };
-
-        let content_obj = match dict.get_item("content") {
-            Ok(Some(v)) => v,
-            _ => continue,
-        };
+    let contents = extract_contents(data);
+    top_emojis(contents.iter().map(|c| c.as_str()), top_n)
+}
 
-        let content: String = match content_obj.extract() {
-            Ok(c) => c,
-            Err(_) => continue,
-        };
+fn top_emojis<'a>(contents: impl Iterator<Item = &'a str>, top_n: usize) -> Vec<(String, usize)> {
+    let mut emoji_counts: HashMap<String, usize> = HashMap::new();
 
+    for content in contents {
         let mut buf = [0u8; 4];
         for ch in content.chars() {
             let ch_str = ch.encode_utf8(&mut buf);
@@ -372,26 +370,19 @@ fn count_specific_string(data: &Bound<'_, PyList>, target_string: String) -> usi
     if target_string.is_empty() {
         return 0;
     }
+    let contents = extract_contents(data);
+    count_occurrences(contents.iter().map(|c| c.as_str()), &target_string)
+}
+
+fn count_occurrences<'a>(contents: impl Iterator<Item = &'a str>, target_string: &str) -> usize {
+    if target_string.is_empty() {
+        return 0;
+    }
 
     let needle = target_string.to_lowercase();
     let mut total = 0usize;
 
-    for item in data.iter() {
-        let dict = match item.cast::<pyo3::types::PyDict>() {
-            Ok(d) => d,
-            Err(_) => continue,
-        };
-
-        let content_obj = match dict.get_item("content") {
-            Ok(Some(v)) => v,
-            _ => continue,
-        };
-
-        let content: String = match content_obj.extract() {
-            Ok(c) => c,
-            Err(_) => continue,
-        };
-
+    for content in contents {
         let lower = content.to_lowercase();
         let mut i = 0usize;
         while let Some(rel) = lower[i..].find(&needle) {
@@ -506,7 +497,7 @@ fn normalize_daily_counts_from_pydict(daily_counts: &Bound<'_, PyDict>) -> HashM
 
 #[pyfunction]
 fn aggregate_daily_counts(data: &Bound<'_, PyList>) -> HashMap<String, u64> {
-    let mut daily_counts: HashMap<String, u64> = HashMap::new();
+    let mut timestamps: Vec<u64> = Vec::with_capacity(data.len());
 
     for item in data.iter() {
         let dict = match item.cast::<PyDict>() {
@@ -524,11 +515,19 @@ fn aggregate_daily_counts(data: &Bound<'_, PyList>) -> HashMap<String, u64> {
             Err(_) => continue,
         };
 
+        timestamps.push(ts);
+    }
+
+    daily_counts_from_timestamps(timestamps.iter().copied())
+}
+
+fn daily_counts_from_timestamps(timestamps: impl Iterator<Item = u64>) -> HashMap<String, u64> {
+    let mut daily_counts: HashMap<String, u64> = HashMap::new();
+    for ts in timestamps {
         if let Some(day_key) = date_key_from_timestamp_ms(ts) {
             *daily_counts.entry(day_key).or_insert(0) += 1;
         }
     }
-
     daily_counts
 }
 
@@ -640,9 +639,7 @@ fn build_uploader_trends_series(
 }
 
 
-#[pyfunction]
-fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> PyResult<PyObject> {
-    use std::collections::HashMap;
+fn extract_sender_messages(data: &Bound<'_, pyo3::types::PyList>) -> Vec<Message> {
     let mut messages: Vec<Message> = Vec::with_capacity(data.len());
     for item in data.iter() {
         if let Ok(dict) = item.downcast::<pyo3::types::PyDict>() {
@@ -660,26 +657,53 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
         }
     }
     messages.sort_by_key(|m| m.timestamp_ms);
+    messages
+}
 
-    let n = messages.len();
-    if n == 0 {
-        let out = pyo3::types::PyDict::new(py);
-        out.set_item("conversations", pyo3::types::PyList::empty(py)).unwrap();
-        out.set_item("thread_aggregation", pyo3::types::PyDict::new(py)).unwrap();
-        return Ok(out.into());
+fn extract_sender_columns(data: &Bound<'_, pyo3::types::PyList>) -> SenderColumns {
+    SenderColumns::from_messages(extract_sender_messages(data))
+}
+
+/// Session-splitting rules for detect_conversations. A gap ends a conversation when it
+/// exceeds the thread's median gap (same-sender or cross-sender) times the multiplier,
+/// floored at the given minimum; conversations shorter than `min_messages` are dropped.
+struct ConvoThresholds {
+    same_sender_multiplier: f64,
+    cross_sender_multiplier: f64,
+    same_sender_floor_ms: u64,
+    cross_sender_floor_ms: u64,
+    min_messages: usize,
+}
+
+impl ConvoThresholds {
+    fn split_thresholds(&self, median_same: u64, median_diff: u64) -> (u64, u64) {
+        let threshold_same = (median_same as f64 * self.same_sender_multiplier) as u64;
+        let threshold_diff = (median_diff as f64 * self.cross_sender_multiplier) as u64;
+        (
+            std::cmp::max(threshold_same, self.same_sender_floor_ms),
+            std::cmp::max(threshold_diff, self.cross_sender_floor_ms),
+        )
     }
+}
 
+/// Gaps between consecutive messages, whether the sender changed across each gap,
+/// and the median same-sender / cross-sender gaps (with the 5 / 20 minute defaults).
+fn conversation_gaps(timestamps: &[u64], sender_ids: &[u32]) -> (Vec<u64>, Vec<bool>, u64, u64) {
+    let n = timestamps.len();
+    let mut gaps = Vec::with_capacity(n.saturating_sub(1));
+    let mut sender_changed = Vec::with_capacity(n.saturating_sub(1));
     let mut same_sender_iats = Vec::new();
     let mut diff_sender_iats = Vec::new();
 
     for i in 1..n {
-        let prev = &messages[i - 1];
-        let curr = &messages[i];
-        let gap = curr.timestamp_ms.saturating_sub(prev.timestamp_ms);
-        if prev.sender_name == curr.sender_name {
-            same_sender_iats.push(gap);
-        } else {
+        let gap = timestamps[i].saturating_sub(timestamps[i - 1]);
+        let changed = sender_ids[i - 1] != sender_ids[i];
+        gaps.push(gap);
+        sender_changed.push(changed);
+        if changed {
             diff_sender_iats.push(gap);
+        } else {
+            same_sender_iats.push(gap);
         }
     }
 
@@ -697,41 +721,160 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
         diff_sender_iats[diff_sender_iats.len() / 2]
     };
 
-    let mut threshold_same = (median_same as f64 * 1.5) as u64;
-    let mut threshold_diff = (median_diff as f64 * 3.0) as u64;
+    (gaps, sender_changed, median_same, median_diff)
+}
+
+#[pyfunction]
+fn extract_conversation_gaps(data: &Bound<'_, pyo3::types::PyList>) -> (Vec<u64>, Vec<bool>, u64, u64) {
+    /*
+    Returns (gaps_ms, sender_changed, median_same_ms, median_diff_ms) for a thread, the
+    inputs sweep_conversation_counts needs to re-segment it without the messages.
+    */
+    let columns = extract_sender_columns(data);
+    conversation_gaps(&columns.timestamps, &columns.sender_ids)
+}
+
+#[pyfunction]
+fn sweep_conversation_counts(
+    gaps: Vec<u64>,
+    sender_changed: Vec<bool>,
+    median_same: u64,
+    median_diff: u64,
+    threshold_sets: Vec<(f64, f64, u64, u64, usize)>,
+) -> PyResult<Vec<usize>> {
+    /*
+    Counts the conversations detect_conversations would find in a thread under each
+    threshold set, from its cached gap arrays.
+
+    Args:
+        threshold_sets: (same_sender_multiplier, cross_sender_multiplier,
+            same_sender_floor_ms, cross_sender_floor_ms, min_messages) tuples.
 
-    threshold_same = std::cmp::max(threshold_same, 60_000);
-    threshold_diff = std::cmp::max(threshold_diff, 120_000);
+    Returns:
+        One conversation count per threshold set.
+    */
+    if gaps.len() != sender_changed.len() {
+        return Err(pyo3::exceptions::PyValueError::new_err(
+            "gaps and sender_changed must have the same length",
+        ));
+    }
 
-    struct ConvoData {
-        id: u64,
-        start_ms: u64,
-        end_ms: u64,
-        message_count: usize,
-        leans: HashMap<String, usize>,
-        responses: Vec<u64>,
+    let mut counts = Vec::with_capacity(threshold_sets.len());
+    for (same_mult, cross_mult, same_floor, cross_floor, min_messages) in threshold_sets {
+        let thresholds = ConvoThresholds {
+            same_sender_multiplier: same_mult,
+            cross_sender_multiplier: cross_mult,
+            same_sender_floor_ms: same_floor,
+            cross_sender_floor_ms: cross_floor,
+            min_messages,
+        };
+        let (threshold_same, threshold_diff) = thresholds.split_thresholds(median_same, median_diff);
+
+        let mut count = 0usize;
+        let mut current_len = 1usize;
+        for (gap, changed) in gaps.iter().zip(sender_changed.iter()) {
+            let active_threshold = if *changed { threshold_diff } else { threshold_same };
+            if *gap > active_threshold {
+                if current_len >= thresholds.min_messages {
+                    count += 1;
+                }
+                current_len = 1;
+            } else {
+                current_len += 1;
+            }
+        }
+        if current_len >= thresholds.min_messages {
+            count += 1;
+        }
+        counts.push(count);
     }
+    Ok(counts)
+}
 
-    let mut conversations: Vec<ConvoData> = Vec::new();
-    let mut current_convo = ConvoData {
-        id: 0,
-        start_ms: messages[0].timestamp_ms,
-        end_ms: messages[0].timestamp_ms,
+#[pyfunction]
+#[pyo3(signature = (
+    data,
+    same_sender_multiplier = 1.5,
+    cross_sender_multiplier = 3.0,
+    same_sender_floor_ms = 60_000,
+    cross_sender_floor_ms = 120_000,
+    min_messages = 3
+))]
+fn detect_conversations(
+    py: Python,
+    data: &Bound<'_, pyo3::types::PyList>,
+    same_sender_multiplier: f64,
+    cross_sender_multiplier: f64,
+    same_sender_floor_ms: u64,
+    cross_sender_floor_ms: u64,
+    min_messages: usize,
+) -> PyResult<PyObject> {
+    let thresholds = ConvoThresholds {
+        same_sender_multiplier,
+        cross_sender_multiplier,
+        same_sender_floor_ms,
+        cross_sender_floor_ms,
+        min_messages,
+    };
+    let columns = extract_sender_columns(data);
+    let detected = detect_conversation_sessions(&columns.timestamps, &columns.sender_ids, &thresholds);
+    detected_conversations_to_py(py, &detected, &columns.senders)
+}
+
+struct ConvoData {
+    id: u64,
+    start_ms: u64,
+    end_ms: u64,
+    message_count: usize,
+    leans: HashMap<u32, usize>,
+    responses: Vec<u64>,
+}
+
+/// detect_conversations output before conversion to Python objects, with senders as ids.
+struct DetectedConversations {
+    conversations: Vec<ConvoData>,
+    avg_in_convo_response_time: f64,
+    avg_time_between_convos: f64,
+    avg_participation_leans: HashMap<u32, f64>,
+    convos_per_day: HashMap<String, usize>,
+    avg_msg_count_per_convo: f64,
+    avg_duration_ms_per_convo: f64,
+}
+
+fn detect_conversation_sessions(timestamps: &[u64], sender_ids: &[u32], thresholds: &ConvoThresholds) -> Option<DetectedConversations> {
+    /*
+    Splits timestamp-sorted messages into conversations and aggregates them. Pure Rust,
+    so the columnar entry point can run it without holding the GIL. None for no messages.
+    */
+    let n = timestamps.len();
+    if n == 0 {
+        return None;
+    }
+
+    let (_, _, median_same, median_diff) = conversation_gaps(timestamps, sender_ids);
+    let (threshold_same, threshold_diff) = thresholds.split_thresholds(median_same, median_diff);
+
+    let new_convo = |id: u64, i: usize| ConvoData {
+        id,
+        start_ms: timestamps[i],
+        end_ms: timestamps[i],
         message_count: 1,
         leans: {
             let mut map = HashMap::new();
-            map.insert(messages[0].sender_name.clone(), 1);
+            map.insert(sender_ids[i], 1);
             map
         },
         responses: Vec::new(),
     };
 
+    let mut conversations: Vec<ConvoData> = Vec::new();
+    let mut current_convo = new_convo(0, 0);
+
     for i in 1..n {
-        let prev = &messages[i - 1];
-        let curr = &messages[i];
-        let gap = curr.timestamp_ms.saturating_sub(prev.timestamp_ms);
+        let gap = timestamps[i].saturating_sub(timestamps[i - 1]);
+        let same_sender = sender_ids[i - 1] == sender_ids[i];
 
-        let active_threshold = if prev.sender_name == curr.sender_name {
+        let active_threshold = if same_sender {
             threshold_same
         } else {
             threshold_diff
@@ -739,23 +882,12 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
 
         if gap > active_threshold {
             conversations.push(current_convo);
-            current_convo = ConvoData {
-                id: conversations.len() as u64,
-                start_ms: curr.timestamp_ms,
-                end_ms: curr.timestamp_ms,
-                message_count: 1,
-                leans: {
-                    let mut map = HashMap::new();
-                    map.insert(curr.sender_name.clone(), 1);
-                    map
-                },
-                responses: Vec::new(),
-            };
+            current_convo = new_convo(conversations.len() as u64, i);
         } else {
-            current_convo.end_ms = curr.timestamp_ms;
+            current_convo.end_ms = timestamps[i];
             current_convo.message_count += 1;
-            *current_convo.leans.entry(curr.sender_name.clone()).or_insert(0) += 1;
-            if curr.sender_name != prev.sender_name {
+            *current_convo.leans.entry(sender_ids[i]).or_insert(0) += 1;
+            if !same_sender {
                 current_convo.responses.push(gap);
             }
         }
@@ -763,56 +895,29 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
     // push the last one
     conversations.push(current_convo);
 
-    conversations.retain(|c| c.message_count >= 3);
+    conversations.retain(|c| c.message_count >= thresholds.min_messages);
 
-    let mut py_convos = Vec::new();
     let mut total_responses: u64 = 0;
     let mut response_count: usize = 0;
-    let mut global_leans: HashMap<String, f64> = HashMap::new();
+    let mut global_leans: HashMap<u32, f64> = HashMap::new();
     let mut prev_convo_end: Option<u64> = None;
     let mut gaps_between: Vec<u64> = Vec::new();
     let mut convos_per_day: HashMap<String, usize> = HashMap::new();
 
     let total_valid_convos = conversations.len();
 
-    // we might need chrono here.
-    use chrono::{DateTime, Utc};
-    
     for (idx, c) in conversations.iter_mut().enumerate() {
         c.id = idx as u64;
 
-        let convo_dict = pyo3::types::PyDict::new(py);
-        convo_dict.set_item("id", c.id).unwrap();
-        convo_dict.set_item("start_ms", c.start_ms).unwrap();
-        convo_dict.set_item("end_ms", c.end_ms).unwrap();
-        convo_dict.set_item("message_count", c.message_count).unwrap();
-        
-        let mut sum_resp: u64 = 0;
-        for r in &c.responses {
-            sum_resp += r;
-            total_responses += r;
-        }
+        total_responses += c.responses.iter().sum::<u64>();
         response_count += c.responses.len();
-        
-        let avg_resp = if c.responses.is_empty() {
-            0.0
-        } else {
-            sum_resp as f64 / c.responses.len() as f64
-        };
-        convo_dict.set_item("average_response_time", avg_resp).unwrap();
 
-        let leans_dict = pyo3::types::PyDict::new(py);
         for (sender, count) in &c.leans {
-            let pct = *count as f64 / c.message_count as f64;
-            leans_dict.set_item(sender, pct).unwrap();
-            *global_leans.entry(sender.clone()).or_insert(0.0) += pct;
+            *global_leans.entry(*sender).or_insert(0.0) += *count as f64 / c.message_count as f64;
         }
-        convo_dict.set_item("leans", leans_dict).unwrap();
-        py_convos.push(convo_dict);
 
         if let Some(pend) = prev_convo_end {
-            let g = c.start_ms.saturating_sub(pend);
-            gaps_between.push(g);
+            gaps_between.push(c.start_ms.saturating_sub(pend));
         }
         prev_convo_end = Some(c.end_ms);
 
@@ -821,15 +926,11 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
         *convos_per_day.entry(formatted).or_insert(0) += 1;
     }
 
-    let thread_agg_dict = pyo3::types::PyDict::new(py);
-    thread_agg_dict.set_item("total_conversations", total_valid_convos).unwrap();
-
     let avg_in_convo_response_time = if response_count == 0 {
         0.0
     } else {
         total_responses as f64 / response_count as f64
     };
-    thread_agg_dict.set_item("avg_in_convo_response_time", avg_in_convo_response_time).unwrap();
 
     let avg_time_between_convos = if gaps_between.is_empty() {
         0.0
@@ -837,21 +938,13 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
         let sum_gap: u64 = gaps_between.iter().sum();
         sum_gap as f64 / gaps_between.len() as f64
     };
-    thread_agg_dict.set_item("avg_time_between_convos", avg_time_between_convos).unwrap();
 
-    let avg_leans_dict = pyo3::types::PyDict::new(py);
+    let mut avg_participation_leans: HashMap<u32, f64> = HashMap::new();
     if total_valid_convos > 0 {
         for (sender, sum_pct) in &global_leans {
-            avg_leans_dict.set_item(sender, sum_pct / total_valid_convos as f64).unwrap();
+            avg_participation_leans.insert(*sender, sum_pct / total_valid_convos as f64);
         }
     }
-    thread_agg_dict.set_item("avg_participation_leans", avg_leans_dict).unwrap();
-
-    let cpd_dict = pyo3::types::PyDict::new(py);
-    for (date_str, c) in &convos_per_day {
-        cpd_dict.set_item(date_str, *c).unwrap();
-    }
-    thread_agg_dict.set_item("convos_per_day", cpd_dict).unwrap();
 
     // Average message count per conversation session
     let avg_msg_count_per_convo = if total_valid_convos == 0 {
@@ -860,7 +953,6 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
         let total_msgs: usize = conversations.iter().map(|c| c.message_count).sum();
         total_msgs as f64 / total_valid_convos as f64
     };
-    thread_agg_dict.set_item("avg_msg_count_per_convo", avg_msg_count_per_convo).unwrap();
 
     // Average duration per conversation session (in milliseconds)
     let avg_duration_ms_per_convo = if total_valid_convos == 0 {
@@ -871,16 +963,252 @@ fn detect_conversations(py: Python, data: &Bound<'_, pyo3::types::PyList>) -> Py
             .sum();
         total_duration as f64 / total_valid_convos as f64
     };
-    thread_agg_dict.set_item("avg_duration_ms_per_convo", avg_duration_ms_per_convo).unwrap();
 
+    Some(DetectedConversations {
+        conversations,
+        avg_in_convo_response_time,
+        avg_time_between_convos,
+        avg_participation_leans,
+        convos_per_day,
+        avg_msg_count_per_convo,
+        avg_duration_ms_per_convo,
+    })
+}
+
+fn detected_conversations_to_py(py: Python, detected: &Option<DetectedConversations>, senders: &[String]) -> PyResult<PyObject> {
     let out = pyo3::types::PyDict::new(py);
-    let out_list = pyo3::types::PyList::new(py, py_convos).unwrap();
-    out.set_item("conversations", out_list).unwrap();
-    out.set_item("thread_aggregation", thread_agg_dict).unwrap();
+    let detected = match detected {
+        Some(d) => d,
+        None => {
+            out.set_item("conversations", pyo3::types::PyList::empty(py))?;
+            out.set_item("thread_aggregation", pyo3::types::PyDict::new(py))?;
+            return Ok(out.into());
+        }
+    };
+
+    let mut py_convos = Vec::with_capacity(detected.conversations.len());
+    for c in &detected.conversations {
+        let convo_dict = pyo3::types::PyDict::new(py);
+        convo_dict.set_item("id", c.id)?;
+        convo_dict.set_item("start_ms", c.start_ms)?;
+        convo_dict.set_item("end_ms", c.end_ms)?;
+        convo_dict.set_item("message_count", c.message_count)?;
+
+        let avg_resp = if c.responses.is_empty() {
+            0.0
+        } else {
+            c.responses.iter().sum::<u64>() as f64 / c.responses.len() as f64
+        };
+        convo_dict.set_item("average_response_time", avg_resp)?;
+
+        let leans_dict = pyo3::types::PyDict::new(py);
+        for (sender, count) in &c.leans {
+            leans_dict.set_item(&senders[*sender as usize], *count as f64 / c.message_count as f64)?;
+        }
+        convo_dict.set_item("leans", leans_dict)?;
+        py_convos.push(convo_dict);
+    }
+
+    let thread_agg_dict = pyo3::types::PyDict::new(py);
+    thread_agg_dict.set_item("total_conversations", detected.conversations.len())?;
+    thread_agg_dict.set_item("avg_in_convo_response_time", detected.avg_in_convo_response_time)?;
+    thread_agg_dict.set_item("avg_time_between_convos", detected.avg_time_between_convos)?;
+
+    let avg_leans_dict = pyo3::types::PyDict::new(py);
+    for (sender, share) in &detected.avg_participation_leans {
+        avg_leans_dict.set_item(&senders[*sender as usize], *share)?;
+    }
+    thread_agg_dict.set_item("avg_participation_leans", avg_leans_dict)?;
+
+    let cpd_dict = pyo3::types::PyDict::new(py);
+    for (date_str, c) in &detected.convos_per_day {
+        cpd_dict.set_item(date_str, *c)?;
+    }
+    thread_agg_dict.set_item("convos_per_day", cpd_dict)?;
+    thread_agg_dict.set_item("avg_msg_count_per_convo", detected.avg_msg_count_per_convo)?;
+    thread_agg_dict.set_item("avg_duration_ms_per_convo", detected.avg_duration_ms_per_convo)?;
+
+    let out_list = pyo3::types::PyList::new(py, py_convos)?;
+    out.set_item("conversations", out_list)?;
+    out.set_item("thread_aggregation", thread_agg_dict)?;
 
     Ok(out.into())
 }
 
+// Columnar entry points. Python builds typed arrays once per thread (see
+// message_columns.py): int64 timestamps, uint32 sender ids indexing a list of names
+// (MISSING_SENDER when a message has none) and message contents as one UTF-8 blob with
+// n + 1 uint64 offsets. The arrays are copied out of their buffers while holding the
+// GIL; the computation itself runs detached, so other Python threads keep running.
+
+const MISSING_SENDER: u32 = u32::MAX;
+
+fn buffer_to_vec<T: Element>(py: Python<'_>, obj: &Bound<'_, PyAny>) -> PyResult<Vec<T>> {
+    PyBuffer::<T>::get(obj)?.to_vec(py)
+}
+
+fn check_same_length(a: usize, b: usize, what: &str) -> PyResult<()> {
+    if a != b {
+        return Err(pyo3::exceptions::PyValueError::new_err(format!("{} must have the same length", what)));
+    }
+    Ok(())
+}
+
+fn valid_timestamps(raw: &[i64]) -> Vec<u64> {
+    raw.iter().map(|ts| (*ts).max(0) as u64).collect()
+}
+
+fn content_strs<'a>(offsets: &'a [u64], content: &'a [u8]) -> impl Iterator<Item = &'a str> + 'a {
+    offsets
+        .windows(2)
+        .filter_map(move |w| content.get(w[0] as usize..w[1] as usize))
+        .filter(|bytes| !bytes.is_empty())
+        .filter_map(|bytes| std::str::from_utf8(bytes).ok())
+}
+
+/// Messages that have both a timestamp and a sender, sorted by timestamp (stable, like
+/// extract_sender_messages).
+fn sorted_sender_rows(timestamps: &[i64], sender_ids: &[u32]) -> (Vec<u64>, Vec<u32>) {
+    let mut rows: Vec<(u64, u32)> = timestamps
+        .iter()
+        .zip(sender_ids.iter())
+        .filter(|(ts, sender)| **ts >= 0 && **sender != MISSING_SENDER)
+        .map(|(ts, sender)| (*ts as u64, *sender))
+        .collect();
+    rows.sort_by_key(|row| row.0);
+    rows.into_iter().unzip()
+}
+
+#[pyfunction]
+fn find_highest_density_period_columns(py: Python<'_>, timestamps: &Bound<'_, PyAny>, period: u8) -> PyResult<(u64, u64)> {
+    let timestamps = valid_timestamps(&buffer_to_vec::<i64>(py, timestamps)?);
+    Ok(py.detach(|| highest_density_window(&timestamps, (period as u64) * MS_PER_DAY)))
+}
+
+#[pyfunction]
+fn find_participant_density_period_columns(
+    py: Python<'_>,
+    timestamps: &Bound<'_, PyAny>,
+    sender_ids: &Bound<'_, PyAny>,
+    period: u8,
+    participant_id: u32,
+    find_max: bool,
+) -> PyResult<(u64, u64)> {
+    let timestamps = valid_timestamps(&buffer_to_vec::<i64>(py, timestamps)?);
+    let sender_ids = buffer_to_vec::<u32>(py, sender_ids)?;
+    check_same_length(timestamps.len(), sender_ids.len(), "timestamps and sender_ids")?;
+    Ok(py.detach(|| {
+        let matches: Vec<bool> = sender_ids.iter().map(|sender| *sender == participant_id).collect();
+        participant_count_window(&timestamps, &matches, (period as u64) * MS_PER_DAY, find_max)
+    }))
+}
+
+#[pyfunction]
+fn compute_top_words_columns(
+    py: Python<'_>,
+    content_offsets: &Bound<'_, PyAny>,
+    content: &Bound<'_, PyAny>,
+    top_n: usize,
+) -> PyResult<Vec<(String, usize)>> {
+    let offsets = buffer_to_vec::<u64>(py, content_offsets)?;
+    let content = buffer_to_vec::<u8>(py, content)?;
+    Ok(py.detach(|| top_words(content_strs(&offsets, &content), top_n)))
+}
+
+#[pyfunction]
+fn compute_top_emojis_columns(
+    py: Python<'_>,
+    content_offsets: &Bound<'_, PyAny>,
+    content: &Bound<'_, PyAny>,
+    top_n: usize,
+) -> PyResult<Vec<(String, usize)>> {
+    let offsets = buffer_to_vec::<u64>(py, content_offsets)?;
+    let content = buffer_to_vec::<u8>(py, content)?;
+    Ok(py.detach(|| top_emojis(content_strs(&offsets, &content), top_n)))
+}
+
+#[pyfunction]
+fn count_specific_string_columns(
+    py: Python<'_>,
+    content_offsets: &Bound<'_, PyAny>,
+    content: &Bound<'_, PyAny>,
+    target_string: String,
+) -> PyResult<usize> {
+    let offsets = buffer_to_vec::<u64>(py, content_offsets)?;
+    let content = buffer_to_vec::<u8>(py, content)?;
+    Ok(py.detach(|| count_occurrences(content_strs(&offsets, &content), &target_string)))
+}
+
+#[pyfunction]
+fn aggregate_daily_counts_columns(py: Python<'_>, timestamps: &Bound<'_, PyAny>) -> PyResult<HashMap<String, u64>> {
+    let timestamps = buffer_to_vec::<i64>(py, timestamps)?;
+    Ok(py.detach(|| {
+        daily_counts_from_timestamps(timestamps.iter().filter(|ts| **ts >= 0).map(|ts| *ts as u64))
+    }))
+}
+
+#[pyfunction]
+fn extract_conversation_gaps_columns(
+    py: Python<'_>,
+    timestamps: &Bound<'_, PyAny>,
+    sender_ids: &Bound<'_, PyAny>,
+) -> PyResult<(Vec<u64>, Vec<bool>, u64, u64)> {
+    let timestamps = buffer_to_vec::<i64>(py, timestamps)?;
+    let sender_ids = buffer_to_vec::<u32>(py, sender_ids)?;
+    check_same_length(timestamps.len(), sender_ids.len(), "timestamps and sender_ids")?;
+    Ok(py.detach(|| {
+        let (timestamps, sender_ids) = sorted_sender_rows(&timestamps, &sender_ids);
+        conversation_gaps(&timestamps, &sender_ids)
+    }))
+}
+
+#[pyfunction]
+#[pyo3(signature = (
+    timestamps,
+    sender_ids,
+    senders,
+    same_sender_multiplier = 1.5,
+    cross_sender_multiplier = 3.0,
+    same_sender_floor_ms = 60_000,
+    cross_sender_floor_ms = 120_000,
+    min_messages = 3
+))]
+fn detect_conversations_columns(
+    py: Python<'_>,
+    timestamps: &Bound<'_, PyAny>,
+    sender_ids: &Bound<'_, PyAny>,
+    senders: Vec<String>,
+    same_sender_multiplier: f64,
+    cross_sender_multiplier: f64,
+    same_sender_floor_ms: u64,
+    cross_sender_floor_ms: u64,
+    min_messages: usize,
+) -> PyResult<PyObject> {
+    /*
+    detect_conversations over message columns; `senders[i]` is the name behind sender id i.
+    Returns the same structure as detect_conversations.
+    */
+    let thresholds = ConvoThresholds {
+        same_sender_multiplier,
+        cross_sender_multiplier,
+        same_sender_floor_ms,
+        cross_sender_floor_ms,
+        min_messages,
+    };
+    let timestamps = buffer_to_vec::<i64>(py, timestamps)?;
+    let sender_ids = buffer_to_vec::<u32>(py, sender_ids)?;
+    check_same_length(timestamps.len(), sender_ids.len(), "timestamps and sender_ids")?;
+    if sender_ids.iter().any(|sender| *sender != MISSING_SENDER && *sender as usize >= senders.len()) {
+        return Err(pyo3::exceptions::PyValueError::new_err("sender id out of range for senders"));
+    }
+
+    let detected = py.detach(|| {
+        let (timestamps, sender_ids) = sorted_sender_rows(&timestamps, &sender_ids);
+        detect_conversation_sessions(&timestamps, &sender_ids, &thresholds)
+    });
+    detected_conversations_to_py(py, &detected, &senders)
+}
+
 #[pymodule]
 fn density_finder_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(find_highest_density_period, m)?)?;
@@ -893,5 +1221,15 @@ fn density_finder_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(build_group_chat_trends_series, m)?)?;
     m.add_function(wrap_pyfunction!(build_uploader_trends_series, m)?)?;
     m.add_function(wrap_pyfunction!(detect_conversations, m)?)?;
+    m.add_function(wrap_pyfunction!(extract_conversation_gaps, m)?)?;
+    m.add_function(wrap_pyfunction!(sweep_conversation_counts, m)?)?;
+    m.add_function(wrap_pyfunction!(find_highest_density_period_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(find_participant_density_period_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(compute_top_words_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(compute_top_emojis_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(count_specific_string_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(aggregate_daily_counts_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(extract_conversation_gaps_columns, m)?)?;
+    m.add_function(wrap_pyfunction!(detect_conversations_columns, m)?)?;
     Ok(())
 }
\ No newline at end of file
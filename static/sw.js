@@ -7,6 +7,11 @@ const UNCACHEABLE_API_PATHS = [
     '/api/auth-status',
 ];
 
+// API GET path prefixes that report live job state and must never be cached.
+const UNCACHEABLE_API_PREFIXES = [
+    '/api/jobs',
+];
+
 // App pages to pre-cache on install.
 // Game is excluded – it is dynamically generated by the server.
 const APP_PAGES = [
@@ -342,7 +347,8 @@ self.addEventListener('fetch', (event) => {
     if (
         request.method === 'GET' &&
         url.pathname.startsWith('/api/') &&
-        !UNCACHEABLE_API_PATHS.includes(url.pathname)
+        !UNCACHEABLE_API_PATHS.includes(url.pathname) &&
+        !UNCACHEABLE_API_PREFIXES.some((prefix) => url.pathname.startsWith(prefix))
     ) {
         event.respondWith(
             caches.open(API_CACHE)
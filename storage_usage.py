@@ -0,0 +1,204 @@
+import contextlib
+import os
+import sqlite3
+
+from cache_io import path_size, remove_path, set_storage_observer
+from cache_manifest import MANIFEST_NAME
+from message_store import is_message_file
+
+
+CATEGORY_MESSAGES = 'messages'        # message_*.json, raw or compressed
+CATEGORY_MEDIA = 'media'              # every other exported file in a thread folder
+CATEGORY_THREAD_CACHES = 'thread_caches'
+CATEGORY_USER_CACHES = 'user_caches'
+CATEGORY_METADATA = 'metadata'        # me.json, fingerprints, manifests
+
+# Derived caches, in the order quota enforcement evicts them; everything else is the
+# user's own upload and is never evicted.
+EVICTABLE_CATEGORIES = (CATEGORY_USER_CACHES, CATEGORY_THREAD_CACHES)
+
+
+def _is_cache_name(name):
+    return name.startswith('cached_') and name != MANIFEST_NAME
+
+
+def classify(parts):
+    """Category of a path inside a user folder, given as its list of path parts."""
+    if len(parts) >= 3 and parts[0] == 'inbox':
+        name = parts[2]
+        if len(parts) == 3 and _is_cache_name(name):
+            return CATEGORY_THREAD_CACHES
+        if len(parts) == 3 and is_message_file(name):
+            return CATEGORY_MESSAGES
+        if len(parts) == 3 and (name == MANIFEST_NAME or name.startswith('.')):
+            return CATEGORY_METADATA
+        return CATEGORY_MEDIA
+    if _is_cache_name(parts[0]):
+        return CATEGORY_USER_CACHES
+    return CATEGORY_METADATA
+
+
+class StorageLedger:
+    """
+    Bytes stored per user code and category, in one SQLite file shared by every
+    server process. Kept current by write/removal notifications (see
+    cache_io.set_storage_observer) rather than by scanning.
+    """
+    def __init__(self, path, upload_folder):
+        self.path = path
+        self.upload_root = os.path.realpath(upload_folder)
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS usage (
+                    user_code TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    PRIMARY KEY (user_code, category)
+                )
+            ''')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # Every cache write lands here; WAL without a sync per commit keeps that cheap.
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def locate(self, path):
+        """(user_code, category) for a path under the upload folder, else None."""
+        # Resolved so writes through a shared chat's symlink count against its owner.
+        real_path = os.path.realpath(path)
+        if not real_path.startswith(self.upload_root + os.sep):
+            return None
+        parts = os.path.relpath(real_path, self.upload_root).split(os.sep)
+        if len(parts) < 2 or parts[0].startswith('.'):
+            return None
+        return parts[0], classify(parts[1:])
+
+    def record(self, changes):
+        """Storage observer: apply [(path, delta_bytes), ...] to the users and categories the paths belong to."""
+        deltas = {}
+        for path, delta in changes:
+            located = self.locate(path)
+            if located is not None:
+                deltas[located] = deltas.get(located, 0) + delta
+        if deltas:
+            self.add(deltas)
+
+    def add(self, deltas):
+        """Apply {(user_code, category): delta_bytes} in one transaction."""
+        with self._connection() as conn:
+            conn.executemany('''
+                INSERT INTO usage (user_code, category, bytes) VALUES (?, ?, MAX(?, 0))
+                ON CONFLICT (user_code, category) DO UPDATE SET bytes = MAX(usage.bytes + ?, 0)
+            ''', [(user_code, category, delta, delta) for (user_code, category), delta in deltas.items()])
+
+    def set_user(self, user_code, usage):
+        """Replace a user's counts, e.g. after measure_user()."""
+        with self._connection() as conn:
+            conn.execute('DELETE FROM usage WHERE user_code = ?', (user_code,))
+            conn.executemany(
+                'INSERT INTO usage (user_code, category, bytes) VALUES (?, ?, ?)',
+                [(user_code, category, size) for category, size in usage.items()]
+            )
+
+    def drop_user(self, user_code):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM usage WHERE user_code = ?', (user_code,))
+
+    def usage(self, user_code):
+        with self._connection() as conn:
+            rows = conn.execute('SELECT category, bytes FROM usage WHERE user_code = ?', (user_code,)).fetchall()
+        return dict(rows)
+
+    def totals(self):
+        with self._connection() as conn:
+            rows = conn.execute('SELECT category, SUM(bytes) FROM usage GROUP BY category').fetchall()
+        return dict(rows)
+
+    def top_users(self, limit):
+        """[{'user_code', 'total', 'categories'}, ...] for the biggest users."""
+        with self._connection() as conn:
+            codes = [row[0] for row in conn.execute(
+                'SELECT user_code FROM usage GROUP BY user_code ORDER BY SUM(bytes) DESC LIMIT ?', (limit,)
+            )]
+        result = []
+        for code in codes:
+            categories = self.usage(code)
+            result.append({'user_code': code, 'total': sum(categories.values()), 'categories': categories})
+        return result
+
+    def users_over(self, quota_bytes, limit):
+        with self._connection() as conn:
+            return [row[0] for row in conn.execute(
+                'SELECT user_code FROM usage GROUP BY user_code HAVING SUM(bytes) > ? ORDER BY SUM(bytes) DESC LIMIT ?',
+                (quota_bytes, limit)
+            )]
+
+    def get_meta(self, key):
+        with self._connection() as conn:
+            row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+
+def observe_storage(path, upload_folder):
+    """
+    Open the ledger at `path` and report this process's cache writes and removals to
+    it. Also the initializer of worker pools, whose processes never import the app.
+    """
+    ledger = StorageLedger(path, upload_folder)
+    set_storage_observer(ledger.record)
+    return ledger
+
+
+def measure_user(user_path):
+    """Walk a user folder once and total it by category (shared chats' symlinks are not followed)."""
+    usage = {}
+    for root, _, files in os.walk(user_path):
+        relative_root = os.path.relpath(root, user_path)
+        root_parts = [] if relative_root == '.' else relative_root.split(os.sep)
+        for name in files:
+            try:
+                size = os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+            category = classify(root_parts + [name])
+            usage[category] = usage.get(category, 0) + size
+    return usage
+
+
+def evict_derived_caches(user_path, bytes_to_free):
+    """
+    Delete derived caches until `bytes_to_free` bytes are gone: user-level caches
+    first, then per-thread caches, largest first. They are rebuilt on demand.
+    Returns the bytes freed.
+    """
+    user_level = [
+        os.path.join(user_path, name) for name in os.listdir(user_path) if _is_cache_name(name)
+    ]
+    thread_level = []
+    inbox_path = os.path.join(user_path, 'inbox')
+    if os.path.isdir(inbox_path):
+        for thread_id in os.listdir(inbox_path):
+            thread_folder = os.path.join(inbox_path, thread_id)
+            if os.path.islink(thread_folder) or not os.path.isdir(thread_folder):
+                continue  # another code's thread; it counts against its owner
+            thread_level.extend(os.path.join(thread_folder, name) for name in os.listdir(thread_folder) if _is_cache_name(name))
+
+    freed = 0
+    for group in (user_level, thread_level):
+        for path in sorted(group, key=path_size, reverse=True):
+            if freed >= bytes_to_free:
+                return freed
+            freed += remove_path(path)
+    return freed
@@ -0,0 +1,68 @@
+import datetime
+import os
+
+from density_backend import aggregate_daily_counts, split_sent_received_daily_counts
+from cache_io import atomic_write_json, read_json
+from cache_manifest import ensure_fresh, record_build
+
+
+# Per-thread daily counts behind the user-level trend caches, so a rebuild after an
+# update only reloads messages for threads that changed.
+THREAD_SUMMARY_NAME = 'cached_thread_summary.json'
+
+
+def build_thread_summary(messages, uploader_username):
+    sent_daily_counts, received_daily_counts = ({}, {})
+    if uploader_username:
+        sent_daily_counts, received_daily_counts = split_sent_received_daily_counts(messages, uploader_username)
+
+    active_days = set()
+    people_by_day = {}
+    for message in messages:
+        ts_value = message.get('timestamp_ms')
+        try:
+            ts_ms = int(ts_value)
+        except (TypeError, ValueError):
+            continue
+
+        day_key = datetime.datetime.utcfromtimestamp(ts_ms / 1000).strftime('%Y-%m-%d')
+        active_days.add(day_key)
+
+        sender_name = message.get('sender_name')
+        if not isinstance(sender_name, str) or not sender_name:
+            continue
+        if uploader_username and sender_name == uploader_username:
+            continue
+        people_by_day.setdefault(day_key, set()).add(sender_name)
+
+    return {
+        'uploader_username': uploader_username,
+        'daily_counts': aggregate_daily_counts(messages),
+        'sent_daily_counts': {day_key: int(count) for day_key, count in sent_daily_counts.items()},
+        'received_daily_counts': {day_key: int(count) for day_key, count in received_daily_counts.items()},
+        'active_days': sorted(active_days),
+        'people_by_day': {day_key: sorted(people) for day_key, people in people_by_day.items()},
+    }
+
+
+def load_thread_summary(thread_folder, uploader_username, load_messages):
+    """
+    Return the cached daily summary for a thread, rebuilding it with
+    `load_messages()` when missing or computed for a different uploader.
+    """
+    summary_path = os.path.join(thread_folder, THREAD_SUMMARY_NAME)
+    if ensure_fresh(thread_folder, 'thread_summary'):
+        try:
+            summary = read_json(summary_path)
+            if summary.get('uploader_username') == uploader_username:
+                return summary
+        except (OSError, ValueError):
+            pass
+
+    summary = build_thread_summary(load_messages(), uploader_username)
+    try:
+        record_build(thread_folder, 'thread_summary')
+        atomic_write_json(summary_path, summary)
+    except Exception as e:
+        print(f"[THREAD_SUMMARY] Failed to write summary for {os.path.basename(thread_folder)}: {e}")
+    return summary
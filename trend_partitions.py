@@ -0,0 +1,157 @@
+import json
+import os
+import secrets
+import shutil
+import tempfile
+
+from cache_io import notify_storage_changes, file_sizes, read_json
+
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def month_key(date_key):
+    """Return the YYYY-MM bucket for a YYYY-MM-DD key, or None for malformed keys."""
+    if isinstance(date_key, str) and len(date_key) >= 7:
+        return date_key[:7]
+    return None
+
+
+def date_range(date_keys):
+    date_keys = list(date_keys)
+    return {
+        'min_date': min(date_keys) if date_keys else None,
+        'max_date': max(date_keys) if date_keys else None
+    }
+
+
+def partition_series(series):
+    """Split {name: {YYYY-MM-DD: count}} into {YYYY-MM: {name: {YYYY-MM-DD: count}}}."""
+    partitions = {}
+    for name, daily_counts in series.items():
+        for date_key, count in (daily_counts or {}).items():
+            bucket = month_key(date_key)
+            if bucket is None:
+                continue
+            month = partitions.setdefault(bucket, {series_name: {} for series_name in series})
+            month[name][date_key] = count
+    return partitions
+
+
+def merge_series(partitions, names):
+    merged = {name: {} for name in names}
+    for partition in partitions:
+        for name in names:
+            merged[name].update(partition.get(name) or {})
+    return merged
+
+
+def partition_threads(threads):
+    """Split [{'id', 'daily_counts'}, ...] into {YYYY-MM: [{'id', 'daily_counts'}, ...]}."""
+    partitions = {}
+    for thread in threads:
+        by_month = {}
+        for date_key, count in (thread.get('daily_counts') or {}).items():
+            bucket = month_key(date_key)
+            if bucket is not None:
+                by_month.setdefault(bucket, {})[date_key] = count
+        for bucket, daily_counts in by_month.items():
+            partitions.setdefault(bucket, []).append({'id': thread.get('id'), 'daily_counts': daily_counts})
+    return partitions
+
+
+def merge_threads(partitions, threads, include_empty=False):
+    """
+    Merge per-month thread partitions back into [{'id', 'title', 'daily_counts'}, ...]
+    in manifest order. Threads without data in the loaded months are dropped unless
+    `include_empty` is set.
+    """
+    counts_by_id = {}
+    for partition in partitions:
+        for entry in partition:
+            counts_by_id.setdefault(entry.get('id'), {}).update(entry.get('daily_counts') or {})
+
+    merged = []
+    for thread in threads:
+        daily_counts = counts_by_id.get(thread.get('id'), {})
+        if not daily_counts and not include_empty:
+            continue
+        merged.append({
+            'id': thread.get('id'),
+            'title': thread.get('title'),
+            'daily_counts': daily_counts
+        })
+    return merged
+
+
+def write_partitioned_cache(cache_dir, partitions, meta):
+    """
+    Write one JSON file per month plus a manifest listing the month keys and a new
+    build id.
+
+    The cache is assembled in a temp directory and swapped in with two renames (old
+    directory aside, new one into place), so for an instant there is no cache at all.
+    Readers go through read_partitions, which detects both that gap and a swap in the
+    middle of a read.
+    """
+    parent = os.path.dirname(cache_dir) or '.'
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(cache_dir)}.', dir=parent)
+    try:
+        month_keys = sorted(partitions)
+        for key in month_keys:
+            with open(os.path.join(tmp_dir, f'{key}.json'), 'w') as f:
+                json.dump(partitions[key], f)
+
+        manifest = dict(meta)
+        manifest['month_keys'] = month_keys
+        manifest['build_id'] = secrets.token_hex(8)
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+
+        changes = []
+        tomb_dir = None
+        if os.path.isdir(cache_dir):
+            # Leftover from an interrupted or invalidated build.
+            changes = [(path, -size) for path, size in file_sizes(cache_dir)]
+            tomb_dir = tempfile.mkdtemp(prefix=f'.{os.path.basename(cache_dir)}.old.', dir=parent)
+            os.rename(cache_dir, os.path.join(tomb_dir, 'cache'))
+        os.rename(tmp_dir, cache_dir)
+        notify_storage_changes(changes + file_sizes(cache_dir))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if tomb_dir is not None:
+        shutil.rmtree(tomb_dir, ignore_errors=True)
+
+
+def read_manifest(cache_dir):
+    try:
+        return read_json(os.path.join(cache_dir, MANIFEST_NAME))
+    except FileNotFoundError:
+        return None
+
+
+def manifest_mtime(cache_dir):
+    """mtime of the cache's manifest, or None while the cache is being swapped."""
+    try:
+        return os.path.getmtime(os.path.join(cache_dir, MANIFEST_NAME))
+    except FileNotFoundError:
+        return None
+
+
+def read_partitions(cache_dir, manifest, month_keys):
+    """
+    The requested month partitions of the build `manifest` describes, or None if the
+    cache was replaced while reading. The manifest is re-read afterwards, so a result
+    never mixes months from two builds.
+    """
+    partitions = []
+    try:
+        for key in month_keys:
+            partitions.append(read_json(os.path.join(cache_dir, f'{key}.json')))
+    except FileNotFoundError:
+        return None
+    current = read_manifest(cache_dir)
+    if current is None or current.get('build_id') != manifest.get('build_id'):
+        return None
+    return partitions